@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+"""
+Compare concurrent-request throughput of the WSGI and ASGI entry points.
+
+Both applications are driven in-process against a throwaway SQLite
+database seeded from data/. --concurrency clients each send requests back
+to back and read responses slowly (a fixed delay per 64 KB chunk), which
+is what ties up sync worker threads in production. The WSGI run models a
+threaded server with --threads workers; the ASGI run uses the same number
+of ASGI_THREADS. Latency is measured by the client, so it includes time
+spent waiting for a free worker.
+
+    python benchmarks/asgi_vs_wsgi.py --concurrency 64 --requests 600
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK_SIZE = 64 * 1024
+
+
+def setup_django(threads):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recap.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    settings.ASGI_THREADS = threads
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['*']
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    call_command('load_initial_data', data_dir=os.path.join(BASE_DIR, 'data'), verbosity=0)
+
+
+def seed_session(post_count):
+    """Create a user with posts to like, returning the request headers to use"""
+    from django.contrib.auth.models import User
+    from django.middleware.csrf import _get_new_csrf_token
+    from django.test import Client
+    from blog.models import Post
+
+    user = User.objects.create_user('bench', 'bench@example.com', 'bench-password')
+    post_ids = [
+        Post.objects.create(title=f'Benchmark post {i}', content='...', author=user).id
+        for i in range(post_count)
+    ]
+    client = Client()
+    client.force_login(user)
+    csrf_token = _get_new_csrf_token()
+    cookie = f"sessionid={client.cookies['sessionid'].value}; csrftoken={csrf_token}"
+    return {'cookie': cookie, 'x-csrftoken': csrf_token}, post_ids
+
+
+def request_mix(count, post_ids):
+    """The requests to replay: map loads, search keystrokes and like toggles"""
+    mix = [
+        ('GET', '/dashboard/api/geojson/', '', b''),
+        ('GET', '/dashboard/api/search/', 'q=win', b''),
+        ('GET', '/dashboard/api/search/', 'q=flood', b''),
+        ('POST', '/like_post/', '', None),
+    ]
+    requests = []
+    for i in range(count):
+        method, path, query, body = mix[i % len(mix)]
+        if body is None:
+            # Spread likes over many posts; toggling one post concurrently
+            # from the same user is a get_or_create race, not load
+            body = json.dumps({'post_id': post_ids[i % len(post_ids)]}).encode()
+        requests.append((method, path, query, body))
+    return requests
+
+
+def slow_client_delay(size, delay):
+    return math.ceil(size / CHUNK_SIZE) * delay
+
+
+def run_wsgi(requests, headers, concurrency, threads, delay):
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    workers = threading.Semaphore(threads)
+
+    def handle(request):
+        method, path, query, body = request
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http',
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.version': (1, 0),
+        }
+        for name, value in headers.items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+        start = time.perf_counter()
+        status = []
+        with workers:
+            result = application(environ, lambda s, h, exc_info=None: status.append(s))
+            try:
+                for chunk in result:
+                    # The worker thread writes to the slow client itself
+                    time.sleep(slow_client_delay(len(chunk), delay))
+            finally:
+                result.close()
+        return time.perf_counter() - start, status[0]
+
+    pending = iter(requests)
+    lock = threading.Lock()
+    results = []
+
+    def client():
+        while True:
+            with lock:
+                request = next(pending, None)
+            if request is None:
+                return
+            outcome = handle(request)
+            with lock:
+                results.append(outcome)
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return time.perf_counter() - start, results
+
+
+def run_asgi(requests, headers, concurrency, delay):
+    from recap.asgi import application
+
+    async def handle(request):
+        method, path, query, body = request
+        scope = {
+            'type': 'http',
+            'http_version': '1.1',
+            'method': method,
+            'path': path,
+            'root_path': '',
+            'query_string': query.encode(),
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                *((name.encode(), value.encode()) for name, value in headers.items()),
+            ],
+        }
+        messages = [{'type': 'http.request', 'body': body}]
+        status = []
+
+        async def receive():
+            return messages.pop() if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message.get('body'):
+                await asyncio.sleep(slow_client_delay(len(message['body']), delay))
+
+        start = time.perf_counter()
+        await application(scope, receive, send)
+        return time.perf_counter() - start, status[0]
+
+    async def main():
+        pending = iter(requests)
+        results = []
+
+        async def client():
+            for request in pending:
+                results.append(await handle(request))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return time.perf_counter() - start, results
+
+    return asyncio.run(main())
+
+
+def report(name, elapsed, results):
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if not str(status).startswith('2'))
+    print(
+        f"{name:5}  {len(results) / elapsed:8.1f} req/s  "
+        f"p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f} ms  "
+        f"errors {errors}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=64, help='simultaneous clients')
+    parser.add_argument('--threads', type=int, default=8, help='WSGI workers and ASGI_THREADS')
+    parser.add_argument('--client-delay', type=float, default=0.05, help='seconds per 64 KB read by a client')
+    args = parser.parse_args()
+
+    setup_django(args.threads)
+    headers, post_ids = seed_session(args.concurrency)
+    requests = request_mix(args.requests, post_ids)
+
+    print(f"{args.requests} requests, {args.concurrency} clients, {args.threads} threads, "
+          f"{args.client_delay * 1000:.0f} ms per 64 KB")
+    report('WSGI', *run_wsgi(requests, headers, args.concurrency, args.threads, args.client_delay))
+    report('ASGI', *run_asgi(requests, headers, args.concurrency, args.client_delay))
+
+
+if __name__ == '__main__':
+    main()
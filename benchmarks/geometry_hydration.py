@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Compare row hydration cost of jsonfield text geometries and WKB geometries.
+
+The municipality and incident geometries from data/ are copied --copies
+times into two throwaway tables, one with the old jsonfield.JSONField
+column and one with GeometryField, in a temporary SQLite database. Each
+table is then loaded with and without reading .geometry on every row; the
+best of --repeat runs is reported.
+
+    python benchmarks/geometry_hydration.py --copies 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recap.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    call_command('load_initial_data', data_dir=os.path.join(BASE_DIR, 'data'), verbosity=0)
+
+
+def benchmark_models():
+    """Two tables that differ only in how the geometry column is stored"""
+    from django.db import connection, models
+    from jsonfield import JSONField
+    from water_issues_dashboard.fields import GeometryField
+
+    class JsonGeometry(models.Model):
+        name = models.CharField(max_length=200)
+        geometry = JSONField()
+
+        class Meta:
+            app_label = 'water_issues_dashboard'
+            db_table = 'benchmark_json_geometry'
+
+    class WkbGeometry(models.Model):
+        name = models.CharField(max_length=200)
+        geometry = GeometryField()
+
+        class Meta:
+            app_label = 'water_issues_dashboard'
+            db_table = 'benchmark_wkb_geometry'
+
+    with connection.schema_editor() as editor:
+        editor.create_model(JsonGeometry)
+        editor.create_model(WkbGeometry)
+    return {'jsonfield': JsonGeometry, 'wkb': WkbGeometry}
+
+
+def seed(tables, copies):
+    from water_issues_dashboard.models import Municipality, Incident
+    sources = [(obj.name, obj.geometry) for obj in Municipality.objects.all()]
+    sources += [(obj.name, obj.geometry) for obj in Incident.objects.all()]
+    for model in tables.values():
+        model.objects.bulk_create(
+            [model(name=name, geometry=geometry) for name, geometry in sources * copies],
+            batch_size=500,
+        )
+    return len(sources) * copies
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--copies', type=int, default=20, help='copies of the seed geometries per table')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    tables = benchmark_models()
+    rows = seed(tables, args.copies)
+
+    print(f"{rows} rows per table, best of {args.repeat}")
+    for name, model in tables.items():
+        rows_only = best_time(lambda: list(model.objects.all()), args.repeat)
+        with_geometry = best_time(
+            lambda: [obj.geometry for obj in model.objects.all()], args.repeat
+        )
+        print(f"{name:9}  rows only {rows_only * 1000:8.1f} ms  "
+              f"with .geometry {with_geometry * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+"""
+Benchmark the dashboard and blog hot paths on synthetic data.
+
+Each --scales entry runs in its own process against a fresh SQLite
+database seeded with a synthetic dataset of that size:
+
+  scale    incidents  polygon vertices  users  posts   comments  likes
+  small        1,000        64            20    2,000     6,000   10,000
+  medium      10,000       256            50    5,000    15,000   25,000
+  large      100,000     1,024           100   10,000    30,000   50,000
+
+Municipalities and parks are polygons with the given number of vertices,
+and one in ten incidents is a polygon with a quarter as many. Half of the
+posts are written by one prolific user, and a tenth are about a single
+"hot" incident, whose discussion page is one of the scenarios.
+
+Every scenario runs once to warm up, then up to --repeat times (stopping
+after --time-limit seconds, but with at least three runs) to time it and
+count its queries, then once more under tracemalloc for its peak memory.
+Caches are replaced by dummy caches so the work behind them is measured,
+unless --cached is given.
+
+Results are written as JSON to --output, and --compare reports the change
+in median latency and query count against an earlier results file,
+exiting with status 1 if any scenario got slower than --threshold.
+
+    python benchmarks/hot_paths.py --scales small medium --output before.json
+    python benchmarks/hot_paths.py --scales small medium --compare before.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = {
+    'small': dict(incidents=1000, vertices=64, users=20, posts=2000, comments=6000, likes=10000),
+    'medium': dict(incidents=10000, vertices=256, users=50, posts=5000, comments=15000, likes=25000),
+    'large': dict(incidents=100000, vertices=1024, users=100, posts=10000, comments=30000, likes=50000),
+}
+
+# Municipalities and parks per 1,000 incidents, with a floor for small scales
+MUNICIPALITIES_PER_1000 = 10
+PARKS_PER_1000 = 5
+
+PLACE_WORDS = ['Red River', 'Assiniboine', 'Lake Winnipeg', 'Souris', 'Pembina', 'Whiteshell', 'Dauphin', 'Swan']
+SEARCH_QUERY = 'river'
+UPLOAD_FEATURES = 100
+
+
+def setup_django(cached):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recap.settings')
+    from django.conf import settings
+    work_dir = tempfile.mkdtemp()
+    settings.DATABASES['default']['NAME'] = os.path.join(work_dir, 'bench.sqlite3')
+    settings.METRICS_DIR = os.path.join(work_dir, 'metrics')
+    settings.ALLOWED_HOSTS = ['testserver']
+    if cached:
+        settings.CACHES['shared']['LOCATION'] = os.path.join(work_dir, 'cache')
+    else:
+        settings.CACHES = {
+            alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'} for alias in settings.CACHES
+        }
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def polygon(rng, vertices, radius):
+    lon, lat = rng.uniform(-101.5, -95.2), rng.uniform(49.0, 54.0)
+    ring = [
+        [round(lon + radius * math.cos(2 * math.pi * i / vertices), 6),
+         round(lat + radius * math.sin(2 * math.pi * i / vertices), 6)]
+        for i in range(vertices)
+    ]
+    return {'type': 'Polygon', 'coordinates': [ring + ring[:1]]}
+
+
+def point(rng):
+    return {'type': 'Point', 'coordinates': [round(rng.uniform(-101.5, -95.2), 6), round(rng.uniform(49.0, 54.0), 6)]}
+
+
+def seed(size, rng):
+    """Fill the database with a synthetic dataset, returning what it holds"""
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from django.utils import timezone
+    from blog.models import Comment, IncidentActivity, Like, Post
+    from users.models import Profile
+    from water_issues_dashboard.models import Incident, Municipality, Park
+
+    vertices = size['vertices']
+    municipalities = max(50, size['incidents'] * MUNICIPALITIES_PER_1000 // 1000)
+    parks = max(25, size['incidents'] * PARKS_PER_1000 // 1000)
+    incident_types = [value for value, _ in Incident.INCIDENT_TYPES]
+    now = timezone.now()
+
+    with transaction.atomic():
+        Municipality.objects.bulk_create([
+            Municipality(
+                name=f'{rng.choice(PLACE_WORDS)} {i}', status=rng.choice(['city', 'town', 'rm']),
+                population_2021=rng.randint(100, 750000), geometry=polygon(rng, vertices, 0.2),
+            )
+            for i in range(municipalities)
+        ])
+        Park.objects.bulk_create([
+            Park(name=f'{rng.choice(PLACE_WORDS)} Park {i}', geometry=polygon(rng, vertices, 0.1))
+            for i in range(parks)
+        ])
+        Incident.objects.bulk_create([
+            Incident(
+                name=f'{rng.choice(PLACE_WORDS)} incident {i}', incident_type=rng.choice(incident_types),
+                status=rng.choice(['confirmed', 'suspected']),
+                geometry=polygon(rng, max(4, vertices // 4), 0.05) if i % 10 == 0 else point(rng),
+            )
+            for i in range(size['incidents'])
+        ])
+
+        # Signals don't run for bulk_create, so profiles are made here too
+        password = make_password('bench-password')
+        User.objects.bulk_create([User(username=f'user{i}', password=password) for i in range(size['users'])])
+        users = list(User.objects.order_by('id').values_list('id', flat=True))
+        Profile.objects.bulk_create([Profile(user_id=user_id) for user_id in users])
+
+        incidents = list(Incident.objects.values_list('id', flat=True))
+        hot_incident = incidents[0]
+        posts = []
+        for i in range(size['posts']):
+            if i % 10 == 0:
+                incident = hot_incident
+            elif i % 10 < 4:
+                incident = rng.choice(incidents)
+            else:
+                incident = None
+            posts.append(Post(
+                title=f'Post {i}', content='Water levels are rising. ' * 8,
+                author_id=users[0] if i % 2 == 0 else rng.choice(users),
+                incident_id=incident, date_posted=now - timedelta(minutes=i),
+            ))
+        Post.objects.bulk_create(posts)
+        post_ids = list(Post.objects.values_list('id', flat=True))
+
+        Comment.objects.bulk_create([
+            Comment(post_id=rng.choice(post_ids), author_id=rng.choice(users), content='Seen it too.')
+            for _ in range(size['comments'])
+        ])
+        likes = set()
+        while len(likes) < min(size['likes'], len(users) * len(post_ids)):
+            likes.add((rng.choice(users), rng.choice(post_ids)))
+        Like.objects.bulk_create([Like(user_id=user_id, post_id=post_id) for user_id, post_id in likes])
+        # Nor do they count the incidents' activity
+        IncidentActivity.objects.rebuild()
+
+    return {
+        'municipalities': municipalities, 'parks': parks, 'incidents': size['incidents'],
+        'polygon_vertices': vertices, 'users': size['users'], 'posts': size['posts'],
+        'comments': size['comments'], 'likes': len(likes),
+    }, users[0], hot_incident
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries run"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def scenarios(user_id, hot_incident, work_dir):
+    """Scenario name -> callable making one request, returning the response size"""
+    from types import SimpleNamespace
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.urls import reverse
+    from water_issues_dashboard.views import process_geojson_file
+
+    client = Client()
+    client.force_login(User.objects.get(id=user_id))
+
+    def get(url, params=None):
+        def request():
+            response = client.get(url, params or {})
+            assert response.status_code == 200, f'{url} returned {response.status_code}'
+            return len(response.content)
+        return request
+
+    uploads = iter(range(10 ** 9))
+
+    def upload():
+        batch = next(uploads)
+        path = os.path.join(work_dir, f'upload-{batch}.geojson')
+        with open(path, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': [
+                {
+                    'type': 'Feature',
+                    'geometry': {'type': 'Point', 'coordinates': [-97.1 + i / 1000, 49.9]},
+                    # Every other feature repeats the previous upload, to exercise the duplicate check
+                    'properties': {'name': f'Upload {batch - i % 2} feature {i}', 'type': 'flood'},
+                }
+                for i in range(UPLOAD_FEATURES)
+            ]}, f)
+        return process_geojson_file(SimpleNamespace(file=SimpleNamespace(path=path), uploaded_by=None))['added']
+
+    return {
+        'api_geojson_data': get(reverse('water_issues_dashboard:api_geojson'), {'type': 'all'}),
+        'api_geojson_data_topojson': get(
+            reverse('water_issues_dashboard:api_geojson'), {'type': 'all', 'format': 'topojson'}
+        ),
+        'dashboard_home': get(reverse('water_issues_dashboard:home')),
+        'api_search': get(reverse('water_issues_dashboard:api_search'), {'q': SEARCH_QUERY}),
+        'blog_home': get(reverse('blog-home')),
+        'incident_discussion': get(reverse('incident-discussion', args=[hot_incident])),
+        'process_geojson_file': upload,
+    }
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(len(values) * percent / 100) - 1)]
+
+
+def measure(run, repeat, time_limit):
+    from django.db import connection
+
+    run()
+    timings = []
+    counter = QueryCounter()
+    deadline = time.perf_counter() + time_limit
+    with connection.execute_wrapper(counter):
+        while len(timings) < repeat and (len(timings) < 3 or time.perf_counter() < deadline):
+            start = time.perf_counter()
+            size = run()
+            timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'runs': len(timings),
+        'latency_ms': {
+            'min': min(timings),
+            'p50': percentile(timings, 50),
+            'p95': percentile(timings, 95),
+            'max': max(timings),
+        },
+        'queries': counter.count / len(timings),
+        'peak_memory_kb': peak / 1024,
+        'result_size': size,
+    }
+
+
+def run_scale(scale, args):
+    setup_django(args.cached)
+    import django
+    from django.db import connection
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    dataset, user_id, hot_incident = seed(SCALES[scale], rng)
+    seed_seconds = time.perf_counter() - start
+
+    results = {}
+    for name, run in scenarios(user_id, hot_incident, tempfile.mkdtemp()).items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = measure(run, args.repeat, args.time_limit)
+        print(f'{scale:6} {name:26} {results[name]["latency_ms"]["p50"]:10.1f} ms', file=sys.stderr)
+
+    return {
+        'dataset': dataset,
+        'seed_seconds': seed_seconds,
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': connection.Database.sqlite_version,
+        },
+        'scenarios': results,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline, returning whether anything regressed"""
+    regressed = False
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'}:")
+    for scale, scale_results in results['scales'].items():
+        for name, current in scale_results['scenarios'].items():
+            before = baseline.get('scales', {}).get(scale, {}).get('scenarios', {}).get(name)
+            if before is None:
+                continue
+            change = current['latency_ms']['p50'] / before['latency_ms']['p50'] - 1
+            slower = change > threshold
+            regressed |= slower
+            print(
+                f"{scale:6} {name:26} p50 {change:+7.1%}  "
+                f"queries {before['queries']:g} -> {current['queries']:g}" + ('  REGRESSION' if slower else '')
+            )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', nargs='+', choices=SCALES, default=['small'])
+    parser.add_argument('--repeat', type=int, default=10, help='timed runs per scenario')
+    parser.add_argument('--time-limit', type=float, default=10, help='seconds of timed runs per scenario')
+    parser.add_argument('--only', nargs='+', help='run only these scenarios')
+    parser.add_argument('--cached', action='store_true', help='measure with the configured caches')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the synthetic data')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown reported as a regression')
+    parser.add_argument('--scale', choices=SCALES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scale:
+        print(json.dumps(run_scale(args.scale, args)))
+        return
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'machine': {'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'options': {'repeat': args.repeat, 'time_limit': args.time_limit, 'cached': args.cached, 'seed': args.seed},
+        'scales': {},
+    }
+    for scale in args.scales:
+        command = [
+            sys.executable, __file__, '--scale', scale, '--repeat', str(args.repeat),
+            '--time-limit', str(args.time_limit), '--seed', str(args.seed),
+        ]
+        if args.cached:
+            command.append('--cached')
+        if args.only:
+            command += ['--only', *args.only]
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        results['scales'][scale] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"\n{'scale':6} {'scenario':26} {'p50 ms':>10} {'p95 ms':>10} {'queries':>8} {'peak KiB':>10}")
+    for scale, scale_results in results['scales'].items():
+        for name, result in scale_results['scenarios'].items():
+            print(
+                f"{scale:6} {name:26} {result['latency_ms']['p50']:10.1f} {result['latency_ms']['p95']:10.1f} "
+                f"{result['queries']:8g} {result['peak_memory_kb']:10.0f}"
+            )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
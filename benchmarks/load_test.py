@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+"""
+Replay a realistic traffic mix against a running server and report each endpoint's latency.
+
+--users virtual users log in as the accounts in data/users.json (load them
+with "python manage.py upload_users_posts_and_comments") and repeat
+sessions picked at random in proportion to WEIGHTS, with an exponentially
+distributed think time between them:
+
+  dashboard  load the dashboard page and its api_geojson data
+  search     type a search term, one api_search request per keystroke
+  feed       read the blog feed and open a few of its posts
+  like       toggle the like on a post from the feed
+  comment    comment on a post from the feed
+  upload     upload a small GeoJSON file of incidents
+
+Comments and uploads are written to the server's database, so point it at
+a development copy. The driver only needs the standard library, and works
+against runserver, gunicorn or an ASGI server alike:
+
+    python benchmarks/load_test.py http://127.0.0.1:8000 --users 16 --duration 60
+
+Requests that fail, return a 5xx or report a failed upload count as
+errors; with SQLite these are usually "database is locked".
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WEIGHTS = {
+    'dashboard': 2,
+    'search': 3,
+    'feed': 3,
+    'like': 2,
+    'comment': 0.5,
+    'upload': 0.2,
+}
+SEARCH_TERMS = ['winnipeg', 'brandon', 'red river', 'flood', 'algal bloom', 'selkirk', 'lake']
+# Searches start once this many characters have been typed
+MIN_SEARCH_LENGTH = 2
+POSTS_OPENED = 3
+UPLOAD_FEATURES = 5
+
+
+class Stats:
+    """Latencies and errors of every request, by endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint, latency, error=None):
+        with self.lock:
+            self.latencies[endpoint].append(latency)
+            if error:
+                self.errors[endpoint][error] += 1
+
+    def summary(self, elapsed):
+        results = {}
+        for endpoint in sorted(self.latencies):
+            latencies = sorted(self.latencies[endpoint])
+            results[endpoint] = {
+                'requests': len(latencies),
+                'per_sec': len(latencies) / elapsed,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p90_ms': percentile(latencies, 90) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'max_ms': latencies[-1] * 1000,
+                'errors': dict(self.errors[endpoint]),
+            }
+        return results
+
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of a sorted list"""
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class VirtualUser:
+    """One logged-in browser session, with its own cookies"""
+
+    def __init__(self, base_url, account, stats):
+        self.base_url = base_url.rstrip('/')
+        self.account = account
+        self.stats = stats
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        self.post_ids = []
+        self.uploads = 0
+
+    @property
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, endpoint, path, data=None, headers=None, check=None):
+        """Send a request, recording its latency; returns the body, or None on an error
+
+        check(body) may return an error for a response that succeeded over HTTP.
+        """
+        request = urllib.request.Request(self.base_url + path, data=data, headers={
+            'Referer': self.base_url + '/',
+            **({'X-CSRFToken': self.csrf_token} if data is not None else {}),
+            **(headers or {}),
+        })
+        start = time.perf_counter()
+        error = None
+        body = None
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                body = response.read()
+                final_url = response.geturl()
+        except urllib.error.HTTPError as e:
+            error = f'HTTP {e.code}'
+        except (urllib.error.URLError, OSError) as e:
+            error = type(getattr(e, 'reason', e)).__name__
+        latency = time.perf_counter() - start
+
+        if body is not None and '/accounts/login/' in final_url and endpoint != 'login':
+            error, body = 'logged out', None
+        if body is not None and check:
+            error = check(body)
+        self.stats.record(endpoint, latency, error)
+        return body
+
+    def post_form(self, endpoint, path, fields):
+        data = urllib.parse.urlencode({'csrfmiddlewaretoken': self.csrf_token, **fields}).encode()
+        return self.request(endpoint, path, data, {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def log_in(self):
+        self.request('login', '/accounts/login/')
+        self.post_form('login', '/accounts/login/', {
+            'username': self.account['username'],
+            'password': self.account['password'],
+        })
+        return any(cookie.name == 'sessionid' for cookie in self.cookies)
+
+    def dashboard(self):
+        self.request('dashboard', '/dashboard/')
+        self.request('api_geojson', '/dashboard/api/geojson/')
+
+    def search(self):
+        term = random.choice(SEARCH_TERMS)
+        for length in range(MIN_SEARCH_LENGTH, len(term) + 1):
+            self.request('api_search', '/dashboard/api/search/?' + urllib.parse.urlencode({'q': term[:length]}))
+            # Keystrokes a fraction of a second apart
+            time.sleep(random.uniform(0.05, 0.2))
+
+    def feed(self):
+        body = self.request('blog_home', '/blog/')
+        if body is not None:
+            self.post_ids = [int(i) for i in re.findall(rb'data-post-id="(\d+)"', body)]
+        for post_id in random.sample(self.post_ids, min(POSTS_OPENED, len(self.post_ids))):
+            self.request('blog_post', f'/post/{post_id}/')
+
+    def like(self):
+        if not self.post_ids:
+            return self.feed()
+        data = json.dumps({'post_id': random.choice(self.post_ids)}).encode()
+        self.request('like_post', '/like_post/', data, {'Content-Type': 'application/json'})
+
+    def comment(self):
+        if not self.post_ids:
+            return self.feed()
+        post_id = random.choice(self.post_ids)
+        # Followed by the redirect back to the post
+        self.post_form('comment', f'/post/{post_id}/', {'content': f'Load test comment {uuid.uuid4().hex[:8]}'})
+
+    def upload(self):
+        self.uploads += 1
+        name = f"Load test {self.account['username']} {self.uploads} {uuid.uuid4().hex[:8]}"
+        content = json.dumps({'type': 'FeatureCollection', 'features': [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [-97.1 + random.random(), 49.9 + random.random()]},
+                'properties': {'name': f'{name} {i}', 'type': 'flood'},
+            }
+            for i in range(UPLOAD_FEATURES)
+        ]}).encode()
+        boundary = uuid.uuid4().hex
+        data = b''.join([
+            f'--{boundary}\r\nContent-Disposition: form-data; name="csrfmiddlewaretoken"\r\n\r\n'.encode(),
+            self.csrf_token.encode(),
+            f'\r\n--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="load-test.geojson"\r\n'
+            'Content-Type: application/geo+json\r\n\r\n'.encode(),
+            content,
+            f'\r\n--{boundary}--\r\n'.encode(),
+        ])
+        # The view reports errors, such as a locked database, in a 200 response
+        self.request('upload', '/dashboard/upload/', data, {
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+        }, check=upload_failure)
+
+    def run(self, stop, think_time):
+        scenarios = list(WEIGHTS)
+        weights = [WEIGHTS[name] for name in scenarios]
+        while not stop.is_set():
+            getattr(self, random.choices(scenarios, weights)[0])()
+            stop.wait(random.expovariate(1 / think_time) if think_time else 0)
+
+
+def upload_failure(body):
+    """The error to count for an upload response, if it did not succeed"""
+    try:
+        result = json.loads(body)
+    except ValueError:
+        # An error page or the login form, not the view's answer
+        return 'not json'
+    return None if isinstance(result, dict) and result.get('success') else 'failed'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('url', help='base URL of the server, such as http://127.0.0.1:8000')
+    parser.add_argument('--users', type=int, default=8, help='simultaneous virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run for')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean seconds between sessions')
+    parser.add_argument('--accounts', default=os.path.join(BASE_DIR, 'data', 'users.json'))
+    parser.add_argument('--seed', type=int, help='random seed, to replay the same mix')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with open(args.accounts) as f:
+        accounts = json.load(f)
+
+    stats = Stats()
+    users = [VirtualUser(args.url, accounts[i % len(accounts)], stats) for i in range(args.users)]
+    if not all(user.log_in() for user in users):
+        parser.exit(1, 'Logging in failed; are the accounts in --accounts loaded into the server\'s database?\n')
+    # Report only the replayed traffic
+    stats = Stats()
+    for user in users:
+        user.stats = stats
+
+    print(f"{args.users} users against {args.url} for {args.duration:.0f}s, {args.think_time}s think time")
+    stop = threading.Event()
+    threads = [threading.Thread(target=user.run, args=(stop, args.think_time)) for user in users]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results = stats.summary(elapsed)
+    print(f"{'endpoint':14} {'requests':>8} {'req/s':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}  errors")
+    for endpoint, result in results.items():
+        errors = ', '.join(f'{count} {error}' for error, count in sorted(result['errors'].items()))
+        print(
+            f"{endpoint:14} {result['requests']:8} {result['per_sec']:7.1f} {result['p50_ms']:8.1f} "
+            f"{result['p90_ms']:8.1f} {result['p99_ms']:8.1f} {result['max_ms']:8.1f}  {errors}"
+        )
+    total = sum(result['requests'] for result in results.values())
+    print(f"total {total} requests, {total / elapsed:.1f} req/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'users': args.users, 'duration': elapsed, 'endpoints': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Measure how long authenticated requests spend loading their session.
+
+A logged in client requests the dashboard and the blog feed in turn
+while the sessions table holds --sessions other sessions, as a site with
+many users logged in does. The time each request spends in
+SessionStore.load is recorded along with the whole request. Each mode
+runs in its own process against a fresh database seeded from data/:
+
+  db         Django's default database backed sessions, one query per
+             request
+  cached     the SESSION_ENGINE and SESSION_CACHE_ALIAS from settings
+
+    python benchmarks/session_load.py --sessions 50000 --requests 500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from importlib import import_module
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ['db', 'cached']
+PAGES = {'dashboard': '/dashboard/', 'feed': '/blog/'}
+
+
+def setup_django(mode):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recap.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    # Sessions left in the cache by an earlier run would hide misses
+    settings.CACHES['sessions']['LOCATION'] = tempfile.mkdtemp()
+    settings.ALLOWED_HOSTS = ['*']
+    if mode == 'db':
+        settings.SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    call_command('load_initial_data', data_dir=os.path.join(BASE_DIR, 'data'), verbosity=0)
+
+
+def seed_sessions(count):
+    """Fill the sessions table with count sessions of other users"""
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.contrib.sessions.models import Session
+    from django.utils import timezone
+
+    expire_date = timezone.now() + timedelta(days=14)
+    store = SessionStore()
+    data = store.encode({'_auth_user_id': '1', '_auth_user_backend': 'django.contrib.auth.backends.ModelBackend'})
+    for start in range(0, count, 1000):
+        Session.objects.bulk_create([
+            Session(session_key=store._get_new_session_key(), session_data=data, expire_date=expire_date)
+            for _ in range(min(1000, count - start))
+        ])
+
+
+def time_session_loads(load_times):
+    """Record how long each SessionStore.load of the configured engine takes"""
+    from django.conf import settings
+
+    store_class = import_module(settings.SESSION_ENGINE).SessionStore
+    load = store_class.load
+
+    def timed_load(self):
+        start = time.perf_counter()
+        try:
+            return load(self)
+        finally:
+            load_times.append(time.perf_counter() - start)
+
+    store_class.load = timed_load
+
+
+def run(mode, sessions, requests):
+    setup_django(mode)
+    from django.contrib.auth.models import User
+    from django.test import Client
+
+    seed_sessions(sessions)
+    user = User.objects.create_user('bench-reader', 'reader@example.com', 'bench-password')
+    client = Client()
+    client.force_login(user)
+
+    load_times = []
+    time_session_loads(load_times)
+    result = {'mode': mode}
+    for name, url in PAGES.items():
+        # Warm up the caches, including the session's
+        for _ in range(5):
+            client.get(url)
+        del load_times[:]
+        request_times = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.get(url)
+            request_times.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+        result[name] = {
+            'session_load_us': statistics.median(load_times) * 1e6,
+            'request_ms': statistics.median(request_times) * 1e3,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sessions', type=int, default=50000, help='other sessions in the table')
+    parser.add_argument('--requests', type=int, default=500, help='requests per page')
+    parser.add_argument('--mode', choices=MODES, help='run a single mode in this process')
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args.sessions, args.requests)))
+        return
+
+    print(f"{args.sessions} sessions, {args.requests} requests per page, medians")
+    results = {}
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--sessions', str(args.sessions),
+             '--requests', str(args.requests)],
+            check=True, stdout=subprocess.PIPE, universal_newlines=True,
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+        for page in PAGES:
+            print(
+                f"{mode:7} {page:10} session load {results[mode][page]['session_load_us']:8.1f} us  "
+                f"request {results[mode][page]['request_ms']:7.2f} ms"
+            )
+    for page in PAGES:
+        before, after = results['db'][page], results['cached'][page]
+        print(
+            f"{page:10} session load {after['session_load_us'] - before['session_load_us']:+8.1f} us "
+            f"({before['session_load_us'] / after['session_load_us']:.0f}x faster)  "
+            f"request {after['request_ms'] - before['request_ms']:+7.2f} ms"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+Measure SQLite read/write throughput and lock errors under concurrency.
+
+--readers threads repeat a request's worth of dashboard reads while one
+writer thread keeps importing GeoJSON uploads through the same code path
+as the upload view and another toggles likes. After each "request" the
+threads release their connection the way Django does at the end of a
+request, so CONN_MAX_AGE decides whether they reconnect. Each mode runs in
+its own process against a fresh database seeded from data/:
+
+  default  Django's sqlite3 backend with a rollback journal, no PRAGMAs
+           and CONN_MAX_AGE 0
+  tuned    the ENGINE, SQLITE_PRAGMAS and CONN_MAX_AGE from settings
+
+    python benchmarks/sqlite_concurrency.py --readers 8 --duration 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ['default', 'tuned']
+
+
+def setup_django(mode):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recap.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    if mode == 'default':
+        settings.DATABASES['default']['ENGINE'] = 'django.db.backends.sqlite3'
+        settings.DATABASES['default']['CONN_MAX_AGE'] = 0
+        settings.SQLITE_PRAGMAS = {}
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    call_command('load_initial_data', data_dir=os.path.join(BASE_DIR, 'data'), verbosity=0)
+
+
+def is_lock_error(error):
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+def reader(stop, stats):
+    from django.db import close_old_connections, OperationalError
+    from water_issues_dashboard.models import Incident, Municipality
+    from water_issues_dashboard.views import search_results
+
+    while not stop.is_set():
+        try:
+            search_results('a')
+            list(Incident.objects.order_by('-created_at')[:50])
+            Municipality.objects.filter(population_2021__gte=1000).count()
+            stats['reads'] += 1
+        except OperationalError as error:
+            stats['lock_errors' if is_lock_error(error) else 'errors'] += 1
+        finally:
+            close_old_connections()
+
+
+def uploader(stop, stats, user, batch_size):
+    from django.db import close_old_connections, OperationalError
+    from water_issues_dashboard.views import process_geojson_file
+
+    upload_dir = tempfile.mkdtemp()
+    batch = 0
+    while not stop.is_set():
+        batch += 1
+        path = os.path.join(upload_dir, f'upload-{batch}.geojson')
+        with open(path, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': [
+                {
+                    'type': 'Feature',
+                    'geometry': {'type': 'Point', 'coordinates': [-97.1 + i / 1000, 49.9]},
+                    'properties': {'name': f'Benchmark incident {batch}-{i}', 'type': 'flood'},
+                }
+                for i in range(batch_size)
+            ]}, f)
+        upload = SimpleNamespace(file=SimpleNamespace(path=path), uploaded_by=user)
+        try:
+            stats['rows_written'] += process_geojson_file(upload)['added']
+        except OperationalError as error:
+            stats['lock_errors' if is_lock_error(error) else 'errors'] += 1
+        finally:
+            close_old_connections()
+
+
+def liker(stop, stats, user, post_ids):
+    from django.db import close_old_connections, OperationalError
+    from blog.views import toggle_like
+
+    index = 0
+    while not stop.is_set():
+        index += 1
+        try:
+            toggle_like(user, post_ids[index % len(post_ids)])
+            stats['likes'] += 1
+        except OperationalError as error:
+            stats['lock_errors' if is_lock_error(error) else 'errors'] += 1
+        finally:
+            close_old_connections()
+
+
+def run(mode, readers, duration, batch_size):
+    setup_django(mode)
+    from django.contrib.auth.models import User
+    from blog.models import Post
+
+    user = User.objects.create_user('bench-writer', 'writer@example.com', 'bench-password')
+    post_ids = [Post.objects.create(title=f'Post {i}', content='...', author=user).id for i in range(20)]
+
+    stop = threading.Event()
+    read_stats = [dict(reads=0, lock_errors=0, errors=0) for _ in range(readers)]
+    write_stats = dict(rows_written=0, likes=0, lock_errors=0, errors=0)
+    threads = [threading.Thread(target=reader, args=(stop, stats)) for stats in read_stats]
+    threads.append(threading.Thread(target=uploader, args=(stop, write_stats, user, batch_size)))
+    threads.append(threading.Thread(target=liker, args=(stop, write_stats, user, post_ids)))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'mode': mode,
+        'reads_per_sec': sum(s['reads'] for s in read_stats) / duration,
+        'rows_written_per_sec': write_stats['rows_written'] / duration,
+        'likes_per_sec': write_stats['likes'] / duration,
+        'read_lock_errors': sum(s['lock_errors'] for s in read_stats),
+        'write_lock_errors': write_stats['lock_errors'],
+        'other_errors': write_stats['errors'] + sum(s['errors'] for s in read_stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='seconds per mode')
+    parser.add_argument('--batch-size', type=int, default=20, help='incidents per upload')
+    parser.add_argument('--mode', choices=MODES, help='run a single mode in this process')
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args.readers, args.duration, args.batch_size)))
+        return
+
+    print(f"{args.readers} readers, 1 uploader, 1 liker, {args.duration:.0f}s per mode")
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--readers', str(args.readers),
+             '--duration', str(args.duration), '--batch-size', str(args.batch_size)],
+            check=True, stdout=subprocess.PIPE, universal_newlines=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{mode:8} {result['reads_per_sec']:8.1f} reads/s  "
+            f"{result['rows_written_per_sec']:8.1f} rows uploaded/s  "
+            f"{result['likes_per_sec']:8.1f} likes/s  "
+            f"lock errors: {result['read_lock_errors']} read, {result['write_lock_errors']} write"
+            + (f"  other errors: {result['other_errors']}" if result['other_errors'] else '')
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Async versions of the blog's JSON views, served by recap/asgi.py.
+"""
+import json
+
+from monitoring.http import JsonResponse
+from recap.async_support import async_login_required, run_in_threadpool
+
+from .views import (
+    LIKE_BATCH_ERROR, LIKE_STATE_ERROR, like_batch_response, like_states, parse_like_batch, parse_post_ids,
+    set_likes, toggle_like,
+)
+
+@async_login_required
+async def like_post(request):
+    if request.method == 'POST':
+        data = json.loads(request.body)
+        liked, likes_count = await run_in_threadpool(toggle_like, request.user, data.get('post_id'))
+        return JsonResponse({'liked': liked, 'likes_count': likes_count})
+
+    return JsonResponse({'error': 'Invalid request'}, status=400)
+
+
+@async_login_required
+async def like_batch(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    likes = parse_like_batch(request.body)
+    if likes is None:
+        return JsonResponse({'error': LIKE_BATCH_ERROR}, status=400)
+    states = await run_in_threadpool(set_likes, request.user, likes)
+    return like_batch_response(likes, states)
+
+
+@async_login_required
+async def like_state(request):
+    post_ids = parse_post_ids(request.GET)
+    if post_ids is None:
+        return JsonResponse({'error': LIKE_STATE_ERROR}, status=400)
+    states = await run_in_threadpool(like_states, request.user, post_ids)
+    return like_batch_response(post_ids, states)
@@ -0,0 +1,147 @@
+"""
+The ids of the posts each user likes, cached in the shared tier of
+recap.cache so feeds can mark liked posts without querying the likes.
+
+A user's set is loaded with one query on the first lookup and then kept
+up to date as they like and unlike posts (see blog.signals): the changes
+a transaction makes are applied to the cached set once it commits.
+Processes updating the same set take turns through a lock entry, which is
+best effort in the same way as recap.cache's.
+
+A change committed while a set isn't cached replaces it with STALE for a
+while, so that a lookup which read the likes before the change can't then
+cache what it read.
+"""
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.core.cache import caches
+from recap.cache import LOCK_POLL_INTERVAL, LOCK_TIMEOUT, SHARED_CACHE, database_key
+from recap.transactions import collect_on_commit
+
+# Sets change with every like, so this only bounds how long one that
+# somehow went stale can be used
+LIKED_POSTS_TIMEOUT = 24 * 60 * 60
+STALE = 'stale'
+
+
+class LikedPosts:
+    """An immutable set of post ids, stored compactly
+
+    Dense sets (many likes among few posts) are a bitmap indexed by post
+    id, and sparse ones a sorted array of ids, whichever is smaller.
+    Membership is a bit test or a binary search; both pickle as bytes.
+    """
+
+    def __init__(self, post_ids=()):
+        ids = sorted(set(post_ids))
+        self.count = len(ids)
+        bitmap_size = ids[-1] // 8 + 1 if ids else 0
+        if bitmap_size < 4 * len(ids):
+            bitmap = bytearray(bitmap_size)
+            for post_id in ids:
+                bitmap[post_id >> 3] |= 1 << (post_id & 7)
+            self.bitmap, self.ids = bytes(bitmap), None
+        else:
+            self.bitmap, self.ids = None, array('I' if not ids or ids[-1] < 2 ** 32 else 'Q', ids)
+
+    def __contains__(self, post_id):
+        if not isinstance(post_id, int) or post_id < 0:
+            return False
+        if self.bitmap is not None:
+            return post_id >> 3 < len(self.bitmap) and bool(self.bitmap[post_id >> 3] >> (post_id & 7) & 1)
+        index = bisect_left(self.ids, post_id)
+        return index < len(self.ids) and self.ids[index] == post_id
+
+    def __iter__(self):
+        if self.ids is not None:
+            return iter(self.ids)
+        return (
+            index * 8 + bit
+            for index, byte in enumerate(self.bitmap) if byte
+            for bit in range(8) if byte >> bit & 1
+        )
+
+    def __len__(self):
+        return self.count
+
+    def changed(self, changes):
+        """A copy with changes, {post id: liked}, applied"""
+        ids = set(self)
+        ids.update(post_id for post_id, liked in changes.items() if liked)
+        ids.difference_update(post_id for post_id, liked in changes.items() if not liked)
+        return LikedPosts(ids)
+
+
+def cache_key(user_id):
+    return f'liked-posts:{database_key()}:{user_id}'
+
+
+def liked_posts(user):
+    """The LikedPosts of user, empty for anonymous users"""
+    if not user.is_authenticated:
+        return LikedPosts()
+    cache = caches[SHARED_CACHE]
+    key = cache_key(user.pk)
+    liked = cache.get(key)
+    if not isinstance(liked, LikedPosts):
+        from .models import Like
+        liked = LikedPosts(Like.objects.filter(user=user).values_list('post_id', flat=True))
+        # add(), so neither a set updated meanwhile nor STALE is replaced
+        cache.add(key, liked, LIKED_POSTS_TIMEOUT)
+    return liked
+
+
+def likes_post(user, post_id):
+    """Whether user likes a post, from their cached set if there is one
+
+    One post doesn't warrant loading a set that isn't cached yet.
+    """
+    if not user.is_authenticated:
+        return False
+    liked = caches[SHARED_CACHE].get(cache_key(user.pk))
+    if isinstance(liked, LikedPosts):
+        return post_id in liked
+    from .models import Like
+    return Like.objects.filter(user=user, post_id=post_id).exists()
+
+
+class LikeChanges:
+    """The likes a transaction makes, applied to each user's cached set on commit"""
+
+    def __init__(self):
+        self.changes = defaultdict(dict)
+
+    def add(self, user_id, post_id, liked):
+        self.changes[user_id][post_id] = liked
+
+    def __call__(self):
+        for user_id, changes in self.changes.items():
+            self.apply(user_id, changes)
+
+    def apply(self, user_id, changes):
+        cache = caches[SHARED_CACHE]
+        key = cache_key(user_id)
+        lock_key = f'lock:{key}'
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while not cache.add(lock_key, True, LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                cache.set(key, STALE, LOCK_TIMEOUT)
+                return
+            time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            liked = cache.get(key)
+            if isinstance(liked, LikedPosts):
+                cache.set(key, liked.changed(changes), LIKED_POSTS_TIMEOUT)
+            else:
+                cache.set(key, STALE, LOCK_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+
+
+def record_like_change(user_id, post_id, liked):
+    """Have the cached set of user_id follow a like or unlike once it commits"""
+    # One batch per transaction, however many likes a cascade deletes
+    collect_on_commit('liked-posts', LikeChanges, user_id, post_id, liked)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from blog.models import IncidentActivity
+
+class Command(BaseCommand):
+    help = 'Recount the posts, comments and likes of each incident, as after loading data without signals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('incident_ids', nargs='*', type=int, help='Incidents to recount (default: all)')
+
+    def handle(self, *args, **options):
+        IncidentActivity.objects.rebuild(options['incident_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Recounted the activity of {IncidentActivity.objects.count()} incidents.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from blog import trending
+
+class Command(BaseCommand):
+    help = 'Add the posts, comments and likes since the last run to the trending scores'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Recount every score from scratch, dropping removed likes and comments'
+        )
+
+    def handle(self, *args, **options):
+        posts, incidents = trending.refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Updated the trending scores of {posts} posts and {incidents} incidents.'))
@@ -6,6 +6,7 @@ from django.conf import settings
 from django.core.files import File
 from blog.models import Post, Comment
 from users.models import Profile
+from users.renditions import update_renditions
 from water_issues_dashboard.models import Incident
 
 class Command(BaseCommand):
@@ -58,6 +59,7 @@ class Command(BaseCommand):
                             profile = Profile.objects.get(user=user)
                             # Save the image to the profile's image field
                             profile.image.save(os.path.basename(user_data['image_path']), File(f), save=True)
+                        update_renditions(profile)
                     else:
                         self.stdout.write(self.style.WARNING(f"Image not found at {image_full_path}. Skipping for user '{user.username}'."))
 
@@ -71,10 +73,16 @@ class Command(BaseCommand):
         with open(filepath, 'r') as f:
             posts_data = json.load(f)
 
+        # Looked up once rather than once per post
+        authors = User.objects.in_bulk({post['author_username'] for post in posts_data}, field_name='username')
+        incidents = Incident.objects.in_bulk({post['incident_id'] for post in posts_data if 'incident_id' in post})
+
         count = 0
         for post_data in posts_data:
             try:
-                author = User.objects.get(username=post_data['author_username'])
+                author = authors.get(post_data['author_username'])
+                if author is None:
+                    raise User.DoesNotExist
 
                 # Prepare post details
                 post_details = {
@@ -85,11 +93,10 @@ class Command(BaseCommand):
 
                 # Check for an associated incident ID
                 if 'incident_id' in post_data:
-                    try:
-                        # Find the incident by its primary key (ID)
-                        incident = Incident.objects.get(pk=post_data['incident_id'])
+                    incident = incidents.get(post_data['incident_id'])
+                    if incident is not None:
                         post_details['incident'] = incident
-                    except Incident.DoesNotExist:
+                    else:
                         self.stdout.write(self.style.WARNING(f"Incident with ID '{post_data['incident_id']}' not found for post '{post_data['title']}'. Post will be created without an incident link."))
 
                 # Create the post if it doesn't exist
@@ -110,10 +117,14 @@ class Command(BaseCommand):
         with open(filepath, 'r') as f:
             comments_data = json.load(f)
 
+        authors = User.objects.in_bulk({comment['author_username'] for comment in comments_data}, field_name='username')
+
         count = 0
         for comment_data in comments_data:
             try:
-                author = User.objects.get(username=comment_data['author_username'])
+                author = authors.get(comment_data['author_username'])
+                if author is None:
+                    raise User.DoesNotExist
                 post = Post.objects.get(title=comment_data['post_title'])
 
                 if not Comment.objects.filter(content=comment_data['content'], author=author, post=post).exists():
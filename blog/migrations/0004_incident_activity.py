@@ -0,0 +1,37 @@
+# Generated by Django 2.1 on 2026-10-19 11:20
+
+import blog.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_activity(apps, schema_editor):
+    apps.get_model('blog', 'IncidentActivity').objects.rebuild()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('water_issues_dashboard', '0004_hot_query_indexes'),
+        ('blog', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentActivity',
+            fields=[
+                ('incident', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='activity', serialize=False, to='water_issues_dashboard.Incident')),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+                ('like_count', models.PositiveIntegerField(default=0)),
+                ('last_post_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'incident activity',
+            },
+            managers=[
+                ('objects', blog.models.IncidentActivityManager()),
+            ],
+        ),
+        migrations.RunPython(count_activity, migrations.RunPython.noop),
+    ]
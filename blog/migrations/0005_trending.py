@@ -0,0 +1,48 @@
+# Generated by Django 2.1 on 2026-10-19 12:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('water_issues_dashboard', '0004_hot_query_indexes'),
+        ('blog', '0004_incident_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentTrend',
+            fields=[
+                ('score', models.FloatField(default=0)),
+                ('incident', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='water_issues_dashboard.Incident')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostTrend',
+            fields=[
+                ('score', models.FloatField(default=0)),
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='blog.Post')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.DateTimeField()),
+                ('post_id', models.PositiveIntegerField(default=0)),
+                ('comment_id', models.PositiveIntegerField(default=0)),
+                ('like_id', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='posttrend',
+            index=models.Index(fields=['-score'], name='post_trend_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incidenttrend',
+            index=models.Index(fields=['-score'], name='incident_trend_score_idx'),
+        ),
+    ]
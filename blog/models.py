@@ -1,14 +1,35 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import User
 from water_issues_dashboard.models import Incident
 
+class PostQuerySet(models.QuerySet):
+    def with_like_counts(self):
+        """Annotate each post with like_count, counted in the same query"""
+        likes = Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(count=Count('*'))
+        return self.annotate(like_count=Coalesce(Subquery(likes.values('count')), 0))
+
 class Post(models.Model):
     title = models.CharField(max_length=100)
     content = models.TextField()
     date_posted = models.DateTimeField(default=timezone.now)
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     incident = models.ForeignKey(Incident, on_delete=models.CASCADE, related_name='posts', null=True, blank=True)
+    # Bumped whenever the post's cached fragments go stale, see blog.signals
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        # Every feed lists posts newest first: all of them, or one author's
+        # or one incident's
+        indexes = [
+            models.Index(fields=['-date_posted'], name='post_date_posted_idx'),
+            models.Index(fields=['author', '-date_posted'], name='post_author_date_idx'),
+            models.Index(fields=['incident', '-date_posted'], name='post_incident_date_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -22,6 +43,12 @@ class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     date_posted = models.DateTimeField(default=timezone.now)
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-date_posted'], name='comment_post_date_idx'),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author} on {self.post}'
@@ -35,4 +62,98 @@ class Like(models.Model):
         unique_together = ('user', 'post')
 
     def __str__(self):
-        return f'{self.user.username} likes {self.post.title}'
\ No newline at end of file
+        return f'{self.user.username} likes {self.post.title}'
+
+class IncidentActivityManager(models.Manager):
+    # Migrations use rebuild() to fill the table in
+    use_in_migrations = True
+
+    def rebuild(self, incident_ids=None):
+        """Recount the activity of incident_ids, or of every incident, from the posts"""
+        apps = self.model._meta.apps
+        Incident = apps.get_model('water_issues_dashboard', 'Incident')
+        Post, Comment, Like = (apps.get_model('blog', name) for name in ['Post', 'Comment', 'Like'])
+
+        def per_incident(model, incident, aggregate, output_field=None):
+            rows = model.objects.filter(**{incident: OuterRef('pk')}).order_by().values(incident)
+            return Subquery(rows.annotate(value=aggregate).values('value'), output_field=output_field)
+
+        incidents = Incident.objects.all()
+        if incident_ids is not None:
+            incidents = incidents.filter(pk__in=incident_ids)
+        rows = incidents.annotate(
+            post_total=Coalesce(per_incident(Post, 'incident', Count('*')), 0),
+            comment_total=Coalesce(per_incident(Comment, 'post__incident', Count('*')), 0),
+            like_total=Coalesce(per_incident(Like, 'post__incident', Count('*')), 0),
+            # Typed, so the database's datetimes come back timezone aware
+            latest_post=per_incident(Post, 'incident', Max('date_posted'), models.DateTimeField()),
+        ).values_list('pk', 'post_total', 'comment_total', 'like_total', 'latest_post')
+        with transaction.atomic(using=self.db):
+            self.filter(incident__in=incidents).delete()
+            self.bulk_create([
+                self.model(
+                    incident_id=pk, post_count=posts, comment_count=comments, like_count=likes, last_post_at=latest,
+                )
+                for pk, posts, comments, likes, latest in rows
+            ], batch_size=500)
+
+class IncidentActivity(models.Model):
+    """How much an incident is discussed, kept up to date by blog.signals
+
+    Lets the map show the activity of every incident without counting the
+    posts, comments and likes of each. rebuild_incident_activity recounts
+    it, for rows written without signals (as bulk_create does).
+    """
+    incident = models.OneToOneField(Incident, on_delete=models.CASCADE, primary_key=True, related_name='activity')
+    post_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    like_count = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(null=True, blank=True)
+
+    objects = IncidentActivityManager()
+
+    class Meta:
+        verbose_name_plural = 'incident activity'
+
+    def __str__(self):
+        return f'Activity on {self.incident_id}'
+
+    def as_dict(self):
+        return {
+            'posts': self.post_count,
+            'comments': self.comment_count,
+            'likes': self.like_count,
+            'last_post_at': self.last_post_at.isoformat() if self.last_post_at else None,
+        }
+
+class Trend(models.Model):
+    """A trending score, time-decayed engagement computed by blog.trending
+
+    Scores are relative to TrendingState.epoch rather than to now, so
+    ranking by them needs no decay applied at request time.
+    """
+    score = models.FloatField(default=0)
+
+    class Meta:
+        abstract = True
+
+class PostTrend(Trend):
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+
+    class Meta:
+        indexes = [models.Index(fields=['-score'], name='post_trend_score_idx')]
+
+class IncidentTrend(Trend):
+    incident = models.OneToOneField(Incident, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+
+    class Meta:
+        indexes = [models.Index(fields=['-score'], name='incident_trend_score_idx')]
+
+class TrendingState(models.Model):
+    """Where blog.trending's last refresh left off; there is one row"""
+    epoch = models.DateTimeField()
+    # The last post, comment and like counted
+    post_id = models.PositiveIntegerField(default=0)
+    comment_id = models.PositiveIntegerField(default=0)
+    like_id = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField()
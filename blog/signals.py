@@ -0,0 +1,111 @@
+from django.db.models import DateTimeField, F, Max, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from water_issues_dashboard.models import Incident
+from .models import Post, Comment, Like, IncidentActivity
+from .cache import record_like_change
+
+# Template fragments are cached by object id and version, so bumping the
+# version is all it takes to have them re-rendered.
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def bump_edited_version(sender, instance, **kwargs):
+    if not instance._state.adding:
+        # Increment in the database, as likes and comments may have bumped
+        # the version since this instance was loaded
+        instance.version = F('version') + 1
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def reload_edited_version(sender, instance, created, **kwargs):
+    # Replace the expression saved above with the number it came to, so
+    # fragment cache keys built from this instance stay valid
+    if not created:
+        instance.refresh_from_db(fields=['version'])
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def bump_post_version(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id).update(version=F('version') + 1)
+
+@receiver(post_save, sender=Like)
+def cache_like(sender, instance, created, **kwargs):
+    if created:
+        record_like_change(instance.user_id, instance.post_id, True)
+
+@receiver(post_delete, sender=Like)
+def cache_unlike(sender, instance, **kwargs):
+    record_like_change(instance.user_id, instance.post_id, False)
+
+# Incident activity is counted up and down in single UPDATEs, so concurrent
+# posts, comments and likes don't overwrite each other's counts.
+
+def incident_activity_of_post(post_id):
+    """The IncidentActivity of the incident a post is about, to update"""
+    incident = Post.objects.filter(pk=post_id).values('incident_id')
+    return IncidentActivity.objects.filter(incident_id=Subquery(incident))
+
+def decrement(field):
+    # A count written by hand or by bulk_create may be low already
+    return Greatest(F(field) - 1, Value(0))
+
+@receiver(post_save, sender=Incident)
+def create_incident_activity(sender, instance, created, **kwargs):
+    if created:
+        IncidentActivity.objects.create(incident=instance)
+
+@receiver(pre_save, sender=Post)
+def remember_incident(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._saved_incident_id = Post.objects.filter(pk=instance.pk).values_list('incident_id', flat=True).first()
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, **kwargs):
+    if created:
+        if instance.incident_id is not None:
+            date_posted = Value(instance.date_posted, output_field=DateTimeField())
+            IncidentActivity.objects.filter(incident_id=instance.incident_id).update(
+                post_count=F('post_count') + 1,
+                last_post_at=Greatest(Coalesce('last_post_at', date_posted), date_posted),
+            )
+    else:
+        # Edited posts may have moved incident or date; they are rare enough
+        # to recount
+        incidents = {getattr(instance, '_saved_incident_id', None), instance.incident_id} - {None}
+        if incidents:
+            IncidentActivity.objects.rebuild(incidents)
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    if instance.incident_id is not None:
+        latest = (
+            Post.objects.filter(incident_id=instance.incident_id).order_by().values('incident_id')
+            .annotate(latest=Max('date_posted')).values('latest')
+        )
+        IncidentActivity.objects.filter(incident_id=instance.incident_id).update(
+            post_count=decrement('post_count'), last_post_at=Subquery(latest),
+        )
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        incident_activity_of_post(instance.post_id).update(comment_count=F('comment_count') + 1)
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    # Comments deleted along with their post are deleted first, so the post
+    # can still be found
+    incident_activity_of_post(instance.post_id).update(comment_count=decrement('comment_count'))
+
+@receiver(post_save, sender=Like)
+def count_like(sender, instance, created, **kwargs):
+    if created:
+        incident_activity_of_post(instance.post_id).update(like_count=F('like_count') + 1)
+
+@receiver(post_delete, sender=Like)
+def uncount_like(sender, instance, **kwargs):
+    incident_activity_of_post(instance.post_id).update(like_count=decrement('like_count'))
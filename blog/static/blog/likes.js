@@ -0,0 +1,95 @@
+/*
+ * Like buttons that send their clicks in batches.
+ *
+ * A click shows its result at once. Clicks made within FLUSH_DELAY ms of
+ * each other go to the server together in one batch like request, with
+ * only the last state of each post, and the buttons are then set from the
+ * server's answer. A page restored from the back/forward cache reads the
+ * like states of all its buttons in one request, as they may have changed
+ * since it was rendered.
+ *
+ * Each button has the class like-btn and a data-post-id; its count is the
+ * .like-count inside it or the element after it.
+ */
+(function () {
+    const FLUSH_DELAY = 400;
+
+    window.initLikeButtons = function (options) {
+        const buttons = Array.from(document.querySelectorAll('.like-btn'));
+        let pending = {};
+        let timer = null;
+        let sending = Promise.resolve();
+
+        function countOf(button) {
+            return button.querySelector('.like-count') || button.nextElementSibling;
+        }
+
+        function show(posts) {
+            buttons.forEach(button => {
+                const postId = button.dataset.postId;
+                const state = posts[postId];
+                // Clicks made since the request was sent win
+                if (state && !(postId in pending)) {
+                    button.classList.toggle('liked', state.liked);
+                    countOf(button).textContent = state.likes_count;
+                }
+            });
+        }
+
+        function refresh() {
+            const query = new URLSearchParams();
+            new Set(buttons.map(button => button.dataset.postId)).forEach(postId => query.append('post_id', postId));
+            return fetch(options.stateUrl + '?' + query, {credentials: 'same-origin'})
+                .then(response => response.json())
+                .then(data => show(data.posts));
+        }
+
+        function flush() {
+            timer = null;
+            const likes = Object.keys(pending).map(postId => ({post_id: Number(postId), liked: pending[postId]}));
+            pending = {};
+            // One batch at a time, so the server applies them in click order
+            sending = sending
+                .then(() => fetch(options.batchUrl, {
+                    method: 'POST',
+                    credentials: 'same-origin',
+                    // Lets a batch flushed as the page is left finish
+                    keepalive: true,
+                    headers: {'Content-Type': 'application/json', 'X-CSRFToken': options.csrfToken},
+                    body: JSON.stringify({likes: likes}),
+                }))
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.json();
+                })
+                .then(data => show(data.posts))
+                .catch(() => refresh().catch(() => {}));
+        }
+
+        buttons.forEach(button => {
+            button.addEventListener('click', function () {
+                const liked = !this.classList.contains('liked');
+                const count = countOf(this);
+                this.classList.toggle('liked', liked);
+                count.textContent = Number(count.textContent) + (liked ? 1 : -1);
+                pending[this.dataset.postId] = liked;
+                clearTimeout(timer);
+                timer = setTimeout(flush, FLUSH_DELAY);
+            });
+        });
+
+        window.addEventListener('pagehide', () => {
+            if (timer !== null) {
+                clearTimeout(timer);
+                flush();
+            }
+        });
+        window.addEventListener('pageshow', event => {
+            if (event.persisted && buttons.length) {
+                refresh().catch(() => {});
+            }
+        });
+    };
+})();
@@ -1,3 +1,459 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from recap.testing import LOCAL_CACHES, NO_CACHES, POINT, ContentSeeder, QueryCountMixin, QueryPlanMixin
+from water_issues_dashboard.models import Incident
+from . import trending
+from .cache import STALE, LikedPosts, cache_key, liked_posts, likes_post
+from .models import Comment, IncidentActivity, Like, Post, PostTrend, TrendingState
+
+# The new post form offers every incident to link to
+POST_FORM_SCANS = {'water_issues_dashboard_incident'}
+
+
+@override_settings(CACHES=NO_CACHES)
+class FeedQueryPlanTests(QueryPlanMixin, TestCase):
+    """Feeds are read newest first from indexes rather than sorted"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', 'planner@example.com', 'planner-password')
+        cls.incident = Incident.objects.create(
+            name='Red River flood', incident_type='flood', status='confirmed',
+            geometry={'type': 'Point', 'coordinates': [-97.1, 49.9]},
+        )
+        cls.post = Post.objects.create(title='Rising', content='...', author=cls.user, incident=cls.incident)
+        Comment.objects.create(post=cls.post, author=cls.user, content='...')
+        Like.objects.create(post=cls.post, user=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_home_feed(self):
+        with self.assertUsesIndexes(allowed_scans=POST_FORM_SCANS):
+            self.client.get(reverse('blog-home'))
+
+    def test_profile_feed(self):
+        with self.assertUsesIndexes(allowed_scans=POST_FORM_SCANS):
+            self.client.get(reverse('blog-profile', args=[self.user.id]))
+
+    def test_incident_discussion(self):
+        with self.assertUsesIndexes():
+            self.client.get(reverse('incident-discussion', args=[self.incident.id]))
+
+    def test_post_comments(self):
+        with self.assertUsesIndexes():
+            self.client.get(reverse('blog-post', args=[self.post.id]))
+
+    def test_trending(self):
+        trending.refresh()
+        with self.assertUsesIndexes():
+            self.client.get(reverse('blog-trending'))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class FragmentVersionTests(TestCase):
+    """Edits, comments and likes bump the version that cached fragments are keyed on"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('editor', 'editor@example.com', 'editor-password')
+        self.post = Post.objects.create(title='Rising', content='The river is rising', author=self.user)
+
+    def test_edit(self):
+        post = Post.objects.get(pk=self.post.pk)
+        # Bumped by a like after post was loaded
+        Like.objects.create(post=self.post, user=self.user)
+        post.title = 'Risen'
+        post.save()
+        self.assertEqual(post.version, 2)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).version, 2)
+
+        post.save()
+        self.assertEqual(post.version, 3)
+
+    def test_edit_rerenders(self):
+        self.client.force_login(self.user)
+        url = reverse('blog-post', args=[self.post.pk])
+        self.assertContains(self.client.get(url), 'The river is rising')
+        self.post.content = 'The river has crested'
+        self.post.save()
+        comment = Comment.objects.create(post=self.post, author=self.user, content='Stay safe')
+        comment.content = 'Stay dry'
+        comment.save()
+        self.assertEqual(comment.version, 1)
+
+        response = self.client.get(url)
+        self.assertContains(response, 'The river has crested')
+        self.assertContains(response, 'Stay dry')
+
+
+@override_settings(CACHES=NO_CACHES)
+class ViewQueryCountTests(QueryCountMixin, TestCase):
+    """Each blog page runs the same number of queries however many rows it shows"""
+
+    def setUp(self):
+        self.seed = ContentSeeder()
+        self.client.force_login(self.seed.user)
+
+    def assertConstantGet(self, url):
+        self.assertConstantQueries(lambda: self.client.get(url), self.seed)
+
+    def test_landing(self):
+        self.assertConstantGet(reverse('landing'))
+
+    def test_home(self):
+        self.assertConstantGet(reverse('blog-home'))
+
+    def test_about(self):
+        self.assertConstantGet(reverse('blog-about'))
+
+    def test_post(self):
+        self.assertConstantGet(reverse('blog-post', args=[self.seed.post.id]))
+
+    def test_profile(self):
+        self.assertConstantGet(reverse('blog-profile', args=[self.seed.user.id]))
+
+    def test_incident_discussion(self):
+        self.assertConstantGet(reverse('incident-discussion', args=[self.seed.incident.id]))
+
+    def test_trending(self):
+        def seed(count):
+            self.seed(count)
+            trending.refresh()
+
+        self.assertConstantQueries(lambda: self.client.get(reverse('blog-trending')), seed)
+
+    def test_like_post(self):
+        def like_and_unlike():
+            for _ in range(2):
+                self.client.post(
+                    reverse('like-post'), json.dumps({'post_id': self.seed.post.id}), content_type='application/json'
+                )
+
+        self.assertConstantQueries(like_and_unlike, self.seed)
+
+    def test_like_batch(self):
+        def like_and_unlike():
+            for liked in [True, False]:
+                self.client.post(
+                    reverse('like-batch'), json.dumps({'likes': [{'post_id': self.seed.post.id, 'liked': liked}]}),
+                    content_type='application/json',
+                )
+
+        self.assertConstantQueries(like_and_unlike, self.seed)
+
+    def test_like_state(self):
+        post_ids = list(Post.objects.values_list('id', flat=True)[:5])
+        self.assertConstantGet(reverse('like-state') + '?' + '&'.join(f'post_id={id}' for id in post_ids))
+
+    def test_delete_post_confirmation(self):
+        self.assertConstantGet(reverse('delete-post', args=[self.seed.post.id]))
+
+    def test_delete_comment_confirmation(self):
+        comment = Comment.objects.create(post=self.seed.post, author=self.seed.user, content='...')
+        self.assertConstantGet(reverse('delete-comment', args=[comment.id]))
+
+
+class LikeBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('liker', 'liker@example.com', 'liker-password')
+        cls.other = User.objects.create_user('other', 'other@example.com', 'other-password')
+        cls.posts = [Post.objects.create(title=f'Post {n}', content='...', author=cls.other) for n in range(3)]
+        Like.objects.create(post=cls.posts[0], user=cls.user)
+        Like.objects.create(post=cls.posts[0], user=cls.other)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def batch(self, likes):
+        return self.client.post(reverse('like-batch'), json.dumps({'likes': [
+            {'post_id': post_id, 'liked': liked} for post_id, liked in likes
+        ]}), content_type='application/json')
+
+    def test_batch_sets_likes(self):
+        first, second, third = [post.id for post in self.posts]
+        response = self.batch([(first, False), (second, True), (third, True), (third, False), (999999, True)])
+
+        self.assertEqual(response.json(), {
+            'posts': {
+                str(first): {'liked': False, 'likes_count': 1},
+                str(second): {'liked': True, 'likes_count': 1},
+                str(third): {'liked': False, 'likes_count': 0},
+            },
+            'missing': [999999],
+        })
+        self.assertEqual(set(Like.objects.filter(user=self.user).values_list('post_id', flat=True)), {second})
+
+    def test_batch_is_idempotent(self):
+        self.batch([(self.posts[1].id, True)])
+        response = self.batch([(self.posts[1].id, True)])
+
+        self.assertEqual(response.json()['posts'][str(self.posts[1].id)], {'liked': True, 'likes_count': 1})
+        self.assertEqual(Like.objects.filter(user=self.user, post=self.posts[1]).count(), 1)
+
+    def test_invalid_batches(self):
+        url = reverse('like-batch')
+        out_of_range = [json.dumps({'likes': [{'post_id': post_id, 'liked': True}]}) for post_id in [0, -1, 2 ** 63]]
+        for body in ['not json', '[]', '{"likes": {}}', '{"likes": [{"post_id": "1", "liked": true}]}',
+                     json.dumps({'likes': [{'post_id': 1, 'liked': True}] * 101}), *out_of_range]:
+            with self.subTest(body=body[:40]):
+                response = self.client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_like_state(self):
+        post_ids = [post.id for post in self.posts[:2]]
+        response = self.client.get(reverse('like-state'), {'post_id': post_ids + [999999]})
+
+        self.assertEqual(response.json(), {
+            'posts': {
+                str(post_ids[0]): {'liked': True, 'likes_count': 2},
+                str(post_ids[1]): {'liked': False, 'likes_count': 0},
+            },
+            'missing': [999999],
+        })
+        for post_id in ['x', '0', '-1', str(2 ** 63), str(2 ** 70)]:
+            with self.subTest(post_id=post_id):
+                self.assertEqual(self.client.get(reverse('like-state'), {'post_id': post_id}).status_code, 400)
+        response = self.client.get(reverse('like-state'), {'post_id': str(2 ** 63 - 1)})
+        self.assertEqual(response.json(), {'posts': {}, 'missing': [2 ** 63 - 1]})
+
+
+class LikedPostsTests(TestCase):
+    def test_dense_and_sparse_sets(self):
+        for ids in [range(1, 200, 3), [5, 70000, 10 ** 9]]:
+            liked = LikedPosts(ids)
+            with self.subTest(bitmap=liked.bitmap is not None):
+                self.assertEqual(list(liked), list(ids))
+                self.assertEqual(len(liked), len(ids))
+                self.assertTrue(all(post_id in liked for post_id in ids))
+                self.assertFalse(any(post_id in liked for post_id in [0, 2, 6, 69999, 10 ** 9 + 1, -5, None]))
+        self.assertIsNotNone(LikedPosts(range(1, 200, 3)).bitmap)
+        self.assertIsNotNone(LikedPosts([5, 70000, 10 ** 9]).ids)
+
+    def test_changed(self):
+        liked = LikedPosts([1, 2, 3]).changed({2: False, 4: True, 5: False})
+        self.assertEqual(list(liked), [1, 3, 4])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class LikedPostCacheTests(TransactionTestCase):
+    """The cache follows likes as they commit, which TestCase's transaction would delay"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('liker', 'liker@example.com', 'liker-password')
+        self.posts = [Post.objects.create(title=f'Post {n}', content='...', author=self.user) for n in range(3)]
+        Like.objects.create(post=self.posts[0], user=self.user)
+        caches['shared'].clear()
+        self.client.force_login(self.user)
+
+    def cached(self):
+        return caches['shared'].get(cache_key(self.user.id))
+
+    def test_feed_reads_likes_once(self):
+        self.client.get(reverse('blog-home'))
+        self.assertEqual(list(self.cached()), [self.posts[0].id])
+
+        with self.assertNumQueries(0):
+            self.assertIn(self.posts[0].id, liked_posts(self.user))
+
+    def test_likes_update_the_cached_set(self):
+        liked_posts(self.user)
+        self.client.post(reverse('like-batch'), json.dumps({'likes': [
+            {'post_id': self.posts[0].id, 'liked': False}, {'post_id': self.posts[1].id, 'liked': True},
+        ]}), content_type='application/json')
+        self.assertEqual(list(self.cached()), [self.posts[1].id])
+
+        response = self.client.get(reverse('blog-home'))
+        self.assertContains(response, f'class="like-btn liked" data-post-id="{self.posts[1].id}"')
+
+    def test_rolled_back_likes_are_not_cached(self):
+        liked_posts(self.user)
+        try:
+            with transaction.atomic():
+                Like.objects.create(post=self.posts[1], user=self.user)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(list(self.cached()), [self.posts[0].id])
+
+    def test_one_callback_per_transaction(self):
+        other = User.objects.create_user('other', 'other@example.com', 'other-password')
+        for post in self.posts[1:]:
+            Like.objects.create(post=post, user=other)
+        caches['shared'].clear()
+        liked_posts(self.user)
+        liked_posts(other)
+
+        with mock.patch.object(transaction, 'on_commit', wraps=transaction.on_commit) as on_commit:
+            with transaction.atomic():
+                Like.objects.create(post=self.posts[2], user=self.user)
+                # Cascades to every like of the post
+                self.posts[1].delete()
+        self.assertEqual(on_commit.call_count, 1)
+        self.assertEqual(list(self.cached()), [self.posts[0].id, self.posts[2].id])
+        self.assertEqual(list(caches['shared'].get(cache_key(other.id))), [self.posts[2].id])
+
+    def test_post_page_does_not_load_the_set(self):
+        response = self.client.get(reverse('blog-post', args=[self.posts[0].id]))
+        self.assertContains(response, 'class="like-btn liked"')
+        self.assertIsNone(self.cached())
+
+        liked_posts(self.user)
+        with self.assertNumQueries(0):
+            self.assertFalse(likes_post(self.user, self.posts[1].id))
+
+    def test_change_while_uncached_marks_the_set_stale(self):
+        Like.objects.create(post=self.posts[2], user=self.user)
+        self.assertEqual(self.cached(), STALE)
+        # Read from the database until the mark expires
+        self.assertEqual(set(liked_posts(self.user)), {self.posts[0].id, self.posts[2].id})
+        self.assertEqual(self.cached(), STALE)
+
+
+class IncidentActivityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('poster', 'poster@example.com', 'poster-password')
+        cls.incident, cls.other_incident = [
+            Incident.objects.create(name=name, incident_type='flood', status='confirmed', geometry=POINT)
+            for name in ['Red River flood', 'Assiniboine flood']
+        ]
+
+    def activity(self, incident=None):
+        return IncidentActivity.objects.get(incident=incident or self.incident)
+
+    def counts(self, incident=None):
+        activity = self.activity(incident)
+        return activity.post_count, activity.comment_count, activity.like_count, activity.last_post_at
+
+    def post(self, days_ago=0, incident=None):
+        return Post.objects.create(
+            title='Rising', content='...', author=self.user, incident=incident or self.incident,
+            date_posted=timezone.now() - timedelta(days=days_ago),
+        )
+
+    def test_counts_follow_posts_comments_and_likes(self):
+        self.assertEqual(self.counts(), (0, 0, 0, None))
+        older, newer = self.post(days_ago=2), self.post(days_ago=1)
+        comment = Comment.objects.create(post=older, author=self.user, content='...')
+        Comment.objects.create(post=newer, author=self.user, content='...')
+        Like.objects.create(post=newer, user=self.user)
+        Post.objects.create(title='Elsewhere', content='...', author=self.user)
+        self.assertEqual(self.counts(), (2, 2, 1, newer.date_posted))
+
+        comment.delete()
+        self.assertEqual(self.counts(), (2, 1, 1, newer.date_posted))
+        # Its comment and like go with it
+        newer.delete()
+        self.assertEqual(self.counts(), (1, 0, 0, older.date_posted))
+        older.delete()
+        self.assertEqual(self.counts(), (0, 0, 0, None))
+
+    def test_moving_a_post_recounts_both_incidents(self):
+        post = self.post()
+        Like.objects.create(post=post, user=self.user)
+        post.incident = self.other_incident
+        post.save()
+
+        self.assertEqual(self.counts(), (0, 0, 0, None))
+        self.assertEqual(self.counts(self.other_incident), (1, 0, 1, post.date_posted))
+
+    def test_rebuild_matches_the_signals(self):
+        for days_ago in range(3):
+            post = self.post(days_ago)
+            Comment.objects.create(post=post, author=self.user, content='...')
+        Like.objects.create(post=post, user=self.user)
+        counted = self.counts()
+
+        IncidentActivity.objects.all().delete()
+        IncidentActivity.objects.rebuild()
+        self.assertEqual(self.counts(), counted)
+        self.assertEqual(self.counts(self.other_incident), (0, 0, 0, None))
+
+    @override_settings(CACHES=NO_CACHES)
+    def test_map_features_include_the_activity(self):
+        post = self.post()
+        self.client.force_login(self.user)
+        data = self.client.get(reverse('water_issues_dashboard:api_geojson'), {'type': 'incidents'}).json()
+
+        discussions = {feature['id']: feature['properties']['discussion'] for feature in data['incidents']['features']}
+        self.assertEqual(discussions[self.incident.id], {
+            'posts': 1, 'comments': 0, 'likes': 0, 'last_post_at': post.date_posted.isoformat(),
+        })
+        self.assertEqual(discussions[self.other_incident.id]['posts'], 0)
+
+
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'fan{n}', f'fan{n}@example.com', 'fan-password') for n in range(4)]
+        cls.incident = Incident.objects.create(name='Red River flood', incident_type='flood', status='confirmed', geometry=POINT)
+
+    def post(self, hours_ago, likes=0, incident=None):
+        post = Post.objects.create(
+            title='Rising', content='...', author=self.users[0], incident=incident,
+            date_posted=timezone.now() - timedelta(hours=hours_ago),
+        )
+        for user in self.users[:likes]:
+            Like.objects.create(post=post, user=user)
+        return post
+
+    def scores(self, now):
+        state = TrendingState.objects.get()
+        return {trend.post_id: trending.current_score(trend.score, state, now) for trend in PostTrend.objects.all()}
+
+    def test_recent_engagement_ranks_first(self):
+        old = self.post(hours_ago=48, likes=4)
+        new = self.post(hours_ago=1, likes=1, incident=self.incident)
+        trending.refresh()
+
+        self.client.force_login(self.users[0])
+        response = self.client.get(reverse('blog-trending'))
+        self.assertEqual([post.id for post in response.context['posts']], [new.id, old.id])
+        self.assertEqual([incident.id for incident in response.context['incidents']], [self.incident.id])
+
+    def test_incremental_refresh_matches_full(self):
+        first = self.post(hours_ago=3, likes=1)
+        trending.refresh()
+        Like.objects.create(post=first, user=self.users[3])
+        second = self.post(hours_ago=2, likes=2)
+        Comment.objects.create(post=second, author=self.users[1], content='...')
+        now = timezone.now()
+        self.assertEqual(trending.refresh(now=now), (2, 0))
+        incremental = self.scores(now)
+
+        trending.refresh(full=True, now=now + timedelta(minutes=1))
+        for post_id, score in self.scores(now).items():
+            self.assertAlmostEqual(incremental[post_id], score, places=6)
+
+    def test_rebase_keeps_current_scores(self):
+        self.post(hours_ago=1, likes=2)
+        now = timezone.now()
+        trending.refresh(now=now)
+        later = now + trending.HALF_LIFE * 2
+        state = TrendingState.objects.get()
+        expected = {trend.post_id: trending.current_score(trend.score, state, later) for trend in PostTrend.objects.all()}
+
+        with mock.patch.object(trending, 'REBASE_AFTER', 1):
+            trending.refresh(now=later)
+
+        state = TrendingState.objects.get()
+        self.assertEqual(state.epoch, later)
+        for trend in PostTrend.objects.all():
+            self.assertAlmostEqual(trending.current_score(trend.score, state, later), expected[trend.post_id])
+
+    def test_decayed_scores_are_dropped(self):
+        self.post(hours_ago=1)
+        trending.refresh()
+        trending.refresh(now=timezone.now() + trending.HALF_LIFE * 20)
+        self.assertFalse(PostTrend.objects.exists())
@@ -0,0 +1,115 @@
+"""
+Trending posts and incidents, ranked by time-decayed engagement.
+
+Each post, comment and like adds its weight in WEIGHTS to the score of
+the post it belongs to and of that post's incident, and its contribution
+halves every HALF_LIFE. Scores are stored forward decayed: an event at
+time t adds weight * 2 ** ((t - epoch) / HALF_LIFE) for the epoch in
+TrendingState. Stored scores then never need decaying, and ordering by
+them is ordering by the current scores, so the trending view reads the
+top of an index. Every REBASE_AFTER half-lives the epoch moves to the
+present and the scores are scaled down to match, long before they could
+overflow a float.
+
+refresh(), run every few minutes by the refresh_trending command, adds
+the posts, comments and likes created since the last refresh, found by
+id. Likes and comments that are later removed keep counting until a full
+refresh, which recounts everything younger than MAX_AGE; run one daily.
+Scores that decay below MIN_SCORE are dropped.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import F, Max
+from django.utils import timezone
+
+from recap.transactions import atomic
+
+from .models import Comment, IncidentTrend, Like, Post, PostTrend, TrendingState
+
+HALF_LIFE = timedelta(hours=12)
+WEIGHTS = {'post': 4, 'comment': 2, 'like': 1}
+MIN_SCORE = 0.01
+# Older events add less than a millionth of their weight
+MAX_AGE = HALF_LIFE * 20
+REBASE_AFTER = 64
+
+# Kind of event, its model, the TrendingState field of the last one
+# counted, and the fields giving its post, incident and time
+SOURCES = [
+    ('post', Post, 'post_id', ['id', 'incident_id', 'date_posted']),
+    ('comment', Comment, 'comment_id', ['post_id', 'post__incident_id', 'date_posted']),
+    ('like', Like, 'like_id', ['post_id', 'post__incident_id', 'created_at']),
+]
+# Most ids in one IN list, below SQLite's limit on query parameters
+BATCH_SIZE = 500
+
+
+def growth(when, epoch):
+    """The factor scores have grown by from epoch to when"""
+    return 2 ** ((when - epoch) / HALF_LIFE)
+
+
+def current_score(score, state, now=None):
+    """A stored score as of now"""
+    return score / growth(now or timezone.now(), state.epoch)
+
+
+def refresh(full=False, now=None):
+    """Add the engagement since the last refresh to the scores, or recount them all if full
+
+    Returns the number of posts and incidents whose scores changed.
+    """
+    now = now or timezone.now()
+    with atomic(immediate=True):
+        state = TrendingState.objects.select_for_update().first()
+        if state is None or full:
+            PostTrend.objects.all().delete()
+            IncidentTrend.objects.all().delete()
+            state = state or TrendingState()
+            state.epoch = now
+            state.post_id = state.comment_id = state.like_id = 0
+        elif (now - state.epoch) / HALF_LIFE > REBASE_AFTER:
+            rebase(state, now)
+
+        post_scores, incident_scores = defaultdict(float), defaultdict(float)
+        for kind, model, last_field, fields in SOURCES:
+            last = model.objects.aggregate(last=Max('id'))['last'] or 0
+            rows = model.objects.filter(id__gt=getattr(state, last_field), id__lte=last)
+            if full:
+                rows = rows.filter(**{f'{fields[-1]}__gte': now - MAX_AGE})
+            for post_id, incident_id, when in rows.values_list(*fields).iterator():
+                added = WEIGHTS[kind] * growth(when, state.epoch)
+                post_scores[post_id] += added
+                if incident_id is not None:
+                    incident_scores[incident_id] += added
+            setattr(state, last_field, last)
+
+        add_scores(PostTrend, post_scores)
+        add_scores(IncidentTrend, incident_scores)
+        threshold = MIN_SCORE * growth(now, state.epoch)
+        PostTrend.objects.filter(score__lt=threshold).delete()
+        IncidentTrend.objects.filter(score__lt=threshold).delete()
+        state.refreshed_at = now
+        state.save()
+    return len(post_scores), len(incident_scores)
+
+
+def rebase(state, now):
+    """Move the epoch to now, scaling the scores down to match"""
+    factor = 1 / growth(now, state.epoch)
+    PostTrend.objects.update(score=F('score') * factor)
+    IncidentTrend.objects.update(score=F('score') * factor)
+    state.epoch = now
+
+
+def add_scores(model, scores):
+    """Add scores, {object id: amount}, to the rows of a Trend model, creating missing ones"""
+    key = model._meta.pk.attname
+    ids = list(scores)
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        existing = set(model.objects.filter(pk__in=batch).values_list('pk', flat=True))
+        for pk in existing:
+            model.objects.filter(pk=pk).update(score=F('score') + scores[pk])
+        model.objects.bulk_create([model(**{key: pk, 'score': scores[pk]}) for pk in batch if pk not in existing])
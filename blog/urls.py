@@ -5,10 +5,13 @@ urlpatterns = [
     path('', views.landing, name='landing'),
     path('blog/', views.home, name='blog-home'),
     path('about/', views.about, name='blog-about'),
+    path('trending/', views.trending, name='blog-trending'),
     path('post/<int:post_id>/', views.post, name='blog-post'),
     path('profile/<int:user_id>/', views.profile, name='blog-profile'),
     path('post/<int:post_id>/comment/', views.post, name='add-comment'),
     path('like_post/', views.like_post, name='like-post'),
+    path('likes/', views.like_state, name='like-state'),
+    path('likes/batch/', views.like_batch, name='like-batch'),
     path('incident/<int:incident_id>/discussion/', views.incident_discussion, name='incident-discussion'),
     path('post/<int:post_id>/delete/', views.delete_post, name='delete-post'),
     path('comment/<int:comment_id>/delete/', views.delete_comment, name='delete-comment'),
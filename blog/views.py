@@ -1,21 +1,32 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from .models import Post, Like, Comment
+from .cache import liked_posts, likes_post
 from django.contrib.auth.models import User
 from .forms import PostForm, CommentForm, IncidentPostForm
 from users.forms import UserUpdateForm, ProfileUpdateForm
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import HttpResponseForbidden
+from recap.transactions import atomic
+from monitoring.http import JsonResponse
+from monitoring.prometheus import Counter
 import json
 from water_issues_dashboard.models import Incident
+from water_issues_dashboard import events
 from django.contrib import messages
+from django.urls import reverse
+
+def publish_new_post(post):
+    events.publish('post', {
+        'id': post.id,
+        'title': post.title,
+        'author': post.author.username,
+        'incident_id': post.incident_id,
+        'url': reverse('blog-post', args=[post.id]),
+    })
 
 @login_required
 def home(request):
-    posts = Post.objects.all().order_by('-date_posted')
-    if request.user.is_authenticated:
-        liked_post_ids = Like.objects.filter(user=request.user).values_list('post_id', flat=True)
-    else:
-        liked_post_ids = []
+    posts = Post.objects.with_like_counts().select_related('author__profile').order_by('-date_posted')
 
     if request.method == 'POST':
         form = PostForm(request.POST)
@@ -23,6 +34,7 @@ def home(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            publish_new_post(post)
             return redirect('blog-home')
     else:
         form = PostForm()
@@ -30,7 +42,7 @@ def home(request):
     context = {
         'posts': posts,
         'form': form,
-        'liked_post_ids': liked_post_ids,
+        'liked_post_ids': liked_posts(request.user),
     }
     return render(request, 'blog/home.html', context)
 
@@ -40,14 +52,9 @@ def about(request):
 
 @login_required
 def post(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all().order_by('-date_posted')
+    post = get_object_or_404(Post.objects.with_like_counts().select_related('author__profile'), id=post_id)
+    comments = post.comments.select_related('author').order_by('-date_posted')
     
-    is_liked = False
-    if request.user.is_authenticated:
-        if Like.objects.filter(post=post, user=request.user).exists():
-            is_liked = True
-
     if request.method == 'POST':
         comment_form = CommentForm(request.POST)
         if comment_form.is_valid():
@@ -63,14 +70,14 @@ def post(request, post_id):
         'post': post,
         'comments': comments,
         'comment_form': comment_form,
-        'is_liked': is_liked,
+        'is_liked': likes_post(request.user, post.id),
     }
     return render(request, 'blog/post.html', context)
 
 @login_required
 def profile(request, user_id):
     profile_user = get_object_or_404(User, id=user_id)
-    posts = Post.objects.filter(author=profile_user).order_by('-date_posted')
+    posts = Post.objects.filter(author=profile_user).select_related('author__profile').order_by('-date_posted')
     
     # Initialize forms with default values
     u_form = UserUpdateForm(instance=request.user)
@@ -97,6 +104,7 @@ def profile(request, user_id):
                 post = post_form.save(commit=False)
                 post.author = request.user
                 post.save()
+                publish_new_post(post)
                 messages.success(request, f'Your post has been created!')
                 return redirect('blog-profile', user_id=profile_user.id)
             # If invalid, post_form will contain errors and display them
@@ -113,32 +121,160 @@ def profile(request, user_id):
 def landing(request):
     return render(request, 'blog/landing.html', {'title': 'Welcome'})
 
-@login_required
-def like_post(request):
-    if request.method == 'POST':
-        data = json.loads(request.body)
-        post_id = data.get('post_id')
-        post = get_object_or_404(Post, id=post_id)
-        
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
+LIKE_TOGGLES = Counter('post_like_toggles', 'Posts liked and unliked', ['action'])
+
+def toggle_like(user, post_id):
+    """Like or unlike a post, returning the new liked state and like count"""
+    post = get_object_or_404(Post, id=post_id)
+
+    with atomic(immediate=True):
+        like, created = Like.objects.get_or_create(user=user, post=post)
 
         if not created:
             like.delete()
             liked = False
         else:
             liked = True
-        
-        return JsonResponse({'liked': liked, 'likes_count': post.number_of_likes})
+    LIKE_TOGGLES.labels(action='like' if liked else 'unlike').inc()
+
+    return liked, post.number_of_likes
+
+@login_required
+def like_post(request):
+    if request.method == 'POST':
+        data = json.loads(request.body)
+        liked, likes_count = toggle_like(request.user, data.get('post_id'))
+        return JsonResponse({'liked': liked, 'likes_count': likes_count})
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
+# Most posts a batch like request or like state request may name
+LIKE_BATCH_SIZE = 100
+LIKE_BATCH_ERROR = (
+    f'Expected {{"likes": [{{"post_id": int, "liked": bool}}, ...]}}, at most {LIKE_BATCH_SIZE} of them'
+)
+LIKE_STATE_ERROR = f'Expected at most {LIKE_BATCH_SIZE} integer post_id parameters'
+# Ids past this don't fit the database's 64-bit integers, and querying for
+# them raises OverflowError rather than finding nothing
+MAX_POST_ID = 2 ** 63 - 1
+
+def is_post_id(value):
+    return type(value) is int and 1 <= value <= MAX_POST_ID
+
+def like_states(user, post_ids):
+    """Whether user likes each of post_ids and its like count, in two queries
+
+    Returns {post id: {'liked': bool, 'likes_count': int}}, leaving out ids
+    of posts that don't exist.
+    """
+    counts = dict(Post.objects.filter(id__in=post_ids).with_like_counts().values_list('id', 'like_count'))
+    liked = set(Like.objects.filter(user=user, post_id__in=counts).values_list('post_id', flat=True))
+    return {post_id: {'liked': post_id in liked, 'likes_count': count} for post_id, count in counts.items()}
+
+def set_likes(user, likes):
+    """Like or unlike several posts in one transaction
+
+    likes maps post ids to whether user should like the post. Setting the
+    state rather than toggling it makes repeating a batch harmless. Likes
+    are created and deleted one at a time, so blog.signals sees each.
+    Returns like_states() of the posts that exist.
+    """
+    with atomic(immediate=True):
+        existing = set(Post.objects.filter(id__in=likes).values_list('id', flat=True))
+        already_liked = set(Like.objects.filter(user=user, post_id__in=existing).values_list('post_id', flat=True))
+        to_like = [post_id for post_id in existing if likes[post_id] and post_id not in already_liked]
+        to_unlike = [post_id for post_id in existing if not likes[post_id] and post_id in already_liked]
+        for post_id in to_like:
+            Like.objects.create(user=user, post_id=post_id)
+        if to_unlike:
+            Like.objects.filter(user=user, post_id__in=to_unlike).delete()
+    LIKE_TOGGLES.labels(action='like').inc(len(to_like))
+    LIKE_TOGGLES.labels(action='unlike').inc(len(to_unlike))
+    return like_states(user, existing)
+
+def parse_like_batch(body):
+    """{post id: liked} from a batch like request body, or None if it isn't valid
+
+    The body is {"likes": [{"post_id": 1, "liked": true}, ...]}; the last
+    entry for a post wins.
+    """
+    try:
+        entries = json.loads(body)['likes']
+    except (ValueError, TypeError, KeyError):
+        return None
+    if not isinstance(entries, list) or len(entries) > LIKE_BATCH_SIZE:
+        return None
+    likes = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            return None
+        post_id, liked = entry.get('post_id'), entry.get('liked')
+        if not is_post_id(post_id) or type(liked) is not bool:
+            return None
+        likes[post_id] = liked
+    return likes
+
+def parse_post_ids(query):
+    """The post_id parameters of a like state request, or None if they aren't valid"""
+    values = query.getlist('post_id')
+    if len(values) > LIKE_BATCH_SIZE:
+        return None
+    try:
+        post_ids = {int(value) for value in values}
+    except ValueError:
+        return None
+    return post_ids if all(map(is_post_id, post_ids)) else None
+
+def like_batch_response(likes, states):
+    return JsonResponse({
+        'posts': {str(post_id): state for post_id, state in states.items()},
+        'missing': sorted(set(likes) - set(states)),
+    })
+
+@login_required
+def like_batch(request):
+    """Apply a batch of likes and unlikes, returning each post's new state"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    likes = parse_like_batch(request.body)
+    if likes is None:
+        return JsonResponse({'error': LIKE_BATCH_ERROR}, status=400)
+    return like_batch_response(likes, set_likes(request.user, likes))
+
+@login_required
+def like_state(request):
+    """Whether the user likes each ?post_id= post, and its like count"""
+    post_ids = parse_post_ids(request.GET)
+    if post_ids is None:
+        return JsonResponse({'error': LIKE_STATE_ERROR}, status=400)
+    return like_batch_response(post_ids, like_states(request.user, post_ids))
+
+# Posts and incidents listed on the trending page
+TRENDING_COUNT = 10
+
+@login_required
+def trending(request):
+    """The posts and incidents with the highest scores from blog.trending"""
+    posts = (
+        Post.objects.filter(trend__isnull=False).with_like_counts()
+        .select_related('author__profile', 'incident').order_by('-trend__score')[:TRENDING_COUNT]
+    )
+    incidents = (
+        Incident.objects.filter(trend__isnull=False).select_related('activity')
+        .order_by('-trend__score')[:TRENDING_COUNT]
+    )
+    context = {
+        'title': 'Trending',
+        'posts': posts,
+        'incidents': incidents,
+        'liked_post_ids': liked_posts(request.user),
+    }
+    return render(request, 'blog/trending.html', context)
+
 @login_required
 def incident_discussion(request, incident_id):
-    incident = get_object_or_404(Incident, id=incident_id)
-    posts = incident.posts.all().order_by('-date_posted')
-    liked_post_ids = []
-    if request.user.is_authenticated:
-        liked_post_ids = Like.objects.filter(user=request.user, post__in=posts).values_list('post_id', flat=True)
+    incident = get_object_or_404(Incident.objects.select_related('activity'), id=incident_id)
+    posts = incident.posts.with_like_counts().select_related('author__profile').order_by('-date_posted')
 
     if request.method == 'POST':
         form = IncidentPostForm(request.POST)
@@ -147,6 +283,7 @@ def incident_discussion(request, incident_id):
             post.author = request.user
             post.incident = incident
             post.save()
+            publish_new_post(post)
             return redirect('incident-discussion', incident_id=incident.id)
     else:
         form = IncidentPostForm()
@@ -155,7 +292,7 @@ def incident_discussion(request, incident_id):
         'incident': incident,
         'posts': posts,
         'form': form,
-        'liked_post_ids': liked_post_ids
+        'liked_post_ids': liked_posts(request.user),
     }
     return render(request, 'blog/incident_discussion.html', context)
 
@@ -0,0 +1,53 @@
+from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import RequestProfile
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'query_count',
+                    'mode', 'trigger', 'user']
+    list_filter = ['view_name', 'mode', 'trigger']
+    search_fields = ['path']
+    date_hierarchy = 'created_at'
+    fields = ['created_at', 'method', 'path', 'view_name', 'user', 'status_code', 'mode', 'trigger',
+              'duration_ms', 'timings', 'query_count', 'download', 'profile', 'query_log']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view),
+                 name='monitoring_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        """The raw profile, to open with pstats, snakeviz or a flame graph tool"""
+        if not self.has_view_or_change_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(bytes(profile.data), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="{profile.filename}"'
+        return response
+
+    def download(self, obj):
+        return format_html(
+            '<a href="{}">{}</a>', reverse('admin:monitoring_requestprofile_download', args=[obj.pk]), obj.filename
+        )
+
+    def profile(self, obj):
+        return format_html('<pre>{}</pre>', obj.report)
+
+    def query_log(self, obj):
+        return format_html('<pre>{}</pre>', '\n\n'.join(
+            f"{query['ms']:.1f} ms  {query['sql']}" for query in obj.queries
+        ))
@@ -0,0 +1,27 @@
+"""
+Django template backend that times rendering for request metrics.
+
+Used in place of django.template.backends.django.DjangoTemplates. Only the
+top-level render is timed, so included templates aren't counted twice.
+"""
+from django.template import TemplateDoesNotExist
+from django.template.backends import django
+
+from .metrics import timed
+
+
+class Template(django.Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django.reraise(exc, self)
@@ -0,0 +1,11 @@
+from django import http
+
+from .metrics import timed
+
+
+class JsonResponse(http.JsonResponse):
+    """JsonResponse that counts encoding time in the request metrics"""
+
+    def __init__(self, *args, **kwargs):
+        with timed('json'):
+            super().__init__(*args, **kwargs)
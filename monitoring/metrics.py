@@ -0,0 +1,158 @@
+"""
+Per-request instrumentation, aggregated in-process by URL name.
+
+RequestMetricsMiddleware starts a RequestMetrics record for each request
+and makes it the active one for the request's context. Database queries,
+template rendering and JSON encoding add their time to the active record
+(see signals.py, backends.py and http.py), and when the response is ready
+the record is folded into a histogram per URL name. With no active record,
+as when REQUEST_METRICS_ENABLED is off, the hooks return immediately.
+
+Histograms keep counts in logarithmic buckets about 9% wide, so they use
+a bounded amount of memory and report percentiles to within a bucket.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+active_request = ContextVar('active_request', default=None)
+
+
+def enabled():
+    return getattr(settings, 'REQUEST_METRICS_ENABLED', False)
+
+
+class RequestMetrics:
+    """What one request spent its time on"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_name = None
+        self.queries = 0
+        self.timings = defaultdict(float)
+
+    def add(self, phase, seconds):
+        self.timings[phase] += seconds
+
+    def finish(self):
+        self.timings['total'] = time.perf_counter() - self.start
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to the active request's phase"""
+    metrics = active_request.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(phase, time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper counting queries and their time"""
+    metrics = active_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.add('db', time.perf_counter() - start)
+
+
+class Histogram:
+    GROWTH = 2 ** 0.125
+    PERCENTILES = [50, 90, 99]
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        # Bucket i holds values in (GROWTH ** (i - 1), GROWTH ** i]
+        index = math.ceil(math.log(value, self.GROWTH)) if value > 0 else None
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding the given percentile"""
+        rank = math.ceil(self.count * percent / 100)
+        seen = self.buckets.get(None, 0)
+        if seen >= rank:
+            return 0
+        for index in sorted(i for i in self.buckets if i is not None):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.GROWTH ** index, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'mean': self.total / self.count if self.count else 0,
+            **{f'p{p}': self.percentile(p) for p in self.PERCENTILES},
+            'max': self.max,
+        }
+
+
+# Histogram name -> how to read it from a request's metrics and response size
+SERIES = {
+    'total_ms': lambda metrics, size: metrics.timings['total'] * 1000,
+    'db_ms': lambda metrics, size: metrics.timings['db'] * 1000,
+    'queries': lambda metrics, size: metrics.queries,
+    'template_ms': lambda metrics, size: metrics.timings['template'] * 1000,
+    'json_ms': lambda metrics, size: metrics.timings['json'] * 1000,
+    'response_bytes': lambda metrics, size: size,
+}
+
+
+class Registry:
+    """Histograms of every series for each URL name"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.since = time.time()
+            self.views = defaultdict(lambda: {name: Histogram() for name in SERIES})
+
+    def record(self, view_name, metrics, size):
+        values = {name: read(metrics, size) for name, read in SERIES.items()}
+        if size is None:
+            # Streamed responses have no size up front
+            del values['response_bytes']
+        with self.lock:
+            histograms = self.views[view_name]
+            for name, value in values.items():
+                histograms[name].add(value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'since': self.since,
+                'views': {
+                    view_name: {
+                        'requests': histograms['total_ms'].count,
+                        **{name: histogram.summary() for name, histogram in histograms.items()},
+                    }
+                    for view_name, histograms in sorted(self.views.items())
+                },
+            }
+
+
+registry = Registry()
@@ -0,0 +1,123 @@
+import asyncio
+import random
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import reverse
+from django.utils.deprecation import MiddlewareMixin
+
+from . import profiling
+from .metrics import RequestMetrics, active_request, enabled, registry
+from .models import RequestProfile
+
+# Server-Timing metric name -> RequestMetrics phase
+SERVER_TIMING = [
+    ('tpl', 'template'),
+    ('json', 'json'),
+    ('total', 'total'),
+]
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+    """Time each request's queries, rendering and encoding
+
+    Adds a Server-Timing header to the response and records the request in
+    the metrics registry under its URL name. Put it first in MIDDLEWARE so
+    the time spent in the other middleware is included.
+    """
+
+    def __init__(self, get_response=None):
+        if not enabled():
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        request.metrics = RequestMetrics()
+        active_request.set(request.metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.view_name = request.resolver_match.view_name
+
+    def process_response(self, request, response):
+        metrics = getattr(request, 'metrics', None)
+        if metrics is None:
+            return response
+        active_request.set(None)
+        metrics.finish()
+
+        timings = [f'db;dur={metrics.timings["db"] * 1000:.1f};desc="{metrics.queries} queries"']
+        timings += [
+            f'{name};dur={metrics.timings[phase] * 1000:.1f}'
+            for name, phase in SERVER_TIMING if metrics.timings[phase]
+        ]
+        response['Server-Timing'] = ', '.join(timings)
+
+        size = None if response.streaming else len(response.content)
+        registry.record(metrics.view_name or '(unresolved)', metrics, size)
+        return response
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """Profile the requests staff ask for, and a sample of the rest
+
+    See profiling.py. Profiling starts once the view is known, so the
+    profile covers the view and the middleware after this one in
+    MIDDLEWARE; put it last.
+    """
+
+    def __init__(self, get_response=None):
+        if not profiling.enabled():
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        mode = request.GET.get('profile')
+        if mode in profiling.MODES and request.user.is_staff:
+            trigger = 'staff'
+        elif self.sampled(request):
+            trigger = 'sampled'
+            mode = getattr(settings, 'REQUEST_PROFILING_MODE', 'sample')
+        else:
+            return None
+        request.profile = profiling.ProfiledRequest(
+            mode, trigger, sample_all_threads=asyncio.iscoroutinefunction(view_func)
+        )
+        request.profile.begin()
+
+    def sampled(self, request):
+        rate = getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 0)
+        views = getattr(settings, 'REQUEST_PROFILING_VIEWS', [])
+        return rate and request.resolver_match.view_name in views and random.random() < rate
+
+    def process_response(self, request, response):
+        profile = getattr(request, 'profile', None)
+        if profile is None:
+            return response
+        profile.end()
+        # Don't let a second process_response save the profile again
+        del request.profile
+
+        metrics = getattr(request, 'metrics', None)
+        saved = RequestProfile.objects.create(
+            method=request.method,
+            path=request.get_full_path(),
+            view_name=request.resolver_match.view_name,
+            user=request.user if request.user.is_authenticated else None,
+            status_code=response.status_code,
+            mode=profile.profiler.mode,
+            trigger=profile.trigger,
+            duration_ms=profile.duration * 1000,
+            timings={phase: seconds * 1000 for phase, seconds in metrics.timings.items()} if metrics else {},
+            query_count=len(profile.queries),
+            queries=profile.queries,
+            report=profile.profiler.report(),
+            data=profile.profiler.data(),
+        )
+        self.prune()
+        if profile.trigger == 'staff':
+            response['X-Profile'] = reverse('admin:monitoring_requestprofile_change', args=[saved.pk])
+        return response
+
+    def prune(self):
+        keep = getattr(settings, 'REQUEST_PROFILING_KEEP', 500)
+        old = RequestProfile.objects.values_list('pk', flat=True)[keep:]
+        RequestProfile.objects.filter(pk__in=list(old)).delete()
@@ -0,0 +1,41 @@
+# Generated by Django 2.1 on 2026-10-19 08:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.TextField()),
+                ('view_name', models.CharField(db_index=True, max_length=200)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('mode', models.CharField(choices=[('cprofile', 'cProfile'), ('sample', 'Stack sampling')], max_length=20)),
+                ('trigger', models.CharField(choices=[('staff', 'Requested by staff'), ('sampled', 'Sampled')], max_length=20)),
+                ('duration_ms', models.FloatField()),
+                ('timings', jsonfield.fields.JSONField(default=dict)),
+                ('query_count', models.IntegerField(default=0)),
+                ('queries', jsonfield.fields.JSONField(default=list)),
+                ('report', models.TextField()),
+                ('data', models.BinaryField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.db import models
+from jsonfield import JSONField
+
+
+class RequestProfile(models.Model):
+    """A profile of one request, taken by ProfilingMiddleware"""
+    MODE_CHOICES = [
+        ('cprofile', 'cProfile'),
+        ('sample', 'Stack sampling'),
+    ]
+    TRIGGER_CHOICES = [
+        ('staff', 'Requested by staff'),
+        ('sampled', 'Sampled'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.TextField()
+    view_name = models.CharField(max_length=200, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES)
+    trigger = models.CharField(max_length=20, choices=TRIGGER_CHOICES)
+    duration_ms = models.FloatField()
+    timings = JSONField(default=dict)  # Milliseconds by phase, from the request metrics
+    query_count = models.IntegerField(default=0)
+    queries = JSONField(default=list)  # [{'sql': ..., 'ms': ...}]
+    report = models.TextField()  # The profile, readable
+    data = models.BinaryField()  # The profile, for pstats or flame graph tools
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration_ms:.0f} ms)'
+
+    @property
+    def filename(self):
+        extension = 'prof' if self.mode == 'cprofile' else 'folded'
+        return f'request-profile-{self.pk}.{extension}'
@@ -0,0 +1,164 @@
+"""
+Profiles of individual requests, for finding where a slow request's time goes.
+
+ProfilingMiddleware profiles the requests that staff ask for with
+?profile=cprofile or ?profile=sample, plus a random
+REQUEST_PROFILING_SAMPLE_RATE of the requests to REQUEST_PROFILING_VIEWS.
+Each profile is saved as a RequestProfile along with the request's URL,
+timings and the SQL it ran, and can be read or downloaded in the admin.
+
+Two kinds of profile are taken:
+
+  cprofile  every function call, with cProfile. Exact but slows the
+            request down, so best for requests triggered by staff.
+  sample    the request thread's stack every REQUEST_PROFILING_INTERVAL
+            seconds. Cheap enough for sampled production traffic.
+
+Async views run on the event loop and hand their work to the thread pool,
+so they are always sampled, across every thread of the process.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+
+active_profile = ContextVar('active_profile', default=None)
+
+MODES = ['cprofile', 'sample']
+# Functions listed in a profile's report
+REPORT_LIMIT = 60
+
+
+def enabled():
+    return getattr(settings, 'REQUEST_PROFILING_ENABLED', False)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper logging queries to the active profile"""
+    profile = active_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries.append({'sql': sql, 'ms': round((time.perf_counter() - start) * 1000, 3)})
+
+
+class CallProfiler:
+    """cProfile for the calling thread"""
+
+    mode = 'cprofile'
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def report(self):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(REPORT_LIMIT)
+        return out.getvalue()
+
+    def data(self):
+        """The stats in the format of cProfile's dump_stats, for pstats or snakeviz"""
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
+
+
+class StackSampler:
+    """Samples the stack of one thread, or of every thread, from a thread of its own"""
+
+    mode = 'sample'
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frames = {self.thread_id: frames[self.thread_id]} if self.thread_id in frames else {}
+            for thread_id, frame in frames.items():
+                if thread_id != own_id:
+                    self.stacks[self.stack(frame)] += 1
+            self.samples += 1
+
+    @staticmethod
+    def stack(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return tuple(reversed(names))
+
+    def report(self):
+        """The functions seen most often, on top of the stack and anywhere in it"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        lines = [f'{self.samples} samples every {self.interval * 1000:g} ms', '']
+        for title, counts in [('Self', own), ('Inclusive', total)]:
+            lines.append(f'{title:>9} samples  function')
+            lines += [f'{count:>17}  {name}' for name, count in counts.most_common(REPORT_LIMIT // 2)]
+            lines.append('')
+        return '\n'.join(lines)
+
+    def data(self):
+        """Folded stacks, one 'outer;...;inner count' line each, for flame graph tools"""
+        return ''.join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common()
+        ).encode()
+
+
+class ProfiledRequest:
+    """The profiler and query log of a request being profiled"""
+
+    def __init__(self, mode, trigger, sample_all_threads=False):
+        if mode == 'cprofile' and not sample_all_threads:
+            self.profiler = CallProfiler()
+        else:
+            interval = getattr(settings, 'REQUEST_PROFILING_INTERVAL', 0.005)
+            thread_id = None if sample_all_threads else threading.get_ident()
+            self.profiler = StackSampler(thread_id, interval)
+        self.trigger = trigger
+        self.queries = []
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def begin(self):
+        active_profile.set(self)
+        self.profiler.start()
+
+    def end(self):
+        self.profiler.stop()
+        self.duration = time.perf_counter() - self.start
+        active_profile.set(None)
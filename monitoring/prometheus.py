@@ -0,0 +1,362 @@
+"""
+Counters and histograms exported in the Prometheus text format.
+
+Metrics are declared once at import time and updated from any thread:
+
+    UPLOADS = Counter('geojson_uploads', 'GeoJSON files processed', ['result'])
+    UPLOADS.labels(result='ok').inc()
+
+Each process keeps its values in memory and a background thread writes
+them to a file of its own in settings.METRICS_DIR every
+METRICS_FLUSH_INTERVAL seconds. /metrics adds up the files of every
+process, so the totals cover all the workers on the host, including ones
+that have exited.
+
+Files are named after the process id and the time the process started,
+so a process reusing the id of an exited one does not overwrite its
+values. Each process holds a lock on a file of its own for as long as it
+runs; a scrape that can take the lock of a process knows it has exited,
+adds its values to exited.json and deletes its files. The directory
+therefore holds about one file per running process, and the totals only
+start again from zero if it is emptied.
+
+A process started by fork begins with empty values, since what its parent
+recorded is in the parent's file.
+
+The locks are flock() locks, or msvcrt ones on Windows; either is released
+by the operating system when the process holding it exits.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    import msvcrt
+    fcntl = None
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))  # 1 KiB to 64 MiB
+
+# Values of the processes that have exited, added up
+EXITED = 'exited.json'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+        self.pid = None
+        self.name = None
+        self.directory = None
+        self.lock_file = None
+        self.dirty = False
+        self.flush_lock = threading.Lock()
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+
+    def add(self, *updates):
+        """Apply (key, amount) updates together, so a scrape sees all or none"""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.start_process()
+            for key, amount in updates:
+                self.values[key] += amount
+            self.dirty = True
+
+    def start_process(self):
+        """Start over in a new process, with a file and a flusher thread of its own"""
+        self.pid = os.getpid()
+        self.name = f'{self.pid}-{time.time_ns()}'
+        self.values.clear()
+        self.hold_lock_file()
+        threading.Thread(target=self.flush_periodically, name='metrics-flush', daemon=True).start()
+
+    def hold_lock_file(self):
+        """Lock a file in METRICS_DIR for as long as the process runs, telling scrapes it has not exited"""
+        if self.lock_file is not None:
+            # Inherited from the parent, which goes on holding its lock, or
+            # left in an earlier METRICS_DIR
+            self.lock_file.close()
+        self.directory = settings.METRICS_DIR
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.lock_file = open(os.path.join(self.directory, f'{self.name}.lock'), 'w')
+        lock(self.lock_file)
+
+    def stop(self):
+        """Stop writing values to METRICS_DIR, until more are recorded"""
+        with self.lock:
+            self.pid = None
+            if self.lock_file is not None:
+                self.lock_file.close()
+                self.lock_file = None
+
+    def flush_periodically(self):
+        pid = os.getpid()
+        while self.pid == pid:
+            time.sleep(getattr(settings, 'METRICS_FLUSH_INTERVAL', 1))
+            self.flush()
+
+    def flush(self):
+        """Write this process's values to its file in METRICS_DIR"""
+        with self.flush_lock:
+            with self.lock:
+                if self.pid != os.getpid():
+                    return
+                if self.directory != settings.METRICS_DIR or not os.path.exists(self.lock_file.name):
+                    # Moved or emptied since, so the values are written again
+                    self.hold_lock_file()
+                    self.dirty = True
+                if not self.dirty:
+                    return
+                samples = [[*key, value] for key, value in self.values.items()]
+                self.dirty = False
+            write_samples(os.path.join(self.directory, f'{self.name}.json'), samples)
+
+    def collect(self):
+        """Sum the values recorded by every process, folding those of exited ones into exited.json"""
+        self.flush()
+        totals = defaultdict(float)
+        exited = defaultdict(float)
+        if not os.path.isdir(settings.METRICS_DIR):
+            return totals
+        # One scrape at a time, so exited processes are folded in only once
+        with open(os.path.join(settings.METRICS_DIR, 'scrape.lock'), 'w') as scrape_lock:
+            lock(scrape_lock)
+            finished = []
+            for filename in sorted(os.listdir(settings.METRICS_DIR)):
+                if not filename.endswith('.json'):
+                    continue
+                base = os.path.join(settings.METRICS_DIR, filename[:-len('.json')])
+                samples = read_samples(f'{base}.json')
+                if filename != EXITED and not is_running(f'{base}.lock'):
+                    finished.append(base)
+                    add_samples(exited, samples)
+                add_samples(totals, samples)
+
+            if finished:
+                add_samples(exited, read_samples(os.path.join(settings.METRICS_DIR, EXITED)))
+                write_samples(
+                    os.path.join(settings.METRICS_DIR, EXITED),
+                    [[*key, value] for key, value in exited.items()],
+                )
+                for base in finished:
+                    os.remove(f'{base}.json')
+                    os.remove(f'{base}.lock')
+        return totals
+
+    def exposition(self):
+        """Every metric in the Prometheus text format"""
+        totals = self.collect()
+        by_metric = defaultdict(list)
+        for (name, suffix, labels), value in totals.items():
+            by_metric[name].append((suffix, labels, value))
+
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {metric.family} {metric.documentation}')
+            lines.append(f'# TYPE {metric.family} {metric.type}')
+            lines.extend(metric.samples(sorted(by_metric[name])))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def read_samples(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # Not written yet, or the process exited halfway through the first
+        # write (later ones replace the file whole)
+        return []
+
+
+def write_samples(path, samples):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(samples, f)
+    os.replace(path + '.tmp', path)
+
+
+def add_samples(totals, samples):
+    for name, suffix, labels, value in samples:
+        totals[name, suffix, tuple(map(tuple, labels))] += value
+
+
+def lock(f, blocking=True):
+    """Lock an open file exclusively, raising BlockingIOError if it is held and blocking is False"""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        return
+    # msvcrt.locking locks bytes from the current position, and its
+    # blocking mode gives up after ten seconds
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            if not blocking:
+                raise BlockingIOError(f'{f.name} is locked') from None
+            time.sleep(0.05)
+
+
+def is_running(lock_path):
+    """Whether the process that owns lock_path still holds its lock"""
+    try:
+        f = open(lock_path, 'a')
+    except OSError:
+        return False
+    with f:
+        try:
+            lock(f, blocking=False)
+        except BlockingIOError:
+            return True
+    return False
+
+
+def format_sample(name, labels, value):
+    if labels:
+        label_text = ','.join(
+            '{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+            for k, v in labels
+        )
+        name = f'{name}{{{label_text}}}'
+    return f'{name} {format_value(value)}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    type = None
+
+    @property
+    def family(self):
+        """The name the metric is exported under"""
+        return self.name
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        registry.register(self)
+
+    def labels(self, **labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes the labels {", ".join(self.labelnames)}')
+        return self.child(tuple((name, str(labels[name])) for name in self.labelnames))
+
+    def child(self, labels):
+        raise NotImplementedError
+
+    def unlabelled(self):
+        # Metrics without labels are updated directly
+        if self.labelnames:
+            raise ValueError(f'{self.name} takes the labels {", ".join(self.labelnames)}')
+        return self.child(())
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    @property
+    def family(self):
+        return f'{self.name}_total'
+
+    def child(self, labels):
+        return CounterChild(self, labels)
+
+    def inc(self, amount=1):
+        self.unlabelled().inc(amount)
+
+    def samples(self, values):
+        if not values and not self.labelnames:
+            values = [('', (), 0)]
+        for suffix, labels, value in values:
+            yield format_sample(self.family, labels, value)
+
+
+class CounterChild:
+    def __init__(self, metric, labels):
+        self.metric = metric
+        self.labels = labels
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError('Counters can only go up')
+        self.metric.registry.add(((self.metric.name, '', self.labels), amount))
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def child(self, labels):
+        return HistogramChild(self, labels)
+
+    def observe(self, value):
+        self.unlabelled().observe(value)
+
+    def time(self):
+        return self.unlabelled().time()
+
+    def samples(self, values):
+        series = defaultdict(dict)
+        if not self.labelnames:
+            series[()] = {}
+        for suffix, labels, value in values:
+            series[labels][suffix] = value
+        for labels, values in series.items():
+            # Buckets are stored individually and exported cumulatively
+            cumulative = 0
+            for bound in self.buckets:
+                cumulative += values.get(f'bucket:{bound}', 0)
+                yield format_sample(f'{self.name}_bucket', labels + (('le', format_value(bound)),), cumulative)
+            yield format_sample(f'{self.name}_sum', labels, values.get('sum', 0))
+            yield format_sample(f'{self.name}_count', labels, values.get('count', 0))
+
+
+class HistogramChild:
+    def __init__(self, metric, labels):
+        self.metric = metric
+        self.labels = labels
+
+    def observe(self, value):
+        bound = next(b for b in self.metric.buckets if value <= b)
+        name = self.metric.name
+        self.metric.registry.add(
+            ((name, f'bucket:{bound}', self.labels), 1),
+            ((name, 'sum', self.labels), value),
+            ((name, 'count', self.labels), 1),
+        )
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
@@ -0,0 +1,15 @@
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from . import metrics, profiling, slow_queries
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Connections are reused across requests, so the wrappers stay installed
+    # and look up the active request each time
+    for module in [metrics, profiling]:
+        if module.enabled() and module.record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(module.record_query)
+    # Outermost, so the time spent on EXPLAIN isn't counted as the query's
+    if slow_queries.enabled() and slow_queries.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_queries.record_query)
@@ -0,0 +1,146 @@
+"""
+Log of the SQL statements that take longer than SLOW_QUERY_THRESHOLD_MS.
+
+record_query, a database execute wrapper installed by signals.py, times
+every statement. For one over the threshold it keeps:
+
+  sql         the statement with its parameter lists collapsed, so repeats
+              of the same query group together
+  params      the types of the parameters, as "int, str x3"
+  view        the URL name of the request that ran it, if any
+  call_site   the innermost line of this project's code that ran it
+  plan        EXPLAIN QUERY PLAN (or the backend's EXPLAIN) of a SELECT
+
+Entries go into a ring buffer of the last SLOW_QUERY_LOG_SIZE in each
+process, served to staff at /monitoring/slow-queries/, and are appended
+as JSON lines to SLOW_QUERY_LOG_FILE when it is set.
+"""
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from collections import deque
+
+from django.conf import settings
+from django.utils import timezone
+
+from .metrics import active_request
+
+# Code that runs queries on behalf of the project's code, skipped when
+# looking for the call site
+IGNORED_PATHS = [os.path.dirname(os.path.abspath(__file__)), os.sep + 'site-packages' + os.sep]
+PLACEHOLDER_LIST = re.compile(r'%s(?:, %s)+')
+
+_entries = deque(maxlen=getattr(settings, 'SLOW_QUERY_LOG_SIZE', 200))
+_file_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None) is not None
+
+
+def normalize(sql):
+    """The statement with runs of placeholders, as in IN lists, collapsed"""
+    return PLACEHOLDER_LIST.sub('%s, ...', sql)
+
+
+def params_shape(params, many):
+    if many:
+        params = next(iter(params), ())
+    if not params:
+        return ''
+    runs = []
+    for param in params:
+        name = type(param).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return ', '.join(name if count == 1 else f'{name} x{count}' for name, count in runs)
+
+
+def call_site():
+    """file:line in function of the innermost project frame running the query"""
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(settings.BASE_DIR) and not any(p in frame.filename for p in IGNORED_PATHS):
+            return f'{os.path.relpath(frame.filename, settings.BASE_DIR)}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def explain(connection, sql, params):
+    """The query plan of a SELECT, one step per line"""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    # A bare backend cursor, so the plan neither disturbs the results of
+    # the query being logged nor goes through the execute wrappers
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except Exception as e:
+        return f'EXPLAIN failed: {e}'
+    finally:
+        cursor.close()
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper logging statements slower than the threshold"""
+    # Read once, as the setting can be changed, or set to None, meanwhile
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+    if threshold is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        if elapsed >= threshold:
+            metrics = active_request.get()
+            record({
+                'at': timezone.now().isoformat(timespec='milliseconds'),
+                'ms': round(elapsed, 3),
+                'sql': normalize(sql),
+                'params': params_shape(params, many),
+                'many': many,
+                'view': getattr(metrics, 'view_name', None),
+                'call_site': call_site(),
+                'plan': None if many else explain(context['connection'], sql, params),
+            })
+
+
+def record(entry):
+    _entries.append(entry)
+    path = getattr(settings, 'SLOW_QUERY_LOG_FILE', None)
+    if path:
+        with _file_lock, open(path, 'a') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+
+
+def recent():
+    """The entries in the ring buffer, newest first"""
+    return list(reversed(_entries))
+
+
+def summary():
+    """The ring buffer's entries grouped by statement and call site, slowest in total first"""
+    groups = {}
+    for entry in list(_entries):
+        group = groups.setdefault((entry['sql'], entry['call_site']), {
+            'sql': entry['sql'], 'call_site': entry['call_site'], 'views': set(),
+            'count': 0, 'total_ms': 0, 'max_ms': 0, 'plan': entry['plan'],
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['max_ms'] = max(group['max_ms'], entry['ms'])
+        if entry['view']:
+            group['views'].add(entry['view'])
+    return [
+        {**group, 'views': sorted(group['views'])}
+        for group in sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
+    ]
+
+
+def clear():
+    _entries.clear()
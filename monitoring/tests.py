@@ -0,0 +1,311 @@
+import json
+import marshal
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from blog.models import Post
+from recap.testing import NO_CACHES
+from . import prometheus, slow_queries
+from .metrics import Histogram, registry
+from .middleware import RequestMetricsMiddleware
+from .models import RequestProfile
+from .prometheus import Counter, Registry
+
+
+def parse_server_timing(header):
+    """Map each Server-Timing metric to its parameters"""
+    metrics = {}
+    for metric in header.split(', '):
+        name, *params = metric.split(';')
+        metrics[name] = dict(param.split('=', 1) for param in params)
+    return metrics
+
+
+def parse_exposition(text):
+    """Map 'name{labels}' to the value of every sample in a scrape"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            series, value = line.rsplit(' ', 1)
+            samples[series] = float(value)
+    return samples
+
+
+def increment_in_child(counter):
+    counter.inc(5)
+    counter.registry.flush()
+
+
+@override_settings(METRICS_TOKEN='scrape-token', CACHES=NO_CACHES)
+class PrometheusEndpointTests(TestCase):
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir)
+        settings_override = override_settings(METRICS_DIR=self.metrics_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('scraper', 'scraper@example.com', 'scraper-password')
+
+    def scrape(self, **extra):
+        extra.setdefault('HTTP_AUTHORIZATION', 'Bearer scrape-token')
+        response = self.client.get(reverse('metrics'), **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return parse_exposition(response.content.decode())
+
+    def test_scrape_counts_application_events(self):
+        post = Post.objects.create(title='Rising', content='...', author=self.user)
+        self.client.force_login(self.user)
+        before = self.scrape()
+
+        for _ in range(2):
+            self.client.post(reverse('like-post'), json.dumps({'post_id': post.id}), content_type='application/json')
+        self.client.get(reverse('water_issues_dashboard:api_search'), {'q': 'red'})
+        self.client.get(reverse('water_issues_dashboard:api_geojson'), {'type': 'parks'})
+        after = self.scrape()
+
+        def delta(series):
+            return after.get(series, 0) - before.get(series, 0)
+
+        self.assertEqual(delta('post_like_toggles_total{action="like"}'), 1)
+        self.assertEqual(delta('post_like_toggles_total{action="unlike"}'), 1)
+        self.assertEqual(delta('search_duration_seconds_count'), 1)
+        self.assertEqual(delta('geojson_payload_bytes_count{type="parks",format="geojson"}'), 1)
+        self.assertGreater(delta('geojson_payload_bytes_sum{type="parks",format="geojson"}'), 0)
+        self.assertEqual(delta('cache_lookups_total{namespace="search",result="miss"}'), 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('water_issues_dashboard:api_search'), {'q': 'red'})
+        samples = self.scrape()
+        for name in ['search_duration_seconds', 'geojson_upload_bytes']:
+            buckets = [
+                value for series, value in samples.items()
+                if re.match(rf'{name}_bucket\{{.*\}}$', series)
+            ]
+            self.assertEqual(buckets, sorted(buckets))
+            self.assertEqual(samples[f'{name}_bucket{{le="+Inf"}}'], samples[f'{name}_count'])
+
+    def test_values_from_other_processes_are_added_up(self):
+        registry = Registry()
+        self.addCleanup(registry.stop)
+        counter = Counter('test_events', 'Events counted by several processes', registry=registry)
+        counter.inc(2)
+        child = multiprocessing.get_context('fork').Process(target=increment_in_child, args=(counter,))
+        child.start()
+        child.join()
+        self.assertEqual(child.exitcode, 0)
+
+        self.assertIn('test_events_total 7', registry.exposition().splitlines())
+        # The exited child's file was folded into exited.json
+        self.assertFalse([name for name in os.listdir(self.metrics_dir) if name.startswith(f'{child.pid}-')])
+        self.assertIn('test_events_total 7', registry.exposition().splitlines())
+
+    def test_exited_process_with_the_same_pid(self):
+        registry = Registry()
+        self.addCleanup(registry.stop)
+        counter = Counter('test_restarts', 'Events counted before and after a restart', registry=registry)
+        counter.inc(3)
+        # Left by an earlier process that had the same id
+        with open(os.path.join(self.metrics_dir, f'{os.getpid()}-1.json'), 'w') as f:
+            json.dump([['test_restarts', '', [], 4]], f)
+
+        self.assertIn('test_restarts_total 7', registry.exposition().splitlines())
+        self.assertFalse(os.path.exists(os.path.join(self.metrics_dir, f'{os.getpid()}-1.json')))
+        counter.inc()
+        self.assertIn('test_restarts_total 8', registry.exposition().splitlines())
+
+    def test_windows_locks(self):
+        held = set()
+
+        def locking(fd, mode, size):
+            # Stands in for msvcrt.locking, with the lock held by another process
+            if os.fstat(fd).st_ino in held:
+                raise PermissionError('Locked by another process')
+
+        lock_path = os.path.join(self.metrics_dir, 'other.lock')
+        open(lock_path, 'w').close()
+        msvcrt = mock.Mock(locking=locking, LK_NBLCK=2)
+        with mock.patch.object(prometheus, 'fcntl', None), mock.patch.object(prometheus, 'msvcrt', msvcrt, create=True):
+            self.assertFalse(prometheus.is_running(lock_path))
+            held.add(os.stat(lock_path).st_ino)
+            self.assertTrue(prometheus.is_running(lock_path))
+
+    def test_scrape_is_refused_to_anonymous_clients(self):
+        # Even from the loopback address, as behind a reverse proxy
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.scrape(HTTP_AUTHORIZATION='')
+
+    def test_scrape_with_wrong_token(self):
+        for authorization in ['Bearer other-token', 'scrape-token', 'Bearer scrape-token\u00e9']:
+            with self.subTest(authorization=authorization):
+                response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION=authorization)
+                self.assertEqual(response.status_code, 403)
+        with self.settings(METRICS_TOKEN=None):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer None')
+            self.assertEqual(response.status_code, 403)
+
+
+class HistogramTests(SimpleTestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.add(value)
+        # Each is the top of the bucket, about 9% wide, holding the value
+        self.assertEqual(histogram.percentile(50), Histogram.GROWTH ** 46)
+        self.assertTrue(50 <= histogram.percentile(50) < 50 * Histogram.GROWTH)
+        self.assertTrue(90 <= histogram.percentile(90) < 90 * Histogram.GROWTH)
+        # No higher than the largest value
+        self.assertEqual(histogram.percentile(99), 100)
+        self.assertEqual(histogram.summary(), {
+            'mean': 50.5, 'p50': histogram.percentile(50), 'p90': histogram.percentile(90), 'p99': 100, 'max': 100,
+        })
+
+    def test_zeros(self):
+        histogram = Histogram()
+        for value in [0, 0, 0, 10]:
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(50), 0)
+        self.assertEqual(histogram.percentile(75), 0)
+        self.assertEqual(histogram.percentile(99), 10)
+        self.assertEqual(Histogram().summary(), {'mean': 0, 'p50': 0, 'p90': 0, 'p99': 0, 'max': 0})
+
+
+@override_settings(CACHES=NO_CACHES)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'reader-password')
+        self.client.force_login(self.user)
+
+    def test_server_timing(self):
+        Post.objects.create(title='Rising', content='...', author=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog-home'))
+
+        timing = parse_server_timing(response['Server-Timing'])
+        self.assertEqual(timing['db']['desc'], f'"{len(queries)} queries"')
+        self.assertGreater(float(timing['tpl']['dur']), 0)
+        self.assertGreaterEqual(float(timing['total']['dur']), float(timing['db']['dur']))
+
+    def test_recorded_by_view(self):
+        for _ in range(2):
+            response = self.client.get(reverse('blog-home'))
+        queries = int(parse_server_timing(response['Server-Timing'])['db']['desc'].strip('"').split()[0])
+
+        self.user.is_staff = True
+        self.user.save()
+        views = self.client.get(reverse('monitoring:request-metrics')).json()['views']
+        home = views['blog-home']
+        self.assertEqual(home['requests'], 2)
+        self.assertEqual(home['queries']['max'], queries)
+        self.assertEqual(home['response_bytes']['max'], len(response.content))
+        self.assertLessEqual(home['total_ms']['p50'], home['total_ms']['max'] * Histogram.GROWTH)
+
+    def test_report_is_staff_only(self):
+        url = reverse('monitoring:request-metrics')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    @override_settings(REQUEST_METRICS_ENABLED=False)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            RequestMetricsMiddleware()
+        # The middleware is left out of the chain built for this request
+        response = self.client.get(reverse('blog-home'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(registry.snapshot()['views'], {})
+
+
+@override_settings(CACHES=NO_CACHES)
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('profiler', 'profiler@example.com', 'profiler-password', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_staff_request_is_profiled_with_its_queries(self):
+        response = self.client.get(reverse('water_issues_dashboard:home'), {'profile': 'cprofile'})
+
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile'], reverse('admin:monitoring_requestprofile_change', args=[profile.pk]))
+        self.assertEqual((profile.mode, profile.trigger), ('cprofile', 'staff'))
+        self.assertEqual(profile.view_name, 'water_issues_dashboard:home')
+        self.assertIn('dashboard_home', profile.report)
+        self.assertEqual(profile.query_count, len(profile.queries))
+        self.assertTrue(any('water_issues_dashboard_municipality' in query['sql'] for query in profile.queries))
+
+        self.user.is_superuser = True
+        self.user.save()
+        response = self.client.get(reverse('admin:monitoring_requestprofile_download', args=[profile.pk]))
+        stats = marshal.loads(response.content)
+        self.assertTrue(any(function == 'dashboard_home' for _, _, function in stats))
+
+    def test_other_users_cannot_ask_for_a_profile(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.client.get(reverse('water_issues_dashboard:home'), {'profile': 'cprofile'})
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(REQUEST_PROFILING_SAMPLE_RATE=1, REQUEST_PROFILING_INTERVAL=0.001)
+    def test_sampled_requests_are_profiled(self):
+        self.client.get(reverse('water_issues_dashboard:api_geojson'))
+        self.client.get(reverse('blog-about'))
+
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.mode, profile.trigger), ('sample', 'sampled'))
+        self.assertEqual(profile.view_name, 'water_issues_dashboard:api_geojson')
+        self.assertIn('samples every 1 ms', profile.report)
+
+
+@override_settings(CACHES=NO_CACHES, SLOW_QUERY_THRESHOLD_MS=0)
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        slow_queries.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'reader-password', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_slow_queries_are_logged_with_their_plans(self):
+        Post.objects.create(title='Rising', content='...', author=self.user)
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as log_file:
+            with self.settings(SLOW_QUERY_LOG_FILE=log_file.name):
+                self.client.get(reverse('blog-home'))
+            logged = [json.loads(line) for line in log_file]
+
+        feed = next(entry for entry in slow_queries.recent() if 'FROM "blog_post"' in entry['sql'])
+        self.assertEqual(feed['view'], 'blog-home')
+        self.assertRegex(feed['call_site'], r'^blog/views\.py:\d+ in home$')
+        self.assertIn('blog_post', feed['plan'])
+        # An aware time, in UTC
+        self.assertTrue(feed['at'].endswith('+00:00'), feed['at'])
+        self.assertIn(feed, logged)
+
+        statements = self.client.get(reverse('monitoring:slow-queries')).json()['statements']
+        self.assertIn(feed['sql'], [statement['sql'] for statement in statements])
+
+    def test_parameter_lists_are_collapsed(self):
+        list(Post.objects.filter(pk__in=[1, 2, 3], title='Rising'))
+        entry = slow_queries.recent()[0]
+        self.assertIn('IN (%s, ...)', entry['sql'])
+        self.assertEqual(entry['params'], 'int x3, str')
+
+    def test_turned_off_while_installed(self):
+        slow_queries.clear()
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=None):
+            self.assertEqual(Post.objects.count(), 0)
+        self.assertEqual(slow_queries.recent(), [])
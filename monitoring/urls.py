@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'monitoring'
+
+urlpatterns = [
+    path('requests/', views.request_metrics, name='request-metrics'),
+    path('slow-queries/', views.slow_query_log, name='slow-queries'),
+]
@@ -0,0 +1,39 @@
+import hmac
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseForbidden
+
+from . import slow_queries
+from .http import JsonResponse
+from .metrics import registry
+from .prometheus import CONTENT_TYPE, REGISTRY
+
+
+@staff_member_required
+def request_metrics(request):
+    """Percentiles of each URL's timings, query counts and response sizes"""
+    return JsonResponse(registry.snapshot())
+
+
+@staff_member_required
+def slow_query_log(request):
+    """The statements slower than SLOW_QUERY_THRESHOLD_MS, grouped and as logged"""
+    return JsonResponse({
+        'threshold_ms': getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None),
+        'statements': slow_queries.summary(),
+        'recent': slow_queries.recent(),
+    })
+
+
+def prometheus_metrics(request):
+    """Counters and histograms of every worker process, for Prometheus to scrape
+
+    Open to staff and to scrapers sending METRICS_TOKEN as a bearer token.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    has_token = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    if not has_token and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.exposition(), content_type=CONTENT_TYPE)
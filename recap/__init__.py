@@ -0,0 +1,2 @@
+# Apply the SQLite PRAGMAs from settings to every new connection
+from . import db  # noqa
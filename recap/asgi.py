@@ -0,0 +1,67 @@
+"""
+ASGI config for recap project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.1 has no ASGI handler of its own. The JSON API endpoints listed in
+ASYNC_VIEWS are served by async views, and the live event stream is
+served directly on the event loop. Everything else goes through Django's
+WSGI handler on a bounded thread pool (see recap/handlers.py).
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+from django.urls import Resolver404, resolve
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recap.settings')
+
+django_application = get_wsgi_application()
+
+# Imported once the app registry is ready
+from blog import async_views as blog_async_views  # noqa: E402
+from water_issues_dashboard import async_views as dashboard_async_views  # noqa: E402
+from water_issues_dashboard.stream import event_stream  # noqa: E402
+from .handlers import AsyncViewHandler, PooledWsgiToAsgi  # noqa: E402
+
+ASYNC_VIEWS = {
+    'water_issues_dashboard:api_geojson': dashboard_async_views.api_geojson_data,
+    'water_issues_dashboard:api_search': dashboard_async_views.api_search,
+    'like-post': blog_async_views.like_post,
+    'like-batch': blog_async_views.like_batch,
+    'like-state': blog_async_views.like_state,
+}
+
+STREAM_VIEW = 'water_issues_dashboard:api_stream'
+
+wsgi_bridge = PooledWsgiToAsgi(django_application)
+async_view_handler = AsyncViewHandler()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    try:
+        match = resolve(scope['path'])
+    except Resolver404:
+        match = None
+
+    if match is not None and match.view_name == STREAM_VIEW:
+        await event_stream(scope, receive, send)
+    elif match is not None and match.view_name in ASYNC_VIEWS:
+        view = ASYNC_VIEWS[match.view_name]
+        await async_view_handler(scope, receive, send, view, match)
+    else:
+        await wsgi_bridge(scope, receive, send)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,50 @@
+"""
+Helpers for the async views served by recap/asgi.py.
+
+Django 2.1's ORM is synchronous, so async views hand their database work
+to a bounded thread pool instead of blocking the event loop. The same pool
+runs every other request through Django's WSGI handler (see
+recap/handlers.py), so ASGI_THREADS caps the number of requests touching
+the database at once.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+
+executor = ThreadPoolExecutor(max_workers=settings.ASGI_THREADS, thread_name_prefix='asgi')
+
+
+def call_with_fresh_connections(func, *args, **kwargs):
+    """Call func, closing the thread's unusable or expired connections before and after
+
+    A request's tasks run on whichever pool threads are free, so the
+    close_old_connections() that request_started and request_finished do
+    for a WSGI request can't be relied on to reach the connections a task
+    opened. This does it for every task instead.
+    """
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_threadpool(func, *args, **kwargs):
+    """Run a synchronous (usually ORM) callable on the bounded thread pool"""
+    return await sync_to_async(
+        call_with_fresh_connections, thread_sensitive=False, executor=executor
+    )(func, *args, **kwargs)
+
+
+def async_login_required(view):
+    """login_required for async views; request.user is already loaded by the handler"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
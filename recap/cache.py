@@ -0,0 +1,174 @@
+"""
+Two-tier cache for results that are expensive to compute.
+
+Lookups go to a small in-process LRU first (the 'local' cache) and then to
+a cache shared by every worker process on the host (the 'shared' cache,
+file based by default), so a result computed by one worker is reused by
+the others. Both tiers expire entries after a timeout and evict once they
+hold too many; see CACHES in settings.
+
+Keys belong to a Namespace with a version number kept in the shared tier
+for each database. Invalidating a namespace bumps the version, which
+changes every key in it for all processes; the old entries are left to
+expire. Each process keeps the version it read for VERSION_TTL, so a
+lookup answered by the local tier touches nothing shared, and an
+invalidation made by another process takes up to VERSION_TTL to be seen.
+
+A miss is computed only once: threads in a process wait on a lock for the
+same key, and processes take a short-lived lock entry in the shared tier
+while the others poll for the result. The cross-process lock is best
+effort, as it is only as atomic as the shared backend's add().
+"""
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.db import connection
+from monitoring.prometheus import Counter
+
+LOCAL_CACHE = 'local'
+SHARED_CACHE = 'shared'
+
+# How long a process may hold the lock to compute a value, and how often
+# the processes waiting for it check whether it has been stored
+LOCK_TIMEOUT = 30
+LOCK_POLL_INTERVAL = 0.05
+# Seconds a process reuses a namespace version before reading it again
+VERSION_TTL = 1
+
+# Exported at /metrics; result is the tier that had the value, or 'miss'
+CACHE_LOOKUPS = Counter('cache_lookups', 'Lookups in the two-tier cache', ['namespace', 'result'])
+
+_MISSING = object()
+# Version key -> (version, time.monotonic() when it was read)
+_versions = {}
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+@contextmanager
+def single_flight(key):
+    """Serialize the threads of this process that compute the same key"""
+    with _key_locks_guard:
+        lock, waiters = _key_locks.get(key, (None, 0))
+        lock = lock or threading.Lock()
+        _key_locks[key] = (lock, waiters + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _key_locks_guard:
+            lock, waiters = _key_locks[key]
+            if waiters == 1:
+                del _key_locks[key]
+            else:
+                _key_locks[key] = (lock, waiters - 1)
+
+
+def database_key():
+    """A short name for the database in use, for keys of values read from it
+
+    Processes using another database (such as the test runner's) then
+    don't share the values.
+    """
+    return hashlib.sha1(str(connection.settings_dict['NAME']).encode()).hexdigest()[:12]
+
+
+class Namespace:
+    """A group of cached values that are invalidated together"""
+
+    def __init__(self, name, timeout=300):
+        self.name = name
+        self.timeout = timeout
+
+    @property
+    def version_key(self):
+        return f'namespace:{database_key()}:{self.name}'
+
+    def version(self):
+        key = self.version_key
+        cached = _versions.get(key)
+        now = time.monotonic()
+        if cached is not None and now - cached[1] < VERSION_TTL:
+            return cached[0]
+        version = self._shared_version()
+        _versions[key] = (version, now)
+        return version
+
+    def _shared_version(self):
+        shared = caches[SHARED_CACHE]
+        version = shared.get(self.version_key)
+        if version is None:
+            # Start from the clock rather than 1, so a version evicted from
+            # the shared cache can't come back as one already used
+            initial = int(time.time() * 1000)
+            shared.add(self.version_key, initial, None)
+            # A cache that keeps nothing (such as DummyCache) returns the default
+            version = shared.get(self.version_key, initial)
+        return version
+
+    def invalidate(self):
+        version = max(self._shared_version() + 1, int(time.time() * 1000))
+        caches[SHARED_CACHE].set(self.version_key, version, None)
+        # Seen at once in this process
+        _versions[self.version_key] = (version, time.monotonic())
+
+    def key(self, *parts, version=None):
+        digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+        return f'{self.name}:{self.version() if version is None else version}:{digest}'
+
+    def get_or_compute(self, parts, compute, timeout=None, version=None):
+        """Return the value cached for key parts, computing it on a miss
+
+        Pass a version() read once to cache values derived from one another,
+        so an invalidation between the lookups can't file one made from the
+        old data under the new version.
+        """
+        key = self.key(*parts, version=version)
+        value, tier = self._get(key)
+        if value is _MISSING:
+            with single_flight(key):
+                # Another thread may have stored it while this one waited
+                value, tier = self._get(key)
+                if value is _MISSING:
+                    tier = 'miss'
+                    value = self._compute(key, compute, self.timeout if timeout is None else timeout)
+        CACHE_LOOKUPS.labels(namespace=self.name, result=tier).inc()
+        return value
+
+    def _get(self, key):
+        """Return the value cached for a key and the tier it was found in"""
+        local = caches[LOCAL_CACHE]
+        value = local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value, LOCAL_CACHE
+        value = caches[SHARED_CACHE].get(key, _MISSING)
+        if value is not _MISSING:
+            local.set(key, value, self.timeout)
+            return value, SHARED_CACHE
+        return _MISSING, None
+
+    def _compute(self, key, compute, timeout):
+        shared = caches[SHARED_CACHE]
+        lock_key = f'lock:{key}'
+        locked = shared.add(lock_key, True, LOCK_TIMEOUT)
+        if not locked:
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while time.monotonic() < deadline and shared.get(lock_key):
+                time.sleep(LOCK_POLL_INTERVAL)
+                value = shared.get(key, _MISSING)
+                if value is not _MISSING:
+                    caches[LOCAL_CACHE].set(key, value, timeout)
+                    return value
+            # The other process gave up or died; compute it here instead
+        try:
+            value = compute()
+            shared.set(key, value, timeout)
+            caches[LOCAL_CACHE].set(key, value, timeout)
+            return value
+        finally:
+            if locked:
+                shared.delete(lock_key)
@@ -0,0 +1,71 @@
+"""
+Responses compressed ahead of time rather than on every request.
+
+The project has no compression middleware. Large responses that many
+clients share, such as the map data, are compressed once per data
+version and the compressed bytes cached alongside the plain ones (see
+water_issues_dashboard.views.geojson_content). Static files are
+compressed when collectstatic runs (see recap/staticfiles.py).
+
+Brotli is used when the brotli package is installed, and gzip otherwise
+or for clients that don't accept it.
+"""
+import gzip
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller responses gain too little to be worth compressing
+MIN_SIZE = 1024
+# Brotli's top quality, 11, is only a few percent smaller and many times slower
+BROTLI_QUALITY = 9
+
+# Encoding -> (compress function, file suffix), in order of preference
+COMPRESSORS = {
+    **({'br': (lambda content: brotli.compress(content, quality=BROTLI_QUALITY), '.br')} if brotli else {}),
+    'gzip': (lambda content: gzip.compress(content, compresslevel=9, mtime=0), '.gz'),
+}
+
+
+def compress(content, encoding):
+    return COMPRESSORS[encoding][0](content)
+
+
+def preferred_encoding(accept_encoding, available=None):
+    """The most preferred encoding in COMPRESSORS a client's Accept-Encoding allows
+
+    Returns None if the client accepts none of them.
+    """
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if coding:
+            accepted[coding.lower()] = quality
+
+    for encoding in COMPRESSORS if available is None else [e for e in COMPRESSORS if e in available]:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def encoded_response(content, content_type, encoding=None):
+    """An HttpResponse of content already compressed with encoding, if any"""
+    response = HttpResponse(content, content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    # The content depends on Accept-Encoding whether or not it was compressed
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,21 @@
+"""
+Per-connection SQLite tuning.
+
+Every new SQLite connection gets the PRAGMAs in settings.SQLITE_PRAGMAS.
+With the write-ahead log, readers no longer block the writer or each other,
+and synchronous=NORMAL only syncs the log at checkpoints, which is still
+safe against corruption. busy_timeout makes a connection wait for a lock
+instead of failing straight away with "database is locked".
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
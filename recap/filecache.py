@@ -0,0 +1,49 @@
+"""
+File based cache shared by the processes on a host, kept private to them.
+
+Django's FileBasedCache, which this extends:
+
+  - unpickles whatever it finds in its directory, so anyone able to write
+    there could have their code run. This one refuses a directory owned
+    by another user or open to others, and creates a missing one with
+    mode 0700. Windows is left to the directory's access control list.
+  - lists the whole directory to count its entries before every write,
+    culling them once there are more than MAX_ENTRIES. This one counts
+    them at most every CULL_INTERVAL seconds in each process, so a
+    write costs the same however many entries there are, and the cache
+    may go past MAX_ENTRIES for that long.
+"""
+import os
+import stat
+import time
+
+from django.core.cache.backends import filebased
+from django.core.exceptions import ImproperlyConfigured
+
+CULL_INTERVAL = 60
+
+
+class FileBasedCache(filebased.FileBasedCache):
+    def __init__(self, dir, params):
+        self._checked_dir = False
+        self._next_cull = 0
+        super().__init__(dir, params)
+
+    def _createdir(self):
+        super()._createdir()
+        if self._checked_dir or not hasattr(os, 'getuid'):
+            # Windows has neither owners by uid nor mode bits to check
+            return
+        info = os.stat(self._dir)
+        if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+            raise ImproperlyConfigured(
+                f'The cache directory {self._dir} must belong to this user and be closed to others (chmod 700)'
+            )
+        self._checked_dir = True
+
+    def _cull(self):
+        now = time.monotonic()
+        if now < self._next_cull:
+            return
+        self._next_cull = now + CULL_INTERVAL
+        super()._cull()
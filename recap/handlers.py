@@ -0,0 +1,171 @@
+"""
+ASGI handlers used by recap/asgi.py.
+
+PooledWsgiToAsgi runs Django's WSGI handler on the bounded thread pool
+from recap/async_support.py. It buffers complete responses so the worker
+thread is released before the body goes out to a possibly slow client.
+
+AsyncViewHandler serves async views. It builds a WSGIRequest from the
+ASGI scope and applies the project's middleware through their
+process_request/process_view/process_response hooks, so every entry in
+settings.MIDDLEWARE must subclass MiddlewareMixin.
+"""
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from django.conf import settings
+from django.core import signals
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIRequest, get_script_name
+from django.urls import set_script_prefix, set_urlconf
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
+
+from .async_support import executor, run_in_threadpool
+
+
+class PooledWsgiToAsgi:
+    """Wraps a WSGI application to run on the bounded thread pool"""
+
+    def __init__(self, wsgi_application):
+        self.wsgi_application = wsgi_application
+
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiToAsgiInstance(self.wsgi_application)(scope, receive, send)
+
+
+class PooledWsgiToAsgiInstance(WsgiToAsgiInstance):
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await super().__call__(scope, receive, send)
+
+    async def run_wsgi_app(self, body):
+        content = await sync_to_async(
+            self.run_buffered, thread_sensitive=False, executor=executor
+        )(body)
+        if content is not None:
+            await self.send(self.response_start)
+            await self.send({'type': 'http.response.body', 'body': content})
+
+    def run_buffered(self, body):
+        """Run the WSGI app, returning the whole body when its length is known
+
+        Responses without a Content-Length (streamed files, for example) are
+        sent from the worker thread chunk by chunk instead, and None is returned.
+        """
+        environ = self.build_environ(self.scope, body)
+        result = self.wsgi_application(environ, self.start_response)
+        try:
+            if self.response_content_length is not None:
+                return b''.join(result)
+            self.response_started = True
+            self.sync_send(self.response_start)
+            for chunk in result:
+                self.sync_send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            self.sync_send({'type': 'http.response.body'})
+            return None
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+class AsyncViewHandler:
+    def __init__(self):
+        self.middleware = []
+        for middleware_path in settings.MIDDLEWARE:
+            middleware_class = import_string(middleware_path)
+            if not issubclass(middleware_class, MiddlewareMixin):
+                raise ImproperlyConfigured(
+                    f"{middleware_path} must subclass MiddlewareMixin to run in front of async views."
+                )
+            try:
+                self.middleware.append(middleware_class())
+            except MiddlewareNotUsed:
+                pass
+
+    async def __call__(self, scope, receive, send, view, match):
+        body = await read_body(receive)
+        request, response, applied = await run_in_threadpool(
+            self.start_request, scope, body, view, match
+        )
+        if response is None:
+            try:
+                response = await view(request, *match.args, **match.kwargs)
+            except Exception as exc:
+                response = await run_in_threadpool(response_for_exception, request, exc)
+        response = await run_in_threadpool(self.finish_request, request, response, applied)
+        try:
+            await send_response(response, send)
+        finally:
+            await run_in_threadpool(response.close)
+
+    def start_request(self, scope, body, view, match):
+        """Build the request and run the request-phase middleware hooks
+
+        Returns the request, a response if a middleware short-circuited
+        the view, and the middleware whose process_response should run.
+        """
+        adapter = WsgiToAsgiInstance(None)
+        adapter.scope = scope
+        environ = adapter.build_environ(scope, BytesIO(body))
+        set_script_prefix(get_script_name(environ))
+        set_urlconf(settings.ROOT_URLCONF)
+        # Paired with request_finished, sent when the response is closed
+        signals.request_started.send(sender=self.__class__, environ=environ)
+        request = WSGIRequest(environ)
+
+        applied = []
+        try:
+            for middleware in self.middleware:
+                applied.append(middleware)
+                response = middleware.process_request(request) if hasattr(middleware, 'process_request') else None
+                if response is not None:
+                    return request, response, applied
+            request.resolver_match = match
+            for middleware in self.middleware:
+                if hasattr(middleware, 'process_view'):
+                    response = middleware.process_view(request, view, match.args, match.kwargs)
+                    if response is not None:
+                        return request, response, applied
+
+            # Load the user now so the async view never queries for it on the loop
+            if hasattr(request, 'user'):
+                request.user.is_authenticated
+        except Exception as exc:
+            # As Django's handler does, the middleware that ran still get to
+            # process the error response
+            return request, response_for_exception(request, exc), applied
+        return request, None, applied
+
+    def finish_request(self, request, response, applied):
+        for middleware in reversed(applied):
+            if hasattr(middleware, 'process_response'):
+                try:
+                    response = middleware.process_response(request, response)
+                except Exception as exc:
+                    response = response_for_exception(request, exc)
+        return response
+
+
+async def read_body(receive):
+    body = BytesIO()
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return body.getvalue()
+
+
+async def send_response(response, send):
+    # Async views return regular (non-streaming) responses
+    headers = [
+        *((name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.items()),
+        *((b'set-cookie', c.output(header='').strip().encode('latin1')) for c in response.cookies.values()),
+    ]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response.content})
@@ -0,0 +1,204 @@
+"""
+Conservative JavaScript and CSS minifiers for the static files pipeline.
+
+Both only drop comments and whitespace; names and code are never
+rewritten. Strings, template literals and regular expressions are copied
+as they are, and any span the JavaScript scanner can't classify safely is
+copied verbatim rather than guessed at. Comments starting with /*! (as
+licenses do) are kept.
+"""
+import re
+
+WORD = re.compile(r'[\w$\\]|[^\x00-\x7f]')
+
+# Where a / starts a regular expression rather than a division
+REGEX_AFTER_CHARS = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_AFTER_WORDS = {
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw', 'case', 'do', 'else',
+    'yield', 'await',
+}
+# Where it could be either: "if (x) /re/" against "f(x) / 2"
+REGEX_OR_DIVISION_AFTER = set(')}')
+# A line break next to these can be dropped without changing where
+# semicolons are inserted automatically
+NEWLINE_SAFE_BEFORE = set('{;,([')
+NEWLINE_SAFE_AFTER = set('}),];')
+
+
+def is_word(char):
+    return bool(char) and bool(WORD.match(char))
+
+
+def _skip_string(text, i):
+    """Index after the string literal starting at text[i]"""
+    quote = text[i]
+    i += 1
+    while i < len(text):
+        if text[i] == '\\':
+            i += 2
+        elif text[i] == quote or text[i] == '\n':
+            return i + 1
+        else:
+            i += 1
+    return i
+
+
+def _skip_template(text, i):
+    """Index after the template literal starting at text[i], ${...} included"""
+    i += 1
+    while i < len(text):
+        if text[i] == '\\':
+            i += 2
+        elif text[i] == '`':
+            return i + 1
+        elif text.startswith('${', i):
+            i = _skip_braces(text, i + 2)
+        else:
+            i += 1
+    return i
+
+
+def _skip_braces(text, i):
+    """Index after the } closing a ${ expression, copied without minifying"""
+    depth = 1
+    while i < len(text) and depth:
+        char = text[i]
+        if char in '\'"':
+            i = _skip_string(text, i)
+        elif char == '`':
+            i = _skip_template(text, i)
+        else:
+            depth += {'{': 1, '}': -1}.get(char, 0)
+            i += 1
+    return i
+
+
+def _skip_regex(text, i):
+    """Index after the regular expression starting at text[i], or None if it isn't one"""
+    i += 1
+    in_class = False
+    while i < len(text):
+        char = text[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '\n':
+            return None
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            return i + 1
+        i += 1
+    return None
+
+
+def minify_js(text):
+    out = []
+    pending = None  # Whitespace skipped since the last token: ' ' or '\n'
+    i = 0
+
+    def emit(token):
+        nonlocal pending
+        prev = out[-1][-1] if out else ''
+        first = token[0]
+        if pending == '\n' and prev and prev not in NEWLINE_SAFE_BEFORE and first not in NEWLINE_SAFE_AFTER:
+            out.append('\n')
+        elif pending and (
+            is_word(prev) and (is_word(first) or first == '.' and prev.isdigit())
+            or prev in '+-' and first == prev
+        ):
+            out.append(' ')
+        pending = None
+        out.append(token)
+
+    while i < len(text):
+        char = text[i]
+        if char in ' \t\r\n\f\v\xa0\ufeff':
+            pending = '\n' if char == '\n' or pending == '\n' else ' '
+            i += 1
+        elif text.startswith('//', i):
+            end = text.find('\n', i)
+            i = len(text) if end == -1 else end
+            pending = pending or ' '
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            end = len(text) if end == -1 else end + 2
+            if text.startswith('/*!', i):
+                emit(text[i:end])
+            else:
+                pending = '\n' if '\n' in text[i:end] or pending == '\n' else ' '
+            i = end
+        elif char in '\'"':
+            end = _skip_string(text, i)
+            emit(text[i:end])
+            i = end
+        elif char == '`':
+            end = _skip_template(text, i)
+            emit(text[i:end])
+            i = end
+        elif char == '/':
+            last = out[-1] if out else ''
+            end = None
+            if not last or last[-1] in REGEX_AFTER_CHARS or last in REGEX_AFTER_WORDS:
+                end = _skip_regex(text, i)
+            elif last[-1] in REGEX_OR_DIVISION_AFTER:
+                # Copied up to the next / on the line, as a regular
+                # expression would be, which keeps a division intact too
+                end = _skip_regex(text, i)
+            end = end or i + 1
+            emit(text[i:end])
+            i = end
+        elif is_word(char):
+            end = i
+            while end < len(text) and is_word(text[end]):
+                end += 1
+            emit(text[i:end])
+            i = end
+        else:
+            emit(char)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+# Whitespace next to these is never needed in CSS. Space before a colon is
+# kept, as in a selector it separates a descendant ("a :hover").
+CSS_TIGHT_BEFORE = set('{};,>)')
+CSS_TIGHT_AFTER = set('{};,>:(')
+
+
+def minify_css(text):
+    out = []
+    pending = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char.isspace():
+            pending = True
+            i += 1
+            continue
+        if text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            end = len(text) if end == -1 else end + 2
+            if not text.startswith('/*!', i):
+                pending = True
+                i = end
+                continue
+            token = text[i:end]
+        elif char in '\'"':
+            end = _skip_string(text, i)
+            token = text[i:end]
+        else:
+            end = i + 1
+            token = char
+        prev = out[-1][-1] if out else ''
+        if token == '}' and prev == ';':
+            out.pop()
+            prev = out[-1][-1] if out else ''
+        if pending and prev and prev not in CSS_TIGHT_AFTER and token[0] not in CSS_TIGHT_BEFORE:
+            out.append(' ')
+        pending = False
+        out.append(token)
+        i = end
+    return ''.join(out) + '\n'
@@ -0,0 +1,16 @@
+"""
+Cached database sessions, written to the database in transactions that
+start with BEGIN IMMEDIATE (see recap/transactions.py), so a session
+save waits for another request's write instead of failing with
+"database is locked".
+"""
+from django.contrib.sessions.backends import cached_db
+from django.db import router
+
+from .transactions import atomic
+
+
+class SessionStore(cached_db.SessionStore):
+    def save(self, must_create=False):
+        with atomic(using=router.db_for_write(self.model), immediate=True):
+            super().save(must_create)
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'blog.apps.BlogConfig',
     'water_issues_dashboard.apps.WaterIssuesDashboardConfig',
     'users.apps.UsersConfig',
+    'monitoring.apps.MonitoringConfig',
     'crispy_forms'
 ]
 
@@ -51,6 +52,7 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 MIDDLEWARE = [
+    'monitoring.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,13 +60,15 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'monitoring.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'recap.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing each render for the request metrics
+        'BACKEND': 'monitoring.backends.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,17 +84,128 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'recap.wsgi.application'
 
+# Record query counts, timings and response sizes per URL name, reported at
+# /monitoring/requests/ (staff only) and in a Server-Timing header
+REQUEST_METRICS_ENABLED = True
+
+# Profile requests staff ask for with ?profile=cprofile or ?profile=sample,
+# and a random fraction of the requests to REQUEST_PROFILING_VIEWS, keeping
+# the latest REQUEST_PROFILING_KEEP in the admin (see monitoring/profiling.py)
+REQUEST_PROFILING_ENABLED = True
+REQUEST_PROFILING_SAMPLE_RATE = 0
+REQUEST_PROFILING_VIEWS = ['water_issues_dashboard:api_geojson', 'water_issues_dashboard:home']
+REQUEST_PROFILING_MODE = 'sample'
+REQUEST_PROFILING_INTERVAL = 0.005
+REQUEST_PROFILING_KEEP = 500
+
+# Log statements slower than this, with their query plans, at
+# /monitoring/slow-queries/ and in SLOW_QUERY_LOG_FILE if set (see
+# monitoring/slow_queries.py). None turns the log off.
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG_SIZE = 200
+SLOW_QUERY_LOG_FILE = None
+
+# Files the processes on a host share: the file based caches below, which
+# unpickle what they read, and the metrics. Only the user running the site
+# may write here; recap.filecache refuses a cache directory others can
+# open, and creates missing ones with mode 0700.
+RUNTIME_DIR = os.path.join(BASE_DIR, 'var')
+
+# Moves RUNTIME_DIR to a temporary directory for the length of a test run
+TEST_RUNNER = 'recap.testing.TestRunner'
+
+# Where each process writes the counters and histograms served at /metrics
+# (see monitoring/prometheus.py), and how often. Files of exited processes
+# are folded into one as /metrics is scraped.
+METRICS_DIR = os.path.join(RUNTIME_DIR, 'metrics')
+METRICS_FLUSH_INTERVAL = 1
+
+# Bearer token scrapers send to read /metrics without logging in as staff.
+# Unset, only staff can read it.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Size of the thread pool recap/asgi.py runs Django's synchronous code on
+ASGI_THREADS = 16
+
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3, able to begin write transactions that
+        # wait for the lock instead of failing, see recap/sqlite3/base.py
+        'ENGINE': 'recap.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections open between requests instead of reconnecting
+        'CONN_MAX_AGE': 600,
     }
 }
 
+# Applied to every new SQLite connection by recap/db.py
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative sizes are in KiB, so this is a 64 MB page cache
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+}
+
+
+# Caches
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# 'local' and 'shared' are the two tiers used by recap/cache.py: a small
+# per-process LRU in front of a file cache that every worker process on the
+# host reads. Blog templates cache a fragment or two per post and comment,
+# so they get a cache large enough to hold a long feed.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recap-local',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 200},
+    },
+    'shared': {
+        'BACKEND': 'recap.filecache.FileBasedCache',
+        'LOCATION': os.path.join(RUNTIME_DIR, 'cache'),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'sessions': {
+        'BACKEND': 'recap.filecache.FileBasedCache',
+        'LOCATION': os.path.join(RUNTIME_DIR, 'sessions'),
+        # Past this many sessions a third of them, picked at random, are
+        # dropped and read from the database again when next used. Counting
+        # them lists the directory, which recap.filecache does at most once
+        # a minute in each process rather than on every write.
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+# Sessions
+# https://docs.djangoproject.com/en/2.1/topics/http/sessions/
+# Almost every page needs the user, so almost every request loads its
+# session. Sessions are read from the sessions cache and written through
+# to the database, which is only read when a session isn't cached. The
+# cache is shared by the processes on a host, since a per-process one
+# would keep serving a session that another process logged out; with
+# more than one host, point it at memcached or Redis instead. Run
+# prune_sessions daily to delete expired sessions from the database.
+# recap.sessions is Django's cached_db engine, saving sessions in
+# transactions that take SQLite's write lock at BEGIN.
+SESSION_ENGINE = 'recap.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -129,6 +244,12 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 
 STATIC_URL = '/static/'
+# collectstatic writes hashed, minified and compressed copies of the files
+# here (see recap/staticfiles.py); serve them from here in production
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'recap.staticfiles.ManifestStaticFilesStorage'
+# How long browsers may keep a file whose name has a hash in it
+STATIC_HASHED_MAX_AGE = 365 * 24 * 60 * 60
 
 
 # ... at the bottom of the file
@@ -0,0 +1,25 @@
+"""
+SQLite database backend that can start a transaction with BEGIN IMMEDIATE.
+
+A deferred transaction that reads before it writes has to upgrade its lock
+part way through. If another connection has written in the meantime,
+SQLite fails that upgrade with "database is locked" straight away, without
+waiting out busy_timeout. Taking the write lock at BEGIN makes concurrent
+writers queue on busy_timeout instead.
+
+Only transactions opened with recap.transactions.atomic(immediate=True)
+do so. Taking the write lock in every transaction would make read-only
+ones queue behind writers too.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Set by recap.transactions.atomic() while it begins a transaction
+    begin_immediate = False
+
+    def _start_transaction_under_autocommit(self):
+        if self.begin_immediate:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -0,0 +1,150 @@
+"""
+The static files pipeline, run by collectstatic.
+
+ManifestStaticFilesStorage, the STATICFILES_STORAGE:
+
+  1. copies each file under a name with a hash of its contents
+     (script.js -> script.1a2b3c4d5e6f.js) and records the names in
+     staticfiles.json, so {% static %} links to the current version
+  2. minifies the hashed JavaScript and CSS (see recap/minify.py); their
+     hashes are those of the minified contents
+  3. writes a .gz (and, with brotli installed, a .br) copy next to each
+     text file, unless the copy wouldn't be smaller
+
+serve() picks the copy the client's Accept-Encoding allows, so no file is
+compressed while serving, and lets browsers keep hashed files for a year
+without revalidating them. A front end server can serve the same files
+itself (nginx's gzip_static and brotli_static, for instance, with
+"expires max" for names containing a hash).
+
+runserver serves static files from the apps' directories itself while
+DEBUG is on, unhashed and uncompressed; serve() handles /static/ otherwise.
+"""
+import mimetypes
+import os
+from functools import lru_cache
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import storage
+from django.contrib.staticfiles.storage import StaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views import static
+
+from . import compression, minify
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.json', '.geojson', '.svg', '.txt', '.html', '.map', '.xml'}
+
+
+class CompressedStaticFilesMixin:
+    """Add compressed copies of the collected files to a static files storage"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set(paths)
+        parent = getattr(super(), 'post_process', None)
+        if parent:
+            # Files the parent storage writes, such as hashed copies, are
+            # compressed too
+            for name, processed_name, processed in parent(paths, dry_run=dry_run, **options):
+                if processed_name and not isinstance(processed, Exception):
+                    names.add(processed_name)
+                yield name, processed_name, processed
+        if dry_run:
+            return
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            with self.open(name) as f:
+                content = f.read()
+            for compress, suffix in compression.COMPRESSORS.values():
+                compressed = compress(content)
+                if len(compressed) >= len(content):
+                    continue
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(compressed))
+                yield name, name + suffix, True
+
+
+class MinifiedStaticFilesMixin:
+    """Minify the JavaScript and CSS a hashing storage has written
+
+    The hashes are those of the minified files, so a change to the
+    minifier changes the names of the files it minifies differently,
+    and browsers keeping them as immutable fetch the new versions.
+    """
+
+    minifiers = {'.js': minify.minify_js, '.css': minify.minify_css}
+
+    def minifier(self, name):
+        if '.min.' in name:
+            return None
+        return self.minifiers.get(os.path.splitext(name)[1].lower())
+
+    def file_hash(self, name, content=None):
+        minifier = self.minifier(name)
+        if content is None or minifier is None:
+            return super().file_hash(name, content)
+        minified = minifier(b''.join(content.chunks()).decode(settings.FILE_CHARSET))
+        return super().file_hash(name, ContentFile(minified.encode()))
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name, hashed_name in self.hashed_files.items():
+            minifier = self.minifier(hashed_name)
+            if minifier is None:
+                continue
+            with self.open(hashed_name) as f:
+                content = f.read().decode(settings.FILE_CHARSET)
+            self.delete(hashed_name)
+            self._save(hashed_name, ContentFile(minifier(content).encode()))
+            yield name, hashed_name, True
+
+
+class CompressedStaticFilesStorage(CompressedStaticFilesMixin, StaticFilesStorage):
+    pass
+
+
+class ManifestStaticFilesStorage(CompressedStaticFilesMixin, MinifiedStaticFilesMixin, storage.ManifestStaticFilesStorage):
+    # Files missing from the manifest, as all are before the first
+    # collectstatic (in development and tests), keep their plain names
+    manifest_strict = False
+
+    def stored_name(self, name):
+        if self.hash_key(urlsplit(unquote(name)).path.strip()) not in self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+
+def serve(request, path):
+    """Serve a file from STATIC_ROOT, compressed if the client accepts a copy of it"""
+    available = [
+        encoding for encoding, (_, suffix) in compression.COMPRESSORS.items()
+        if os.path.isfile(safe_join(settings.STATIC_ROOT, path + suffix))
+    ]
+    encoding = compression.preferred_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), available)
+    if encoding is None:
+        response = static.serve(request, path, document_root=settings.STATIC_ROOT)
+    else:
+        response = static.serve(request, path + compression.COMPRESSORS[encoding][1], settings.STATIC_ROOT)
+        if response.status_code == 200:
+            response['Content-Type'] = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response['Content-Encoding'] = encoding
+    if available:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    if path in hashed_names():
+        # The name changes whenever the contents do
+        patch_cache_control(response, public=True, max_age=settings.STATIC_HASHED_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+@lru_cache()
+def hashed_names():
+    """The names of the files with a hash in them, from the manifest read at startup"""
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
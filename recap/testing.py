@@ -0,0 +1,250 @@
+"""
+Helpers shared by the apps' tests.
+"""
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from monitoring import prometheus
+
+# Plan steps that read a whole table without an index, or sort rows that
+# an index could have returned in order. SQLite before 3.36 writes
+# "SCAN TABLE x" where later versions write "SCAN x".
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (ORDER|GROUP) BY')
+
+# Caches that would let a repeated test run skip the queries it checks
+NO_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    for alias in ['default', 'local', 'shared', 'template_fragments', 'sessions']
+}
+# In-process caches in place of the shared file based one, for tests of
+# what gets cached
+LOCAL_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'test-{alias}'}
+    for alias in ['default', 'local', 'shared', 'template_fragments', 'sessions']
+}
+
+POINT = {'type': 'Point', 'coordinates': [-97.1, 49.9]}
+
+
+def query_plan(sql):
+    """Return the steps of SQLite's EXPLAIN QUERY PLAN for a statement"""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanMixin:
+    """Assertions about the query plans of the SELECTs a block of code runs"""
+
+    @contextmanager
+    def assertUsesIndexes(self, allowed_scans=()):
+        """Fail if a query scans a table other than those in allowed_scans"""
+        with CaptureQueriesContext(connection) as context:
+            yield
+        problems = []
+        for query in context.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            for step in query_plan(query['sql']):
+                scan = FULL_SCAN.match(step)
+                if scan and scan.group(1) not in allowed_scans or TEMP_SORT.search(step):
+                    problems.append(f"{step}\n    {query['sql']}")
+        self.assertFalse(problems, 'Queries without a usable index:\n' + '\n'.join(problems))
+
+
+def query_shape(sql):
+    """SQL with its literal values blanked out, to group repeated queries"""
+    return re.sub(r"'[^']*'|\b\d+\b", '?', sql)
+
+
+class QueryCountMixin:
+    """Assertions that the number of queries doesn't grow with the data"""
+
+    def assertConstantQueries(self, request, seed, sizes=(2, 10)):
+        """Fail if request() runs more queries once seed() has added more rows
+
+        seed(count) should add count rows of everything request() reads.
+        request() is called once to warm up, then after seeding each size.
+        """
+        request()
+        runs = []
+        seeded = 0
+        for size in sizes:
+            seed(size - seeded)
+            seeded = size
+            with CaptureQueriesContext(connection) as context:
+                request()
+            runs.append(context.captured_queries)
+
+        counts = [len(queries) for queries in runs]
+        if len(set(counts)) > 1:
+            repeated = Counter(query_shape(query['sql']) for query in runs[-1])
+            self.fail(
+                f'Query count grew with the data: {counts} queries for {list(sizes)} rows. '
+                'Queries with the largest run:\n' + '\n'.join(
+                    f'{times:4} x {sql}' for sql, times in repeated.most_common()
+                )
+            )
+
+
+class ContentSeeder:
+    """Adds users, posts, comments, likes and map features for query count tests
+
+    The posts are about one incident, a third of them are written by one
+    user and every comment is on one post, so the pages showing them grow
+    with each call.
+    """
+
+    def __init__(self):
+        from django.contrib.auth.models import User
+        from blog.models import Post
+        from water_issues_dashboard.models import Incident
+
+        self.created = 0
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'reader-password')
+        self.incident = Incident.objects.create(
+            name='Red River flood', incident_type='flood', status='confirmed', geometry=POINT
+        )
+        self.post = Post.objects.create(title='Rising', content='...', author=self.user, incident=self.incident)
+
+    def __call__(self, count):
+        from django.contrib.auth.models import User
+        from blog.models import Comment, Like, Post
+        from water_issues_dashboard.models import DeletedFeature, Incident, Municipality, Park, UploadedFile
+
+        for _ in range(count):
+            self.created += 1
+            n = self.created
+            author = User.objects.create_user(f'author{n}', f'author{n}@example.com', 'author-password')
+            post = Post.objects.create(title=f'Post {n}', content='...', author=author, incident=self.incident)
+            Post.objects.create(title=f'Note {n}', content='...', author=self.user)
+            Comment.objects.create(post=self.post, author=author, content='...')
+            Like.objects.create(post=post, user=self.user)
+            Like.objects.create(post=self.post, user=author)
+            Incident.objects.create(
+                name=f'Red River incident {n}', incident_type='drought', status='suspected',
+                geometry=POINT, uploaded_by=author,
+            )
+            Municipality.objects.create(name=f'Red River {n}', status='town', population_2021=n, geometry=POINT)
+            Park.objects.create(name=f'Red River Park {n}', geometry=POINT)
+            DeletedFeature.objects.create(layer='parks', object_id=10 ** 6 + n)
+            UploadedFile.objects.create(file=f'geojson_uploads/{n}.geojson', uploaded_by=author)
+
+
+class AsgiRequest:
+    """One request to an ASGI application, recording the messages it sends
+
+    The client stays connected once it has sent the body, until
+    disconnect() is called, so streamed responses can be read as they come.
+    """
+
+    def __init__(self, path, method='GET', body=b'', headers=(), cookies=None):
+        self.path, _, query_string = path.partition('?')
+        self.method = method
+        self.body = body
+        self.headers = [(name.lower().encode(), value.encode()) for name, value in headers]
+        if body:
+            self.headers.append((b'content-length', str(len(body)).encode()))
+        if cookies:
+            cookie = '; '.join(f'{name}={value}' for name, value in cookies.items())
+            self.headers.append((b'cookie', cookie.encode()))
+        self.query_string = query_string.encode()
+        self.messages = []
+        self.disconnected = None
+
+    async def __call__(self, application):
+        self.disconnected = asyncio.Event()
+        sent_body = False
+
+        async def receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {'type': 'http.request', 'body': self.body, 'more_body': False}
+            await self.disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            self.messages.append(message)
+
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'method': self.method, 'scheme': 'http',
+            'path': self.path, 'root_path': '', 'query_string': self.query_string,
+            'headers': self.headers, 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+        await application(scope, receive, send)
+        return self
+
+    def disconnect(self):
+        self.disconnected.set()
+
+    @property
+    def status(self):
+        return self.messages[0]['status']
+
+    @property
+    def response_headers(self):
+        return {name.decode(): value.decode() for name, value in self.messages[0]['headers']}
+
+    @property
+    def content(self):
+        return b''.join(message.get('body', b'') for message in self.messages[1:])
+
+    async def wait_for(self, content, timeout=5):
+        """Wait until the response body so far contains content"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while content not in self.content:
+            if asyncio.get_running_loop().time() > deadline:
+                raise AssertionError(f'{content!r} not sent within {timeout}s, got {self.content!r}')
+            await asyncio.sleep(0.01)
+
+
+def run_asgi(application, *requests):
+    """Run AsgiRequests to completion on a new event loop and return them"""
+    async def run():
+        return await asyncio.gather(*(request(application) for request in requests))
+    return asyncio.run(run())
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests with RUNTIME_DIR, and the metrics and file based caches
+    in it, moved to a temporary directory, so a run leaves nothing behind
+    in the checkout or in the files a running site shares.
+    """
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.runtime_dir = tempfile.mkdtemp(prefix='recap-test-')
+
+        def moved(path):
+            return os.path.join(self.runtime_dir, os.path.relpath(path, settings.RUNTIME_DIR))
+
+        caches = {
+            alias: {**config, 'LOCATION': moved(config['LOCATION'])}
+            if config['BACKEND'] == 'recap.filecache.FileBasedCache' else config
+            for alias, config in settings.CACHES.items()
+        }
+        self.runtime_settings = override_settings(
+            RUNTIME_DIR=self.runtime_dir,
+            METRICS_DIR=moved(settings.METRICS_DIR),
+            CACHES=caches,
+        )
+        self.runtime_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        # Before METRICS_DIR is the real one again
+        prometheus.REGISTRY.stop()
+        self.runtime_settings.disable()
+        shutil.rmtree(self.runtime_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,592 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch, reverse
+from django.utils.deprecation import MiddlewareMixin
+
+from . import cache, compression, filecache, minify, sessions, staticfiles, transactions
+from .async_support import async_login_required, run_in_threadpool
+from .handlers import AsyncViewHandler, PooledWsgiToAsgi
+from .testing import FULL_SCAN, LOCAL_CACHES, AsgiRequest, run_asgi
+
+# Middleware names each test middleware calls, in order
+calls = []
+
+
+class RecordingMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        calls.append('request')
+
+    def process_response(self, request, response):
+        calls.append('response')
+        response['X-Recorded'] = 'yes'
+        return response
+
+
+class ShortCircuitMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        if 'short' in request.GET:
+            return HttpResponse('short', status=418)
+        if 'fail' in request.GET:
+            raise PermissionDenied
+
+
+class LateMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        calls.append('late request')
+
+    def process_view(self, request, view, args, kwargs):
+        if 'missing' in request.GET:
+            raise Http404
+
+
+TEST_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'recap.tests.RecordingMiddleware',
+    'recap.tests.ShortCircuitMiddleware',
+    'recap.tests.LateMiddleware',
+]
+
+
+async def ok_view(request, name):
+    return HttpResponse(f'hello {name}')
+
+
+async def failing_view(request, name):
+    if name == 'denied':
+        raise PermissionDenied
+    raise ValueError(name)
+
+
+@override_settings(MIDDLEWARE=TEST_MIDDLEWARE, CACHES=LOCAL_CACHES)
+class AsyncViewHandlerTests(SimpleTestCase):
+    """Async views run behind the middleware's hooks, as Django's handler would run them"""
+
+    def setUp(self):
+        del calls[:]
+        self.handler = AsyncViewHandler()
+
+    def get(self, view, path='/test/', name='world'):
+        match = ResolverMatch(view, (), {'name': name})
+
+        async def application(scope, receive, send):
+            await self.handler(scope, receive, send, view, match)
+
+        request, = run_asgi(application, AsgiRequest(path))
+        return request
+
+    def test_view(self):
+        response = self.get(ok_view)
+        self.assertEqual((response.status, response.content), (200, b'hello world'))
+        self.assertEqual(response.response_headers['x-recorded'], 'yes')
+        self.assertEqual(calls, ['request', 'late request', 'response'])
+
+    def test_short_circuit(self):
+        response = self.get(ok_view, '/test/?short')
+        self.assertEqual((response.status, response.content), (418, b'short'))
+        # Middleware after the one answering are skipped, those before it
+        # still see the response
+        self.assertEqual(calls, ['request', 'response'])
+        self.assertEqual(response.response_headers['x-recorded'], 'yes')
+
+    def test_middleware_raises(self):
+        response = self.get(ok_view, '/test/?fail')
+        self.assertEqual(response.status, 403)
+        self.assertEqual(calls, ['request', 'response'])
+
+        response = self.get(ok_view, '/test/?missing')
+        self.assertEqual(response.status, 404)
+
+    def test_view_raises(self):
+        self.assertEqual(self.get(failing_view, name='denied').status, 403)
+        with self.assertLogs('django.request', logging.ERROR):
+            response = self.get(failing_view, name='broken')
+        self.assertEqual(response.status, 500)
+        self.assertEqual(response.response_headers['x-recorded'], 'yes')
+
+    def test_login_required(self):
+        response = self.get(async_login_required(ok_view), '/private/?page=2')
+        self.assertEqual(response.status, 302)
+        self.assertEqual(response.response_headers['location'], '/accounts/login/?next=/private/%3Fpage%3D2')
+
+
+class RunInThreadpoolTests(SimpleTestCase):
+    def test_closes_old_connections(self):
+        with mock.patch('recap.async_support.close_old_connections') as close:
+            result = asyncio.run(run_in_threadpool(lambda value: close.call_count + value, 10))
+        self.assertEqual(result, 11)
+        self.assertEqual(close.call_count, 2)
+
+
+def wsgi_app(chunks, length=True):
+    def application(environ, start_response):
+        headers = [('Content-Type', 'text/plain')]
+        if length:
+            headers.append(('Content-Length', str(sum(map(len, chunks)))))
+        start_response('200 OK', headers)
+        return iter(chunks)
+    return application
+
+
+class PooledWsgiToAsgiTests(SimpleTestCase):
+    """WSGI responses of known length are sent in one piece, others as they come"""
+
+    def test_buffered(self):
+        response, = run_asgi(PooledWsgiToAsgi(wsgi_app([b'one ', b'two'])), AsgiRequest('/'))
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.messages[1:], [{'type': 'http.response.body', 'body': b'one two'}])
+
+    def test_streamed(self):
+        response, = run_asgi(PooledWsgiToAsgi(wsgi_app([b'one ', b'two'], length=False)), AsgiRequest('/'))
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.content, b'one two')
+        self.assertEqual([message.get('more_body', False) for message in response.messages[1:]], [True, True, False])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class AsgiApplicationTests(TransactionTestCase):
+    """recap.asgi routes requests to the async views or to Django's WSGI handler"""
+
+    def setUp(self):
+        from .asgi import application
+        self.application = application
+
+    def test_async_view_login_required(self):
+        url = reverse('like-state') + '?post_id=1'
+        response, = run_asgi(self.application, AsgiRequest(url))
+        self.assertEqual(response.status, 302)
+        self.assertTrue(response.response_headers['location'].startswith('/accounts/login/?next='))
+
+    def test_wsgi_fallback(self):
+        response, = run_asgi(self.application, AsgiRequest(reverse('login')))
+        self.assertEqual(response.status, 200)
+        # Buffered, so sent as a single message
+        self.assertEqual(len(response.messages), 2)
+        self.assertEqual(int(response.response_headers['content-length']), len(response.content))
+        self.assertIn(b'</html>', response.content)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class NamespaceTests(SimpleTestCase):
+    """Values are computed once, shared through the tiers and dropped together"""
+
+    def setUp(self):
+        for alias in [cache.LOCAL_CACHE, cache.SHARED_CACHE]:
+            caches[alias].clear()
+        cache._versions.clear()
+        self.namespace = cache.Namespace('test')
+        self.computed = 0
+
+    def compute(self):
+        self.computed += 1
+        return f'value {self.computed}'
+
+    def test_tiers(self):
+        self.assertEqual(self.namespace.get_or_compute(['a'], self.compute), 'value 1')
+        self.assertEqual(self.namespace._get(self.namespace.key('a'))[1], cache.LOCAL_CACHE)
+        # As another process would find it
+        caches[cache.LOCAL_CACHE].clear()
+        self.assertEqual(self.namespace._get(self.namespace.key('a')), ('value 1', cache.SHARED_CACHE))
+        self.assertEqual(self.namespace.get_or_compute(['a'], self.compute), 'value 1')
+        self.assertEqual(self.namespace.get_or_compute(['b'], self.compute), 'value 2')
+
+    def test_invalidate(self):
+        other = cache.Namespace('other')
+        self.namespace.get_or_compute(['a'], self.compute)
+        other.get_or_compute(['a'], self.compute)
+        self.namespace.invalidate()
+        self.assertEqual(self.namespace.get_or_compute(['a'], self.compute), 'value 3')
+        self.assertEqual(other.get_or_compute(['a'], self.compute), 'value 2')
+
+    def test_given_version(self):
+        version = self.namespace.version()
+        self.namespace.invalidate()
+        self.assertEqual(self.namespace.get_or_compute(['a'], self.compute, version=version), 'value 1')
+        self.assertEqual(self.namespace.get_or_compute(['a'], self.compute), 'value 2')
+        self.assertEqual(self.namespace.get_or_compute(['a'], self.compute, version=version), 'value 1')
+
+    def test_version_read_once_per_ttl(self):
+        shared = caches[cache.SHARED_CACHE]
+        self.namespace.get_or_compute(['a'], self.compute)
+        with mock.patch.object(shared, 'get', wraps=shared.get) as get:
+            self.namespace.get_or_compute(['a'], self.compute)
+            self.assertEqual(get.call_count, 0)
+
+            # Invalidated by another process
+            shared.set(self.namespace.version_key, self.namespace.version() + 1, None)
+            self.assertEqual(self.namespace.get_or_compute(['a'], self.compute), 'value 1')
+            now = time.monotonic() + cache.VERSION_TTL
+            with mock.patch('recap.cache.time.monotonic', return_value=now):
+                self.assertEqual(self.namespace.get_or_compute(['a'], self.compute), 'value 2')
+
+    def test_threads_compute_once(self):
+        def slow():
+            time.sleep(0.1)
+            return self.compute()
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.namespace.get_or_compute(['a'], slow)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value 1'] * 8)
+        self.assertEqual(self.computed, 1)
+        self.assertEqual(cache._key_locks, {})
+
+    def test_waits_for_other_process(self):
+        key = self.namespace.key('a')
+        shared = caches[cache.SHARED_CACHE]
+        shared.add(f'lock:{key}', True, cache.LOCK_TIMEOUT)
+        # The process holding the lock stores the value after a while
+        timer = threading.Timer(0.1, lambda: shared.set(key, 'theirs'))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self.assertEqual(self.namespace.get_or_compute(['a'], self.compute), 'theirs')
+        self.assertEqual(self.computed, 0)
+
+    def test_lock_timeout(self):
+        key = self.namespace.key('a')
+        caches[cache.SHARED_CACHE].add(f'lock:{key}', True, cache.LOCK_TIMEOUT)
+        with mock.patch.object(cache, 'LOCK_TIMEOUT', 0.1):
+            self.assertEqual(self.namespace.get_or_compute(['a'], self.compute), 'value 1')
+
+
+class QueryPlanTests(SimpleTestCase):
+    def test_full_scan(self):
+        for step in ['SCAN blog_post', 'SCAN TABLE blog_post']:
+            with self.subTest(step=step):
+                self.assertEqual(FULL_SCAN.match(step).group(1), 'blog_post')
+        # Walking an index in order, as paged and top-N queries do, is fine
+        for step in [
+            'SCAN blog_post USING INDEX post_date_posted_idx',
+            'SCAN TABLE blog_post USING COVERING INDEX post_date_posted_idx',
+            'SEARCH blog_post USING INDEX post_date_posted_idx (date_posted>?)',
+            'SEARCH TABLE blog_post USING INTEGER PRIMARY KEY (rowid=?)',
+        ]:
+            with self.subTest(step=step):
+                self.assertIsNone(FULL_SCAN.match(step))
+
+
+# Values PRAGMA reads back for names settings.SQLITE_PRAGMAS may use
+SYNCHRONOUS = {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3}
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SQLiteTests(TransactionTestCase):
+    def test_pragmas(self):
+        # The test database is in memory, where journal_mode can't be WAL
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_connection = type(connections['default'])({**connection.settings_dict, 'NAME': os.path.join(directory, 'db')})
+        self.addCleanup(file_connection.close)
+
+        def pragma(name):
+            with file_connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA {name}')
+                return cursor.fetchone()[0]
+
+        self.assertEqual(pragma('journal_mode'), settings.SQLITE_PRAGMAS['journal_mode'].lower())
+        self.assertEqual(pragma('synchronous'), SYNCHRONOUS[settings.SQLITE_PRAGMAS['synchronous']])
+        self.assertEqual(pragma('busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    def begins(self, block):
+        with CaptureQueriesContext(connection) as queries:
+            with block:
+                User.objects.exists()
+        return [query['sql'] for query in queries if query['sql'].startswith('BEGIN')]
+
+    def test_immediate_transactions(self):
+        self.assertEqual(self.begins(transactions.atomic(immediate=True)), ['BEGIN IMMEDIATE'])
+        self.assertEqual(self.begins(transactions.atomic()), ['BEGIN'])
+        self.assertEqual(self.begins(transaction.atomic()), ['BEGIN'])
+        # Only the outermost block begins the transaction
+        with transaction.atomic():
+            self.assertEqual(self.begins(transactions.atomic(immediate=True)), [])
+        self.assertFalse(connection.begin_immediate)
+
+    def test_session_saved_in_immediate_transaction(self):
+        store = sessions.SessionStore()
+        store['key'] = 'value'
+        with CaptureQueriesContext(connection) as queries:
+            store.save()
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+        self.assertEqual(sessions.SessionStore(store.session_key)['key'], 'value')
+
+
+# application/javascript before Python 3.10
+JS_TYPE = mimetypes.guess_type('app.js')[0]
+SCRIPT = b'function hello(name) { return "hello " + name; }\n' * 40
+
+
+class StaticFilesTests(SimpleTestCase):
+    """Collected files get compressed copies, which serve() picks by Accept-Encoding"""
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        settings_override = override_settings(STATIC_ROOT=self.static_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write(self, name, content):
+        with open(os.path.join(self.static_root, name), 'wb') as f:
+            f.write(content)
+
+    def get(self, path, accept_encoding=''):
+        request = RequestFactory().get(f'/static/{path}', HTTP_ACCEPT_ENCODING=accept_encoding)
+        response = staticfiles.serve(request, path)
+        return response, b''.join(response.streaming_content)
+
+    def test_post_process(self):
+        storage = staticfiles.CompressedStaticFilesStorage(location=self.static_root)
+        self.write('app.js', SCRIPT)
+        self.write('tiny.css', b'a{}')
+        self.write('logo.png', SCRIPT)
+        processed = list(storage.post_process({name: (storage, name) for name in ['app.js', 'tiny.css', 'logo.png']}))
+
+        self.assertEqual(processed, [('app.js', 'app.js.gz', True)])
+        with open(os.path.join(self.static_root, 'app.js.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), SCRIPT)
+        # Not smaller, or not text
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, 'tiny.css.gz')))
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, 'logo.png.gz')))
+
+    def test_precompressed(self):
+        self.write('app.js', SCRIPT)
+        self.write('app.js.gz', gzip.compress(SCRIPT))
+        response, content = self.get('app.js', 'gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], JS_TYPE)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(content), SCRIPT)
+        self.assertEqual(int(response['Content-Length']), len(content))
+
+        response, content = self.get('app.js', 'gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(content, SCRIPT)
+
+    def test_preferred_copy(self):
+        self.write('app.js', SCRIPT)
+        self.write('app.js.gz', gzip.compress(SCRIPT))
+        self.write('app.js.br', b'brotli bytes')
+        brotli = {'br': (lambda content: b'brotli bytes', '.br')}
+        with mock.patch.object(compression, 'COMPRESSORS', {**brotli, **compression.COMPRESSORS}):
+            response, content = self.get('app.js', 'gzip, br')
+        self.assertEqual((response['Content-Encoding'], response['Content-Type']), ('br', JS_TYPE))
+        self.assertEqual(content, b'brotli bytes')
+
+    def test_no_compressed_copy(self):
+        self.write('logo.png', b'not really a png')
+        response, content = self.get('logo.png', 'gzip, br')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('Vary', response)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(content, b'not really a png')
+
+    def test_cache_control(self):
+        self.write('app.js', SCRIPT)
+        response, _ = self.get('app.js')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        with mock.patch.object(staticfiles, 'hashed_names', return_value=frozenset(['app.js'])):
+            response, _ = self.get('app.js')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+
+class MinifyTests(SimpleTestCase):
+    def assertMinified(self, cases, minifier):
+        for source, expected in cases:
+            with self.subTest(source=source):
+                self.assertEqual(minifier(source), expected + '\n')
+
+    def test_regex_or_division(self):
+        self.assertMinified([
+            ('var a = b / c / d;', 'var a=b/c/d;'),
+            ('var r = /ab+c/g.test(x);', 'var r=/ab+c/g.test(x);'),
+            ('if (x) /a b/.test(y)', 'if(x)/a b/.test(y)'),
+            ('return /a b/.test(y)', 'return/a b/.test(y)'),
+            ('x = [/[/]/, 1]', 'x=[/[/]/,1]'),
+            # A division, the line break notwithstanding
+            ('x = a\n/ b / c', 'x=a\n/b/c'),
+        ], minify.minify_js)
+
+    def test_regex_or_division_after_parenthesis(self):
+        # Either could follow ) or }, so the text up to the next / is copied
+        self.assertMinified([
+            ('if (x) / +/.test(y)', 'if(x)/ +/.test(y)'),
+            ('if (x) {} / +/.test(y)', 'if(x){}/ +/.test(y)'),
+            ('a = (b + c) / 2 / d', 'a=(b+c)/ 2 /d'),
+            ('a = (b + c) / 2', 'a=(b+c)/2'),
+        ], minify.minify_js)
+
+    def test_line_breaks_kept_where_semicolons_may_be_inserted(self):
+        self.assertMinified([
+            ('a = b\n(c)', 'a=b\n(c)'),
+            ('a = b\n[c]', 'a=b\n[c]'),
+            ('function f() {\n  return\n  x\n}', 'function f(){return\nx}'),
+            ('i\n++\nj', 'i\n++\nj'),
+            ('let a = 1;\n\nlet b = {\n  c: 2,\n};\n', 'let a=1;let b={c:2,};'),
+        ], minify.minify_js)
+
+    def test_operators_kept_apart(self):
+        self.assertMinified([
+            ('a + +b; a - -b; a++ + b', 'a+ +b;a- -b;a++ +b'),
+            ('x = 1 .toString()', 'x=1 .toString()'),
+            ('typeof  x  ===  "y"', 'typeof x==="y"'),
+        ], minify.minify_js)
+
+    def test_literals_copied(self):
+        self.assertMinified([
+            ("`a ${ b ? `c ${ d }` : '}' } e`  ;  x  =  1", "`a ${ b ? `c ${ d }` : '}' } e`;x=1"),
+            ("var s = 'a // b', t = \"/* c */\";", "var s='a // b',t=\"/* c */\";"),
+        ], minify.minify_js)
+
+    def test_comments(self):
+        self.assertMinified([
+            ('/*! License */\n/* dropped */ var a = 1; // dropped', '/*! License */\nvar a=1;'),
+            ('a /* x */ b', 'a b'),
+            ('a\n/* x */\n(b)', 'a\n(b)'),
+        ], minify.minify_js)
+
+    def test_css(self):
+        self.assertMinified([
+            ('a :hover { color : red ; }', 'a :hover{color :red}'),
+            ('div > p , li { margin: 0  auto; }', 'div>p,li{margin:0 auto}'),
+            ('div { width: calc(100% - 2px + 1em) }', 'div{width:calc(100% - 2px + 1em)}'),
+            ("a::before { content: ' a  b ' }", "a::before{content:' a  b '}"),
+            ('/*! License */\n/* dropped */ a { }', '/*! License */ a{}'),
+            ('@media (max-width: 600px) { a { b: c } }', '@media (max-width:600px){a{b:c}}'),
+        ], minify.minify_css)
+
+
+@override_settings(STATICFILES_STORAGE='recap.staticfiles.ManifestStaticFilesStorage', CACHES=LOCAL_CACHES)
+class CollectStaticTests(TestCase):
+    """collectstatic writes hashed, minified and compressed copies, served for browsers to keep"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root)
+        # Enabled before the class's own settings, and so undone after them
+        settings_override = override_settings(STATIC_ROOT=cls.static_root)
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+        super().setUpClass()
+        staticfiles.hashed_names.cache_clear()
+        cls.addClassCleanup(staticfiles.hashed_names.cache_clear)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def read(self, name):
+        with open(os.path.join(self.static_root, name), 'rb') as f:
+            return f.read()
+
+    def test_collected(self):
+        name = 'water_issues_dashboard/script.js'
+        hashed_name = staticfiles_storage.stored_name(name)
+        self.assertRegex(hashed_name, r'^water_issues_dashboard/script\.[0-9a-f]{12}\.js$')
+
+        content = self.read(hashed_name)
+        with open(finders.find(name)) as f:
+            self.assertEqual(content.decode(), minify.minify_js(f.read()))
+        # Named after what is served
+        self.assertEqual(hashed_name.split('.')[-2], hashlib.md5(content).hexdigest()[:12])
+        self.assertEqual(gzip.decompress(self.read(hashed_name + '.gz')), content)
+
+        hashed_css = staticfiles_storage.stored_name('water_issues_dashboard/dashboard_styles.css')
+        self.assertEqual(hashed_css.split('.')[-2], hashlib.md5(self.read(hashed_css)).hexdigest()[:12])
+
+    def test_served(self):
+        hashed_name = staticfiles_storage.stored_name('water_issues_dashboard/script.js')
+        request = RequestFactory().get(f'/static/{hashed_name}', HTTP_ACCEPT_ENCODING='gzip')
+        response = staticfiles.serve(request, hashed_name)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = staticfiles.serve(request, 'water_issues_dashboard/script.js')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_marker_icons_hashed(self):
+        self.client.force_login(User.objects.create_user('viewer', 'viewer@example.com', 'viewer-password'))
+        response = self.client.get(reverse('water_issues_dashboard:home'))
+        icon = staticfiles_storage.url('water_issues_dashboard/images/icons/flood.svg')
+        self.assertRegex(icon, r'/flood\.[0-9a-f]{12}\.svg$')
+        self.assertContains(response, f'flood: "{icon}"')
+
+
+class FileCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_private_directory(self):
+        location = os.path.join(self.root, 'var', 'cache')
+        filecache.FileBasedCache(location, {}).set('key', 'value')
+        self.assertEqual(os.stat(location).st_mode & 0o777, 0o700)
+
+        os.chmod(location, 0o770)
+        with self.assertRaisesMessage(ImproperlyConfigured, 'closed to others'):
+            filecache.FileBasedCache(location, {})
+
+    def test_directory_of_another_user(self):
+        location = os.path.join(self.root, 'cache')
+        os.makedirs(location, mode=0o700)
+        with mock.patch('recap.filecache.os.getuid', return_value=os.getuid() + 1):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'must belong to this user'):
+                filecache.FileBasedCache(location, {})
+
+    def test_no_owner_check_on_windows(self):
+        location = os.path.join(self.root, 'cache')
+        os.makedirs(location, mode=0o777)
+        os.chmod(location, 0o777)
+        with mock.patch('recap.filecache.os') as windows_os:
+            # Lacks getuid, as os does on Windows
+            del windows_os.getuid
+            windows_os.stat.side_effect = AssertionError('stat() called')
+            cache = filecache.FileBasedCache(location, {})
+            cache.set('key', 'value')
+            self.assertEqual(cache.get('key'), 'value')
+
+    def test_cull_interval(self):
+        cache = filecache.FileBasedCache(self.root, {'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 2}})
+        with mock.patch('recap.filecache.time.monotonic', return_value=1000):
+            for i in range(6):
+                cache.set(f'key-{i}', i)
+            # Counted before the first write only
+            self.assertEqual(len(os.listdir(self.root)), 6)
+        with mock.patch('recap.filecache.time.monotonic', return_value=1000 + filecache.CULL_INTERVAL):
+            cache.set('key-6', 6)
+        self.assertEqual(len(os.listdir(self.root)), 4)
+
+    def test_test_run_outside_the_checkout(self):
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        locations = [settings.CACHES[alias]['LOCATION'] for alias in ['shared', 'sessions']]
+        for path in [settings.RUNTIME_DIR, settings.METRICS_DIR, *locations]:
+            self.assertFalse(path.startswith(base_dir), path)
+            self.assertTrue(path.startswith(settings.RUNTIME_DIR), path)
@@ -0,0 +1,73 @@
+"""
+Transactions that take SQLite's write lock at BEGIN, and work gathered
+over a transaction and done once it commits.
+
+atomic(immediate=True) is transaction.atomic() for transactions that read
+before they write. With the recap.sqlite3 backend its outermost block
+starts with BEGIN IMMEDIATE, so it waits out busy_timeout for the write
+lock instead of failing to upgrade a read lock with "database is locked"
+(see recap/sqlite3/base.py). Nested in a transaction that has begun
+already, it is an ordinary savepoint.
+
+collect_on_commit() adds to a batch that is registered with on_commit
+once, instead of registering a callback for every row a transaction
+saves: importing a file or cascading a delete then queues one callback,
+not thousands, and the batch can be handled as a whole.
+
+Batches follow savepoints. What a rolled back savepoint collected is
+dropped with it, and changes collected on either side of a savepoint go
+to separate batches, which run in order.
+"""
+import threading
+
+from django.db import transaction
+
+_latest = threading.local()
+
+
+class ImmediateAtomic(transaction.Atomic):
+    def __enter__(self):
+        connection = transaction.get_connection(self.using)
+        connection.begin_immediate = True
+        try:
+            super().__enter__()
+        finally:
+            connection.begin_immediate = False
+
+
+def atomic(using=None, savepoint=True, immediate=False):
+    """transaction.atomic(), starting the transaction with BEGIN IMMEDIATE if immediate"""
+    if not immediate:
+        return transaction.atomic(using, savepoint)
+    return ImmediateAtomic(using, savepoint)
+
+
+def collect_on_commit(key, factory, *args, using=None):
+    """Call add(*args) on the batch for key, which is called once the transaction commits
+
+    factory() makes a new batch: an object with an add() method that is
+    called with no arguments after the commit. Outside a transaction the
+    batch is called straight away.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        batch = factory()
+        batch.add(*args)
+        batch()
+        return
+
+    latest = _latest.__dict__.setdefault(connection.alias, {})
+    # Blocks without a savepoint (None), as Model.delete() opens, can only
+    # be rolled back with the one around them
+    savepoints = tuple(sid for sid in connection.savepoint_ids if sid is not None)
+    batch, batch_savepoints, callbacks = latest.get(key, (None, None, None))
+    # on_commit() appends to run_on_commit, while commits and rollbacks
+    # replace it, so a batch is only looked for again after one of those
+    if batch is None or batch_savepoints != savepoints or (
+        callbacks is not connection.run_on_commit
+        and not any(callback is batch for _, callback in connection.run_on_commit)
+    ):
+        batch = factory()
+        transaction.on_commit(batch, using=using)
+    latest[key] = (batch, savepoints, connection.run_on_commit)
+    batch.add(*args)
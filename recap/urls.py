@@ -13,11 +13,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from users import views as user_views
+from monitoring import views as monitoring_views
+from recap import staticfiles
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,6 +29,14 @@ urlpatterns = [
     path('dashboard/', include('water_issues_dashboard.urls')),
     path('accounts/', include('users.urls')),
     path('profile/', user_views.profile, name='profile'),
+    path('monitoring/', include('monitoring.urls')),
+    path('metrics', monitoring_views.prometheus_metrics, name='metrics'),
+]
+
+# runserver serves static files itself while DEBUG is on; this serves the
+# collected, precompressed files under other servers
+urlpatterns += [
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), staticfiles.serve),
 ]
 
 if settings.DEBUG:
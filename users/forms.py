@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from .models import Profile
+from .renditions import update_renditions
 
 class UserRegisterForm(UserCreationForm):
     email = forms.EmailField()
@@ -20,4 +21,10 @@ class UserUpdateForm(forms.ModelForm):
 class ProfileUpdateForm(forms.ModelForm):
     class Meta:
         model = Profile
-        fields = ['image']
\ No newline at end of file
+        fields = ['image']
+
+    def save(self, commit=True):
+        profile = super().save(commit)
+        if commit and 'image' in self.changed_data:
+            update_renditions(profile)
+        return profile
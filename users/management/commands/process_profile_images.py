@@ -0,0 +1,120 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from users.models import Profile
+from users.renditions import RENDITIONS, RENDITION_SETTINGS, render_all, renditions_key, save_renditions, source_hash
+
+
+def process_source(path, current_key, force):
+    """Hash and render one image in a worker process"""
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        content_hash = source_hash(content)
+        if not force and renditions_key(content_hash) == current_key:
+            return content_hash, None, None
+        return content_hash, render_all(content), None
+    except Exception as error:
+        return None, None, str(error)
+
+
+class Command(BaseCommand):
+    help = 'Regenerate profile picture renditions that are missing or out of date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--state-file', type=str, help='Where to record progress between runs',
+                            default=os.path.join(settings.MEDIA_ROOT, '.profile_images_progress.json'))
+        parser.add_argument('--restart', action='store_true', help='Ignore the progress of an interrupted run')
+        parser.add_argument('--force', action='store_true', help='Reprocess images even if up to date')
+
+    def handle(self, *args, **options):
+        self.state_file = options['state_file']
+        force = options['force']
+        state = self.load_state(options['restart'] or force)
+
+        profiles = Profile.objects.exclude(image=Profile._meta.get_field('image').default)
+        if state['last_pk']:
+            self.stdout.write(f"Resuming after profile {state['last_pk']}")
+            profiles = profiles.filter(pk__gt=state['last_pk'])
+
+        pending = []
+        skipped = 0
+        for profile in profiles.order_by('pk'):
+            path = profile.image.path
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.stdout.write(self.style.WARNING(f"Image not found at {path}. Skipping {profile}."))
+                continue
+            # Unchanged files whose hash we already know needn't be read again
+            cached = state['sources'].get(profile.image.name)
+            if (not force and cached and cached[:2] == [stat.st_mtime_ns, stat.st_size]
+                    and renditions_key(cached[2]) == profile.renditions_key
+                    and all(getattr(profile, name) for name in RENDITIONS)):
+                skipped += 1
+                continue
+            pending.append((profile, stat))
+
+        processed = failed = 0
+        start = time.perf_counter()
+        try:
+            with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+                results = executor.map(
+                    process_source,
+                    [profile.image.path for profile, _ in pending],
+                    [profile.renditions_key for profile, _ in pending],
+                    [force] * len(pending),
+                    chunksize=4,
+                )
+                for index, ((profile, stat), (content_hash, contents, error)) in enumerate(zip(pending, results)):
+                    if error:
+                        failed += 1
+                        self.stdout.write(self.style.ERROR(f"Could not process {profile.image.name}: {error}"))
+                    elif contents is None:
+                        skipped += 1
+                    else:
+                        save_renditions(profile, renditions_key(content_hash), contents)
+                        processed += 1
+                    if content_hash:
+                        state['sources'][profile.image.name] = [stat.st_mtime_ns, stat.st_size, content_hash]
+                    state['last_pk'] = profile.pk
+                    if index % 100 == 99:
+                        self.save_state(state)
+        except KeyboardInterrupt:
+            self.save_state(state)
+            self.stdout.write(self.style.WARNING(f"Interrupted after profile {state['last_pk']}; run again to resume."))
+            return
+
+        # A finished run starts from the beginning next time
+        state['last_pk'] = None
+        self.save_state(state)
+
+        elapsed = time.perf_counter() - start
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} images in {elapsed:.1f}s ({rate:.1f} images/sec) "
+            f"with {options['workers']} workers; {skipped} up to date, {failed} failed"
+        ))
+
+    def load_state(self, restart):
+        state = {'settings': RENDITION_SETTINGS, 'last_pk': None, 'sources': {}}
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                saved = json.load(f)
+            state['sources'] = saved.get('sources', {})
+            # Progress only carries over while the rendition settings are unchanged
+            if not restart and saved.get('settings') == RENDITION_SETTINGS:
+                state['last_pk'] = saved.get('last_pk')
+        return state
+
+    def save_state(self, state):
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_file, self.state_file)
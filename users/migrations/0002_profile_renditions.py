@@ -0,0 +1,23 @@
+# Generated by Django 2.1 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='image_medium',
+            field=models.ImageField(blank=True, editable=False, upload_to='profile_pics/renditions'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='image_small',
+            field=models.ImageField(blank=True, editable=False, upload_to='profile_pics/renditions'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_profile_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='renditions_key',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
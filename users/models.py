@@ -4,6 +4,18 @@ from django.contrib.auth.models import User
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     image = models.ImageField(default='default.jpg', upload_to='profile_pics')
+    # Resized copies of image, see users.renditions
+    image_small = models.ImageField(upload_to='profile_pics/renditions', blank=True, editable=False)
+    image_medium = models.ImageField(upload_to='profile_pics/renditions', blank=True, editable=False)
+    renditions_key = models.CharField(max_length=64, blank=True, editable=False)
 
     def __str__(self):
-        return f'{self.user.username} Profile'
\ No newline at end of file
+        return f'{self.user.username} Profile'
+
+    @property
+    def small_image_url(self):
+        return (self.image_small or self.image).url
+
+    @property
+    def medium_image_url(self):
+        return (self.image_medium or self.image).url
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+Resized copies of profile pictures.
+
+Avatars are shown at 65px in feeds and 125px on profile pages, so each
+upload gets a square rendition at twice those sizes for high-density
+screens. Renditions are WebP when Pillow is built with it, JPEG otherwise.
+
+Each profile records a key derived from the source image's content and
+the rendition settings below, so renditions can be recognised as up to
+date until either changes.
+"""
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+# Profile field name -> edge length in pixels
+RENDITIONS = {
+    'image_small': 130,
+    'image_medium': 250,
+}
+
+if features.check('webp'):
+    RENDITION_FORMAT, RENDITION_EXTENSION = 'WEBP', 'webp'
+else:
+    RENDITION_FORMAT, RENDITION_EXTENSION = 'JPEG', 'jpg'
+RENDITION_QUALITY = 80
+
+RENDITION_SETTINGS = ','.join(
+    [RENDITION_FORMAT, str(RENDITION_QUALITY)] + [f'{name}={size}' for name, size in RENDITIONS.items()]
+)
+
+
+def render(source, size):
+    """Crop an image file to a square of the given size and recompress it"""
+    with Image.open(source) as image:
+        image.load()
+    if hasattr(ImageOps, 'exif_transpose'):
+        image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if RENDITION_FORMAT == 'WEBP' and 'A' in image.getbands() else 'RGB')
+    image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, RENDITION_FORMAT, quality=RENDITION_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def render_all(content):
+    """Render every rendition of an image from its bytes"""
+    return {name: render(io.BytesIO(content), size) for name, size in RENDITIONS.items()}
+
+
+def source_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def renditions_key(content_hash):
+    """Identify renditions of a source image made with the current settings"""
+    return hashlib.sha256(f'{RENDITION_SETTINGS}:{content_hash}'.encode()).hexdigest()
+
+
+def rendition_name(source_name, size):
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return f'{stem}_{size}.{RENDITION_EXTENSION}'
+
+
+def save_renditions(profile, key, contents):
+    """Store rendered images on a profile, replacing its old rendition files"""
+    for field_name, size in RENDITIONS.items():
+        rendition = getattr(profile, field_name)
+        if rendition:
+            rendition.delete(save=False)
+        rendition.save(rendition_name(profile.image.name, size), ContentFile(contents[field_name]), save=False)
+    profile.renditions_key = key
+    profile.save(update_fields=[*RENDITIONS, 'renditions_key'])
+
+
+def update_renditions(profile):
+    """Regenerate every rendition of a profile's picture"""
+    profile.image.open('rb')
+    try:
+        content = profile.image.read()
+    finally:
+        profile.image.close()
+    save_renditions(profile, renditions_key(source_hash(content)), render_all(content))
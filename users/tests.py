@@ -1,3 +1,215 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+from recap.testing import LOCAL_CACHES, NO_CACHES, ContentSeeder, QueryCountMixin
+from .forms import ProfileUpdateForm
+from .models import Profile
+from .renditions import (
+    RENDITION_EXTENSION, RENDITION_FORMAT, RENDITIONS, render, render_all, rendition_name, renditions_key, source_hash,
+)
+
+
+@override_settings(CACHES=NO_CACHES)
+class ViewQueryCountTests(QueryCountMixin, TestCase):
+    """Each account page runs the same number of queries however many users there are"""
+
+    def setUp(self):
+        self.seed = ContentSeeder()
+
+    def test_register(self):
+        self.assertConstantQueries(lambda: self.client.get(reverse('register')), self.seed)
+
+    def test_login(self):
+        def log_in():
+            self.client.get(reverse('login'))
+            self.client.post(reverse('login'), {'username': 'reader', 'password': 'reader-password'})
+
+        self.assertConstantQueries(log_in, self.seed)
+
+    def test_logout(self):
+        def log_out():
+            self.client.force_login(self.seed.user)
+            self.client.get(reverse('logout'))
+
+        self.assertConstantQueries(log_out, self.seed)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SessionTests(TestCase):
+    """Sessions are read from the sessions cache, and expired ones pruned from the database"""
+
+    def setUp(self):
+        self.seed = ContentSeeder()
+
+    def test_cached_session_skips_database(self):
+        self.client.force_login(self.seed.user)
+        self.client.get(reverse('blog-home'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog-home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if 'django_session' in query['sql']])
+
+    def test_prune_sessions(self):
+        now = timezone.now()
+        for days in [1, -1, -2, -3]:
+            Session.objects.create(session_key=f'session{days}', session_data='', expire_date=now + timedelta(days=days))
+        out = StringIO()
+        call_command('prune_sessions', batch_size=2, stdout=out)
+        self.assertIn('Deleted 3 expired sessions', out.getvalue())
+        self.assertEqual(Session.objects.count(), 1)
+        self.assertEqual(Session.objects.get().session_key, 'session1')
+
+    def test_prune_sessions_batch_size(self):
+        for batch_size in ['0', '-1']:
+            with self.assertRaisesMessage(CommandError, '--batch-size must be at least 1'):
+                call_command('prune_sessions', '--batch-size', batch_size)
+
+
+def image_bytes(size=(300, 200), mode='RGB', color='red'):
+    output = io.BytesIO()
+    Image.new(mode, size, color).save(output, 'PNG')
+    return output.getvalue()
+
+
+class RenditionTests(SimpleTestCase):
+    def test_render_square(self):
+        for mode in ['RGB', 'RGBA', 'L']:
+            with self.subTest(mode=mode):
+                with Image.open(io.BytesIO(render(io.BytesIO(image_bytes((300, 200), mode)), 130))) as image:
+                    self.assertEqual(image.size, (130, 130))
+                    self.assertEqual(image.format, RENDITION_FORMAT)
+
+    def test_render_all(self):
+        contents = render_all(image_bytes())
+        self.assertEqual(set(contents), set(RENDITIONS))
+        for name, size in RENDITIONS.items():
+            with Image.open(io.BytesIO(contents[name])) as image:
+                self.assertEqual(image.size, (size, size))
+
+    def test_keys(self):
+        red, blue = source_hash(image_bytes()), source_hash(image_bytes(color='blue'))
+        self.assertEqual(red, source_hash(image_bytes()))
+        self.assertNotEqual(red, blue)
+        self.assertNotEqual(renditions_key(red), renditions_key(blue))
+        key = renditions_key(red)
+        with mock.patch('users.renditions.RENDITION_SETTINGS', 'JPEG,50'):
+            self.assertNotEqual(renditions_key(red), key)
+
+    def test_rendition_name(self):
+        self.assertEqual(rendition_name('profile_pics/user1.jpg', 130), f'user1_130.{RENDITION_EXTENSION}')
+
+    def test_jpeg_without_webp(self):
+        with mock.patch('users.renditions.RENDITION_FORMAT', 'JPEG'):
+            with Image.open(io.BytesIO(render(io.BytesIO(image_bytes(mode='RGBA')), 250))) as image:
+                self.assertEqual(image.size, (250, 250))
+                self.assertEqual(image.format, 'JPEG')
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ProfileRenditionTests(TestCase):
+    """Uploading a profile picture renders its renditions, which templates show in place of the original"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.profile = User.objects.create_user('painter', 'painter@example.com', 'painter-password').profile
+
+    def upload(self, color):
+        upload = SimpleUploadedFile(f'{color}.png', image_bytes(color=color), content_type='image/png')
+        form = ProfileUpdateForm({}, {'image': upload}, instance=self.profile)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def test_original_without_renditions(self):
+        self.assertFalse(self.profile.image_small)
+        self.assertEqual(self.profile.small_image_url, self.profile.image.url)
+        self.assertEqual(self.profile.medium_image_url, self.profile.image.url)
+
+    def test_renditions_saved_with_the_upload(self):
+        profile = self.upload('red')
+        for field_name, size in RENDITIONS.items():
+            with getattr(profile, field_name).open('rb') as f, Image.open(f) as image:
+                self.assertEqual(image.size, (size, size))
+                self.assertEqual(image.format, RENDITION_FORMAT)
+        self.assertEqual(profile.small_image_url, profile.image_small.url)
+        self.assertEqual(profile.medium_image_url, profile.image_medium.url)
+        self.assertNotEqual(profile.small_image_url, profile.image.url)
+
+        self.client.force_login(profile.user)
+        response = self.client.get(reverse('blog-profile', args=[profile.user.id]))
+        self.assertContains(response, profile.medium_image_url)
+
+    def test_old_renditions_removed(self):
+        old_paths = [getattr(self.upload('red'), field_name).path for field_name in RENDITIONS]
+        profile = self.upload('blue')
+        for path in old_paths:
+            self.assertFalse(os.path.exists(path), path)
+        self.assertTrue(all(os.path.exists(getattr(profile, field_name).path) for field_name in RENDITIONS))
+
+
+class ProcessProfileImagesTests(TestCase):
+    """process_profile_images renders what is missing or stale and remembers what it has seen"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        os.makedirs(os.path.join(self.media_root, 'profile_pics'))
+        with open(os.path.join(self.media_root, 'profile_pics', 'painter.png'), 'wb') as f:
+            f.write(image_bytes())
+        user = User.objects.create_user('painter', 'painter@example.com', 'painter-password')
+        Profile.objects.filter(user=user).update(image='profile_pics/painter.png')
+        self.profile_pk = user.profile.pk
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('process_profile_images', '--workers', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_renders_once(self):
+        self.assertIn('Processed 1 images', self.run_command())
+        profile = Profile.objects.get(pk=self.profile_pk)
+        for name, size in RENDITIONS.items():
+            with Image.open(getattr(profile, name).path) as image:
+                self.assertEqual(image.size, (size, size))
+        with open(profile.image.path, 'rb') as f:
+            self.assertEqual(profile.renditions_key, renditions_key(source_hash(f.read())))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, '.profile_images_progress.json')))
+
+        self.assertIn('Processed 0 images', self.run_command())
+        self.assertIn('1 up to date', self.run_command())
+        self.assertIn('Processed 1 images', self.run_command('--force'))
+
+    def test_changed_source(self):
+        self.run_command()
+        with open(os.path.join(self.media_root, 'profile_pics', 'painter.png'), 'wb') as f:
+            f.write(image_bytes(color='blue'))
+        self.assertIn('Processed 1 images', self.run_command())
+
+    def test_missing_source(self):
+        os.remove(os.path.join(self.media_root, 'profile_pics', 'painter.png'))
+        output = self.run_command()
+        self.assertIn('Image not found', output)
+        self.assertIn('Processed 0 images', output)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class WaterIssuesDashboardConfig(AppConfig):
     name = 'water_issues_dashboard'
+
+    def ready(self):
+        import water_issues_dashboard.signals
@@ -0,0 +1,28 @@
+"""
+Async versions of the JSON API views, served by recap/asgi.py.
+
+The queries are shared with the synchronous views in views.py and run on
+the bounded thread pool, so the event loop is never blocked by the ORM.
+"""
+from monitoring.http import JsonResponse
+from recap import compression
+from recap.async_support import async_login_required, run_in_threadpool
+
+from . import views
+
+@async_login_required
+async def api_geojson_data(request):
+    """API endpoint to return GeoJSON or TopoJSON data for the map"""
+    encoding = compression.preferred_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    content, encoding = await run_in_threadpool(views.geojson_content, request.GET, encoding)
+    return compression.encoded_response(content, 'application/json', encoding)
+
+@async_login_required
+async def api_search(request):
+    """API endpoint for search functionality"""
+    query = request.GET.get('q', '').lower().strip()
+    if not query:
+        return JsonResponse({'results': []})
+
+    results = await run_in_threadpool(views.cached_search_results, query)
+    return JsonResponse({'results': results})
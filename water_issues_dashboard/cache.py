@@ -0,0 +1,28 @@
+"""
+Cached map API responses and dashboard aggregates, shared between worker
+processes through recap.cache and dropped whenever map data changes.
+"""
+from django.db import transaction
+from recap.cache import Namespace
+
+geojson_cache = Namespace('geojson')
+search_cache = Namespace('search')
+metrics_cache = Namespace('dashboard-metrics')
+
+MAP_DATA_CACHES = [geojson_cache, search_cache, metrics_cache]
+
+
+def invalidate_now():
+    for namespace in MAP_DATA_CACHES:
+        namespace.invalidate()
+
+
+def invalidate_map_data():
+    """Invalidate everything derived from municipalities, parks and incidents"""
+    # Invalidating before the change commits would let another worker
+    # cache the old data again under the new version. A transaction that
+    # saves many rows only needs to invalidate once.
+    connection = transaction.get_connection()
+    if any(callback is invalidate_now for _, callback in connection.run_on_commit):
+        return
+    transaction.on_commit(invalidate_now)
@@ -0,0 +1,101 @@
+"""
+In-process publish/subscribe bus for live dashboard updates.
+
+Views publish events from their request threads; subscribers are the
+event stream connections served on the ASGI event loop (see
+water_issues_dashboard/stream.py). Only subscribers in the same process
+receive an event, so dashboards connected to other workers catch up
+through the delta sync API when they reconnect.
+"""
+import asyncio
+import threading
+
+from django.db import transaction
+from recap.transactions import collect_on_commit
+
+# Events buffered per connection before it is told to resync instead
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """A bounded queue of events for one connected client"""
+
+    def __init__(self, loop, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Called from publisher threads; the queue belongs to the event loop
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def reset(self):
+        """Drop buffered events after the client has been told to resync"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflowed = False
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self):
+        """Register a subscription on the running event loop"""
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def publish(self, event_type, data):
+        event = (event_type, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # The subscriber's event loop has shut down
+                self.unsubscribe(subscription)
+
+
+bus = EventBus()
+
+
+def publish(event_type, data):
+    """Publish an event once the current transaction (if any) commits"""
+    transaction.on_commit(lambda: bus.publish(event_type, data))
+
+
+class EventBatch:
+    """Items published in one transaction, sent on commit as a single event of their list"""
+
+    def __init__(self, event_type):
+        self.event_type = event_type
+        self.items = []
+
+    def add(self, item):
+        self.items.append(item)
+
+    def __call__(self):
+        bus.publish(self.event_type, self.items)
+
+
+def publish_item(event_type, item):
+    """Add item to the list published as one event_type event once the current transaction commits"""
+    collect_on_commit(('event', event_type), lambda: EventBatch(event_type), item)
@@ -0,0 +1,112 @@
+import json
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from . import wkb
+
+
+class GeometryDescriptor(DeferredAttribute):
+    """
+    Holds the WKB loaded from the database on the instance and only decodes
+    it to a GeoJSON dict the first time the attribute is read.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, (bytes, memoryview)):
+            value = wkb.loads(value) if value else None
+            instance.__dict__[self.field_name] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field_name] = value
+
+
+class GeometryFormField(forms.CharField):
+    """Accepts a GeoJSON geometry as JSON text"""
+    widget = forms.Textarea
+    default_error_messages = {
+        'invalid': 'Enter a valid GeoJSON geometry.',
+    }
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value in self.empty_values:
+            return None
+        try:
+            geometry = json.loads(value)
+            wkb.dumps(geometry)
+        except ValueError:
+            raise ValidationError(self.error_messages['invalid'], code='invalid')
+        return geometry
+
+    def prepare_value(self, value):
+        if isinstance(value, dict):
+            return json.dumps(value)
+        return value
+
+
+class GeometryField(models.BinaryField):
+    """
+    A GeoJSON geometry stored as well-known binary.
+
+    Rows are hydrated with the raw bytes and the geometry is decoded lazily
+    on attribute access, so queries that never touch the geometry don't pay
+    for parsing it. An empty geometry is stored as empty bytes and read
+    back as None.
+    """
+    description = 'GeoJSON geometry stored as WKB'
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.editable:
+            kwargs.pop('editable', None)
+        else:
+            kwargs['editable'] = False
+        return name, path, args, kwargs
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, GeometryDescriptor(self.attname))
+
+    def pre_save(self, model_instance, add):
+        # Save the stored bytes as they are unless the geometry was decoded
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if isinstance(value, (bytes, memoryview)):
+            return value
+        if not value:
+            return None if value is None and self.null else b''
+        return wkb.dumps(value)
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            try:
+                return json.loads(value)
+            except ValueError:
+                raise ValidationError('Enter a valid GeoJSON geometry.', code='invalid')
+        if isinstance(value, (bytes, memoryview)):
+            return wkb.loads(value) if value else None
+        return value
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj))
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{
+            'form_class': GeometryFormField,
+            **kwargs,
+        })
@@ -0,0 +1,64 @@
+# Generated by Django 2.1 on 2026-10-19 09:12
+
+from django.db import migrations
+import water_issues_dashboard.fields
+
+GEOMETRY_MODELS = ['municipality', 'park', 'incident']
+
+
+def geometry_to_wkb(apps, schema_editor):
+    for model_name in GEOMETRY_MODELS:
+        model = apps.get_model('water_issues_dashboard', model_name)
+        for obj in model.objects.iterator():
+            obj.geometry_wkb = obj.geometry
+            obj.save(update_fields=['geometry_wkb'])
+
+
+def wkb_to_geometry(apps, schema_editor):
+    for model_name in GEOMETRY_MODELS:
+        model = apps.get_model('water_issues_dashboard', model_name)
+        for obj in model.objects.iterator():
+            obj.geometry = obj.geometry_wkb or {}
+            obj.save(update_fields=['geometry'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('water_issues_dashboard', '0002_delta_sync'),
+    ]
+
+    operations = [
+        *(
+            migrations.AddField(
+                model_name=model_name,
+                name='geometry_wkb',
+                field=water_issues_dashboard.fields.GeometryField(null=True),
+            )
+            for model_name in GEOMETRY_MODELS
+        ),
+        migrations.RunPython(geometry_to_wkb, wkb_to_geometry),
+        *(
+            migrations.RemoveField(
+                model_name=model_name,
+                name='geometry',
+            )
+            for model_name in GEOMETRY_MODELS
+        ),
+        *(
+            migrations.RenameField(
+                model_name=model_name,
+                old_name='geometry_wkb',
+                new_name='geometry',
+            )
+            for model_name in GEOMETRY_MODELS
+        ),
+        *(
+            migrations.AlterField(
+                model_name=model_name,
+                name='geometry',
+                field=water_issues_dashboard.fields.GeometryField(),
+            )
+            for model_name in GEOMETRY_MODELS
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.1 on 2026-10-19 07:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('water_issues_dashboard', '0003_geometry_wkb'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='incident',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='municipality',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='park',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['incident_type', 'status'], name='incident_type_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['name', 'incident_type'], name='incident_name_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='municipality',
+            index=models.Index(fields=['population_2021', 'status'], name='municipality_population_idx'),
+        ),
+    ]
@@ -1,14 +1,41 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import json
 from jsonfield import JSONField
+from .cache import invalidate_map_data
+from .fields import GeometryField
+
+class MapFeatureQuerySet(models.QuerySet):
+    """Rows of a map layer, whose bulk updates delta syncs still see
+
+    QuerySet.update() doesn't call save(), so it would neither set the
+    auto_now updated_at that the delta sync API filters on nor send the
+    post_save that drops the cached map data. This update() does both.
+    """
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        rows = super().update(**kwargs)
+        invalidate_map_data()
+        return rows
 
 class Municipality(models.Model):
     name = models.CharField(max_length=200)
     status = models.CharField(max_length=50)  # city, town, rm
     population_2021 = models.IntegerField(default=0)
-    geometry = JSONField()  # Store GeoJSON geometry
+    geometry = GeometryField()  # Store GeoJSON geometry as WKB
     properties = JSONField(default=dict)  # Additional properties
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = MapFeatureQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The dashboard filters on a population range and excludes some
+            # statuses, then counts and sums population, all from the index
+            models.Index(fields=['population_2021', 'status'], name='municipality_population_idx'),
+        ]
 
     def __str__(self):
         return f"{self.status.title()} of {self.name}"
@@ -20,8 +47,11 @@ class Park(models.Model):
     owner = models.CharField(max_length=100, blank=True)
     park_class = models.CharField(max_length=100, blank=True)
     url = models.URLField(blank=True)
-    geometry = JSONField()
+    geometry = GeometryField()
     properties = JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = MapFeatureQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -47,14 +77,40 @@ class Incident(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     started_at = models.DateField(null=True, blank=True)
     description = models.TextField(blank=True)
-    geometry = JSONField()
+    geometry = GeometryField()
     properties = JSONField(default=dict)
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = MapFeatureQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Dashboard filters and per-type counts
+            models.Index(fields=['incident_type', 'status'], name='incident_type_status_idx'),
+            # Duplicate check when importing uploads
+            models.Index(fields=['name', 'incident_type'], name='incident_name_type_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.incident_type})"
 
+class DeletedFeature(models.Model):
+    """Tombstone for a deleted map feature, so delta syncs can report removals"""
+    LAYER_CHOICES = [
+        ('municipalities', 'Municipalities'),
+        ('parks', 'Parks'),
+        ('incidents', 'Incidents'),
+    ]
+
+    layer = models.CharField(max_length=20, choices=LAYER_CHOICES)
+    object_id = models.IntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.layer} #{self.object_id} deleted on {self.deleted_at}"
+
 class UploadedFile(models.Model):
     file = models.FileField(upload_to='geojson_uploads/')
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Municipality, Park, Incident, DeletedFeature
+from .cache import invalidate_map_data
+from . import events
+
+@receiver(post_delete, sender=Municipality)
+def record_deleted_municipality(sender, instance, **kwargs):
+    DeletedFeature.objects.create(layer='municipalities', object_id=instance.id)
+
+@receiver(post_delete, sender=Park)
+def record_deleted_park(sender, instance, **kwargs):
+    DeletedFeature.objects.create(layer='parks', object_id=instance.id)
+
+@receiver(post_delete, sender=Incident)
+def record_deleted_incident(sender, instance, **kwargs):
+    DeletedFeature.objects.create(layer='incidents', object_id=instance.id)
+
+@receiver(post_save, sender=Municipality)
+@receiver(post_save, sender=Park)
+@receiver(post_save, sender=Incident)
+@receiver(post_delete, sender=Municipality)
+@receiver(post_delete, sender=Park)
+@receiver(post_delete, sender=Incident)
+def invalidate_cached_map_data(sender, **kwargs):
+    invalidate_map_data()
+
+@receiver(post_save, sender=Incident)
+def publish_incident(sender, instance, **kwargs):
+    # New and edited incidents alike, including those saved in the admin.
+    # With no dashboard connected to this process there is no one to send
+    # the feature to, and any that connects later catches up by delta sync.
+    if not events.bus.has_subscribers():
+        return
+    from .views import incident_feature
+    events.publish_item('incidents', incident_feature(instance))
@@ -3,6 +3,7 @@ let map;
 let municipalityData = null;
 let incidentsData = null;
 let parksData = null;
+let syncToken = null;
 let currentLayers = {
     municipalities: null,
     floods: null,
@@ -26,10 +27,10 @@ const userIcon = L.icon({
     popupAnchor: [0, -13]
 });
 
-// Helper function to create custom icons from SVG files
+// Helper function to create custom icons from the SVG files the page lists
 const createIncidentIcon = (iconName) => {
     return L.icon({
-        iconUrl: `/static/water_issues_dashboard/images/icons/${iconName}.svg`,
+        iconUrl: incidentIconUrls[iconName],
         iconSize: [25, 25],
         iconAnchor: [12.5, 12.5],
         popupAnchor: [0, -13]
@@ -75,6 +76,80 @@ async function loadJSONData(endpoint) {
     }
 }
 
+// Load all map layers as compact TopoJSON and decode them back into
+// the GeoJSON FeatureCollections the rest of the app works with
+async function loadMapData() {
+    const topology = await loadJSONData(`${apiBaseUrl}?format=topojson`);
+    if (!topology) {
+        return null;
+    }
+    const allData = decodeTopology(topology);
+    allData.sync_token = topology.sync_token;
+    return allData;
+}
+
+// Convert every object in a TopoJSON topology into a FeatureCollection
+function decodeTopology(topology) {
+    const [scaleX, scaleY] = topology.transform.scale;
+    const [translateX, translateY] = topology.transform.translate;
+    const toPosition = (x, y) => [x * scaleX + translateX, y * scaleY + translateY];
+
+    // Arcs are delta-encoded on the quantized grid
+    const arcs = topology.arcs.map(arc => {
+        let x = 0, y = 0;
+        return arc.map(([dx, dy]) => {
+            x += dx;
+            y += dy;
+            return toPosition(x, y);
+        });
+    });
+
+    // Join arcs into one line; a negative index (~i) means arc i reversed.
+    // Consecutive arcs share an end point, so it is only kept once.
+    function stitch(indexes) {
+        const positions = [];
+        indexes.forEach((index, i) => {
+            const arc = index < 0 ? arcs[~index].slice().reverse() : arcs[index];
+            for (let j = i > 0 ? 1 : 0; j < arc.length; j++) {
+                positions.push(arc[j]);
+            }
+        });
+        return positions;
+    }
+
+    function decodeGeometry(geometry) {
+        switch (geometry.type) {
+            case 'Point':
+                return { type: 'Point', coordinates: toPosition(...geometry.coordinates) };
+            case 'MultiPoint':
+                return { type: 'MultiPoint', coordinates: geometry.coordinates.map(p => toPosition(...p)) };
+            case 'LineString':
+                return { type: 'LineString', coordinates: stitch(geometry.arcs) };
+            case 'MultiLineString':
+            case 'Polygon':
+                return { type: geometry.type, coordinates: geometry.arcs.map(stitch) };
+            case 'MultiPolygon':
+                return { type: 'MultiPolygon', coordinates: geometry.arcs.map(polygon => polygon.map(stitch)) };
+            default:
+                return {};
+        }
+    }
+
+    const collections = {};
+    Object.entries(topology.objects).forEach(([name, object]) => {
+        collections[name] = {
+            type: 'FeatureCollection',
+            features: object.geometries.map(geometry => ({
+                type: 'Feature',
+                id: geometry.id,
+                properties: geometry.properties || {},
+                geometry: decodeGeometry(geometry)
+            }))
+        };
+    });
+    return collections;
+}
+
 // Helper function to get centroid of polygon
 function getCentroid(coordinates) {
     let totalLat = 0;
@@ -154,7 +229,7 @@ function zoomToPoint(lat, lng) {
 async function initApp() {
     document.getElementById('dataStatus').textContent = 'Loading data from Django API...';
 
-    const allData = await loadJSONData(apiBaseUrl);
+    const allData = await loadMapData();
     if (!allData) {
         console.warn('Could not load data from Django API');
         document.getElementById('dataStatus').textContent = 'Failed to load data';
@@ -164,6 +239,7 @@ async function initApp() {
     municipalityData = allData.municipalities || { type: "FeatureCollection", features: [] };
     incidentsData = allData.incidents || { type: "FeatureCollection", features: [] };
     parksData = allData.parks || { type: "FeatureCollection", features: [] };
+    syncToken = allData.sync_token || null;
 
     document.getElementById('dataStatus').textContent = 'Data loaded from Django API';
 
@@ -173,6 +249,29 @@ async function initApp() {
     updateMap();
     updateMetrics();
     buildSearchIndex();
+    connectEventStream();
+}
+
+// Subscribe to live incident and discussion updates pushed by the server
+function connectEventStream() {
+    if (!window.EventSource) return;
+    let connectedBefore = false;
+    const source = new EventSource(streamUrl);
+
+    source.onopen = () => {
+        // Events sent while we were disconnected are lost, so catch up
+        if (connectedBefore) syncDataFromServer();
+        connectedBefore = true;
+    };
+    source.addEventListener('incidents', (e) => {
+        applyLayerChanges(incidentsData, { changed: JSON.parse(e.data), deleted: [] });
+        refreshDataViews();
+    });
+    source.addEventListener('post', (e) => {
+        const post = JSON.parse(e.data);
+        document.getElementById('dataStatus').textContent = `New post by ${post.author}: ${post.title}`;
+    });
+    source.addEventListener('resync', () => syncDataFromServer());
 }
 
 // Initialize the map
@@ -430,6 +529,19 @@ function addMunicipalities(filters) {
     }
 }
 
+// One line of discussion activity for an incident popup, from the counts
+// the server adds to each incident's properties
+function discussionSummary(props) {
+    const discussion = props.discussion;
+    if (!discussion || !discussion.posts) {
+        return '<small>No discussion yet</small><br>';
+    }
+    const plural = (count, noun) => `${count} ${noun}${count === 1 ? '' : 's'}`;
+    const lastPost = discussion.last_post_at ? `, last ${new Date(discussion.last_post_at).toLocaleDateString()}` : '';
+    return `<small>${plural(discussion.posts, 'post')}, ${plural(discussion.comments, 'comment')}, ` +
+        `${plural(discussion.likes, 'like')}${lastPost}</small><br>`;
+}
+
 function addIncidents(filters) {
     const floodGroup = L.featureGroup();
     const droughtGroup = L.featureGroup();
@@ -480,6 +592,7 @@ function addIncidents(filters) {
                             🔍 Take a Closer Look
                         </a>
                         <br>
+                        ${discussionSummary(props)}
                         <a href="${discussionUrl}" class="btn btn-primary btn-sm mt-2 view-discussion-btn" target="_blank">View Discussion</a>
                     </div>
                 `)
@@ -502,6 +615,7 @@ function addIncidents(filters) {
                         Started: ${props.started_at || 'Unknown'}<br>
                         ${props.description ? props.description.substring(0, 100) + '...' : ''}
                         <a href="#" class="zoom-link" onclick="zoomToFeature(${JSON.stringify(feature).replace(/"/g, '&quot;')}, this); return false;">🔍 Take a Closer Look</a><br>
+                        ${discussionSummary(props)}
                         <a href="${discussionUrl}" class="btn btn-primary btn-sm mt-2 view-discussion-btn" target="_blank">View Discussion</a>
                     </div>
                 `).addTo(droughtGroup);
@@ -523,6 +637,7 @@ function addIncidents(filters) {
                         Started: ${props.started_at || 'Unknown'}<br>
                         ${props.description ? props.description.substring(0, 100) + '...' : ''}
                         <a href="#" class="zoom-link" onclick="zoomToFeature(${JSON.stringify(feature).replace(/"/g, '&quot;')}, this); return false;">🔍 Take a Closer Look</a><br>
+                        ${discussionSummary(props)}
                         <a href="${discussionUrl}" class="btn btn-primary btn-sm mt-2 view-discussion-btn" target="_blank">View Discussion</a>
                     </div>
                 `).addTo(algalBloomGroup);
@@ -544,6 +659,7 @@ function addIncidents(filters) {
                         Started: ${props.started_at || 'Unknown'}<br>
                         ${props.description ? props.description.substring(0, 100) + '...' : ''}
                         <a href="#" class="zoom-link" onclick="zoomToFeature(${JSON.stringify(feature).replace(/"/g, '&quot;')}, this); return false;">🔍 Take a Closer Look</a><br>
+                        ${discussionSummary(props)}
                         <a href="${discussionUrl}" class="btn btn-primary btn-sm mt-2 view-discussion-btn" target="_blank">View Discussion</a>
                     </div>
                 `).addTo(contaminatedWaterGroup);
@@ -565,6 +681,7 @@ function addIncidents(filters) {
                         Started: ${props.started_at || 'Unknown'}<br>
                         ${props.description ? props.description.substring(0, 100) + '...' : ''}
                         <a href="#" class="zoom-link" onclick="zoomToFeature(${JSON.stringify(feature).replace(/"/g, '&quot;')}, this); return false;">🔍 Take a Closer Look</a><br>
+                        ${discussionSummary(props)}
                         <a href="${discussionUrl}" class="btn btn-primary btn-sm mt-2 view-discussion-btn" target="_blank">View Discussion</a>
                     </div>
                 `).addTo(hydroelectricDisruptionGroup);
@@ -586,6 +703,7 @@ function addIncidents(filters) {
                         Started: ${props.started_at || 'Unknown'}<br>
                         ${props.description ? props.description.substring(0, 100) + '...' : ''}
                         <a href="#" class="zoom-link" onclick="zoomToFeature(${JSON.stringify(feature).replace(/"/g, '&quot;')}, this); return false;">🔍 Take a Closer Look</a><br>
+                        ${discussionSummary(props)}
                         <a href="${discussionUrl}" class="btn btn-primary btn-sm mt-2 view-discussion-btn" target="_blank">View Discussion</a>
                     </div>
                 `).addTo(invasiveSpeciesGroup);
@@ -607,6 +725,7 @@ function addIncidents(filters) {
                         Started: ${props.started_at || 'Unknown'}<br>
                         ${props.description ? props.description.substring(0, 100) + '...' : ''}
                         <a href="#" class="zoom-link" onclick="zoomToFeature(${JSON.stringify(feature).replace(/"/g, '&quot;')}, this); return false;">🔍 Take a Closer Look</a><br>
+                        ${discussionSummary(props)}
                         <a href="${discussionUrl}" class="btn btn-primary btn-sm mt-2 view-discussion-btn" target="_blank">View Discussion</a>
                     </div>
                 `).addTo(decliningFishPopulationGroup);
@@ -747,7 +866,7 @@ function uploadFileToServer(file, data) {
     .then(result => {
         if (result.success) {
             showUploadResult(result);
-            reloadDataFromServer();
+            syncDataFromServer();
         } else {
             showError(result.message || 'Upload failed');
         }
@@ -756,18 +875,62 @@ function uploadFileToServer(file, data) {
 }
 
 async function reloadDataFromServer() {
-    const allData = await loadJSONData(apiBaseUrl);
+    const allData = await loadMapData();
     if (allData) {
         municipalityData = allData.municipalities;
         incidentsData = allData.incidents;
         parksData = allData.parks;
-        updateMap();
-        updateMetrics();
-        updateDataSummary();
-        buildSearchIndex();
-        const searchInput = document.getElementById('searchInput');
-        if (searchInput.value.trim()) onSearchInput();
+        syncToken = allData.sync_token || null;
+        refreshDataViews();
+    }
+}
+
+// Fetch only the features added, changed or removed since the last load
+// and patch them into the current data, falling back to a full reload.
+async function syncDataFromServer() {
+    if (!syncToken) {
+        await reloadDataFromServer();
+        return;
+    }
+    const changes = await loadJSONData(`${changesApiUrl}?since=${encodeURIComponent(syncToken)}`);
+    if (!changes) {
+        await reloadDataFromServer();
+        return;
     }
+    applyLayerChanges(municipalityData, changes.municipalities);
+    applyLayerChanges(incidentsData, changes.incidents);
+    applyLayerChanges(parksData, changes.parks);
+    syncToken = changes.sync_token;
+    refreshDataViews();
+}
+
+function applyLayerChanges(collection, changes) {
+    if (!collection || !changes) return;
+    if (changes.changed.length === 0 && changes.deleted.length === 0) return;
+
+    const deleted = new Set(changes.deleted);
+    const changed = new Map(changes.changed.map(feature => [feature.id, feature]));
+    const features = [];
+    collection.features.forEach(feature => {
+        if (deleted.has(feature.id)) return;
+        if (changed.has(feature.id)) {
+            features.push(changed.get(feature.id));
+            changed.delete(feature.id);
+        } else {
+            features.push(feature);
+        }
+    });
+    changed.forEach(feature => features.push(feature));
+    collection.features = features;
+}
+
+function refreshDataViews() {
+    updateMap();
+    updateMetrics();
+    updateDataSummary();
+    buildSearchIndex();
+    const searchInput = document.getElementById('searchInput');
+    if (searchInput.value.trim()) onSearchInput();
 }
 
 function showUploadResult(result) {
@@ -0,0 +1,112 @@
+"""
+Server-Sent Events stream of live dashboard updates.
+
+This is a plain ASGI handler rather than a Django view: Django 2.1 runs
+views synchronously, and an open stream would hold a worker thread for
+as long as the dashboard stays open. recap/asgi.py routes the stream URL
+here; under WSGI the URL falls back to views.api_stream.
+"""
+import asyncio
+import json
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib import auth
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+from recap.async_support import run_in_threadpool
+
+from .events import bus
+
+HEARTBEAT_INTERVAL = 15  # seconds
+RECONNECT_DELAY = 5000  # milliseconds, sent to the client as the SSE retry hint
+
+
+def scope_user(scope):
+    """Return the user owning the session cookie sent with an ASGI request"""
+    close_old_connections()
+    cookies = {}
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookies.update(parse_cookie(value.decode('latin1')))
+    engine = import_module(settings.SESSION_ENGINE)
+    request = HttpRequest()
+    request.session = engine.SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    try:
+        return auth.get_user(request)
+    finally:
+        close_old_connections()
+
+
+def format_event(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n".encode('utf-8')
+
+
+async def event_stream(scope, receive, send):
+    user = await run_in_threadpool(scope_user, scope)
+    if not user.is_authenticated:
+        await send({
+            'type': 'http.response.start',
+            'status': 403,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        await send({'type': 'http.response.body', 'body': b'Forbidden'})
+        return
+
+    subscription = bus.subscribe()
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f"retry: {RECONNECT_DELAY}\n\n".encode('ascii'),
+            'more_body': True,
+        })
+
+        streamer = asyncio.ensure_future(_send_events(send, subscription))
+        disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+        done, pending = await asyncio.wait(
+            {streamer, disconnect}, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in pending:
+            task.cancel()
+        for task in done:
+            # A failed send means the client went away; nothing to report
+            task.exception()
+    finally:
+        bus.unsubscribe(subscription)
+
+
+async def _send_events(send, subscription):
+    while True:
+        try:
+            event_type, data = await asyncio.wait_for(
+                subscription.queue.get(), HEARTBEAT_INTERVAL
+            )
+        except asyncio.TimeoutError:
+            chunk = b': heartbeat\n\n'
+        else:
+            chunk = format_event(event_type, data)
+
+        if subscription.overflowed:
+            # The client fell too far behind; have it fetch a delta sync
+            subscription.reset()
+            chunk = format_event('resync', {})
+
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
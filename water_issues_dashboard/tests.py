@@ -1,3 +1,702 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import struct
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from recap import compression
+from . import wkb
+from recap.testing import (
+    LOCAL_CACHES, NO_CACHES, AsgiRequest, ContentSeeder, QueryCountMixin, QueryPlanMixin, run_asgi,
+)
+from . import events, stream, views
+from .cache import invalidate_now
+from .events import EventBus, Subscription
+from .models import DeletedFeature, Incident, Municipality, Park
+from .topojson import encode_topology
+from .views import SYNC_TOKEN_OVERLAP, process_geojson_file
+
+POINT = {'type': 'Point', 'coordinates': [-97.1, 49.9]}
+
+
+@override_settings(CACHES=NO_CACHES)
+class DeltaSyncTests(TestCase):
+    """The changes API returns what was changed or deleted since a sync token"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('syncer', 'syncer@example.com', 'syncer-password'))
+        self.token = timezone.now() - timedelta(hours=1)
+
+    def changes(self, since, **params):
+        response = self.client.get(reverse('water_issues_dashboard:api_geojson_changes'), {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def changed_ids(self, data, layer):
+        return {feature['id'] for feature in data[layer]['changed']}
+
+    def incident(self, name, updated_at):
+        incident = Incident.objects.create(name=name, incident_type='flood', status='confirmed', geometry=POINT)
+        Incident.objects.filter(pk=incident.pk).update(updated_at=updated_at)
+        return incident
+
+    def test_changed_since_token(self):
+        old = self.incident('Old flood', self.token - timedelta(days=1))
+        new = self.incident('New flood', self.token + timedelta(minutes=1))
+        park = Park.objects.create(name='Spruce Woods', geometry=POINT)
+
+        data = self.changes(self.token.isoformat())
+        self.assertEqual(self.changed_ids(data, 'incidents'), {new.id})
+        self.assertNotIn(old.id, self.changed_ids(data, 'incidents'))
+        self.assertEqual(self.changed_ids(data, 'parks'), {park.id})
+        self.assertEqual(self.changes(data['sync_token'])['incidents']['changed'], [])
+
+        data = self.changes(self.token.isoformat(), type='incidents')
+        self.assertEqual(self.changed_ids(data, 'incidents'), {new.id})
+        self.assertEqual(data['parks']['changed'], [])
+
+    def test_overlap_before_token(self):
+        inside = self.incident('Late commit', self.token - SYNC_TOKEN_OVERLAP + timedelta(seconds=1))
+        self.incident('Earlier flood', self.token - SYNC_TOKEN_OVERLAP - timedelta(seconds=1))
+
+        self.assertEqual(self.changed_ids(self.changes(self.token.isoformat()), 'incidents'), {inside.id})
+
+    def test_deletes_are_tombstones(self):
+        incident = self.incident('Washed out', self.token - timedelta(days=1))
+        Municipality.objects.create(name='Brandon', status='city', geometry=POINT).delete()
+        DeletedFeature.objects.filter(layer='municipalities').update(deleted_at=self.token - timedelta(days=1))
+        incident_id = incident.id
+        incident.delete()
+
+        data = self.changes(self.token.isoformat())
+        self.assertEqual(data['incidents'], {'changed': [], 'deleted': [incident_id]})
+        self.assertEqual(data['municipalities']['deleted'], [])
+
+    def test_bulk_update_is_synced(self):
+        incident = self.incident('Flood', self.token - timedelta(days=1))
+        Incident.objects.filter(pk=incident.pk).update(status='suspected')
+
+        data = self.changes(self.token.isoformat())
+        self.assertEqual([feature['properties']['status'] for feature in data['incidents']['changed']], ['suspected'])
+
+    def test_invalid_token(self):
+        url = reverse('water_issues_dashboard:api_geojson_changes')
+        for params in [{}, {'since': ''}, {'since': 'yesterday'}, {'since': '2020-13-40T00:00:00+00:00'},
+                       {'since': '2020-01-01T00:00:00'}]:
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', json.loads(response.content))
+
+
+def square(x, y, size=1):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+class WkbTests(SimpleTestCase):
+    GEOMETRIES = [
+        {'type': 'Point', 'coordinates': [-97.1, 49.9]},
+        {'type': 'Point', 'coordinates': [-97.1, 49.9, 231.5]},
+        {'type': 'LineString', 'coordinates': [[0.0, 0.0], [1.5, 2.25], [3.0, -1.0]]},
+        {'type': 'Polygon', 'coordinates': [square(0, 0, 4), square(1, 1)[::-1], square(2.5, 2.5, 0.5)[::-1]]},
+        {'type': 'MultiPoint', 'coordinates': [[0.0, 0.0], [1.0, 1.0]]},
+        {'type': 'MultiLineString', 'coordinates': [[[0.0, 0.0], [1.0, 1.0]], [[2.0, 2.0], [3.0, 3.0], [4.0, 2.0]]]},
+        {'type': 'MultiPolygon', 'coordinates': [[square(0, 0)], [square(5, 5, 3), square(6, 6)[::-1]]]},
+        {'type': 'MultiPolygon', 'coordinates': [[[[0.0, 0.0, 1.0], [1.0, 0.0, 2.0], [1.0, 1.0, 3.0], [0.0, 0.0, 1.0]]]]},
+        {'type': 'GeometryCollection', 'geometries': [
+            {'type': 'Point', 'coordinates': [1.0, 2.0]},
+            {'type': 'Polygon', 'coordinates': [square(0, 0)]},
+        ]},
+    ]
+
+    def test_round_trip(self):
+        for geometry in self.GEOMETRIES:
+            with self.subTest(geometry=geometry['type']):
+                self.assertEqual(wkb.loads(wkb.dumps(geometry)), geometry)
+
+    def test_iso_encoding(self):
+        self.assertEqual(wkb.dumps({'type': 'Point', 'coordinates': [1, 2]}), struct.pack('<BIdd', 1, 1, 1.0, 2.0))
+        self.assertEqual(
+            wkb.dumps({'type': 'Point', 'coordinates': [1, 2, 3]}), struct.pack('<BIddd', 1, 1001, 1.0, 2.0, 3.0)
+        )
+        polygon = wkb.dumps({'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [0, 1], [0, 0]]]})
+        self.assertEqual(polygon, struct.pack('<BIII8d', 1, 3, 1, 4, 0, 0, 1, 0, 0, 1, 0, 0))
+
+    def test_big_endian(self):
+        point = struct.pack('>BIdd', 0, 1, 1.0, 2.0)
+        line = struct.pack('>BII4d', 0, 2, 2, 0.0, 1.0, 2.0, 3.0)
+        self.assertEqual(wkb.loads(point), {'type': 'Point', 'coordinates': [1.0, 2.0]})
+        self.assertEqual(wkb.loads(line), {'type': 'LineString', 'coordinates': [[0.0, 1.0], [2.0, 3.0]]})
+        multi = struct.pack('>BII', 0, 4, 1) + point
+        self.assertEqual(wkb.loads(multi), {'type': 'MultiPoint', 'coordinates': [[1.0, 2.0]]})
+
+    def test_invalid(self):
+        point = wkb.dumps({'type': 'Point', 'coordinates': [1, 2]})
+        for data in [b'', point[:-1], point + b'\0', b'\x02' + point[1:], struct.pack('<BI', 1, 99)]:
+            with self.subTest(data=data):
+                with self.assertRaises(ValueError):
+                    wkb.loads(data)
+        for geometry in [
+            None, {'type': 'Circle', 'coordinates': [0, 0]}, {'type': 'Polygon'},
+            {'type': 'LineString', 'coordinates': [[0, 0], [1]]}, {'type': 'LineString', 'coordinates': [['a', 'b']]},
+            {'type': 'GeometryCollection', 'geometries': None},
+        ]:
+            with self.subTest(geometry=geometry):
+                with self.assertRaises(ValueError):
+                    wkb.dumps(geometry)
+
+
+class GeometryFieldTests(TestCase):
+    """Geometries are stored as WKB and decoded when first read"""
+
+    def setUp(self):
+        self.geometry = {'type': 'Polygon', 'coordinates': [square(-98, 49, 2), square(-97.5, 49.5, 0.5)[::-1]]}
+        self.municipality = Municipality.objects.create(name='Brandon', status='city', geometry=self.geometry)
+
+    def test_decoded_on_first_read(self):
+        with mock.patch.object(wkb, 'loads', wraps=wkb.loads) as loads:
+            municipality = Municipality.objects.get(pk=self.municipality.pk)
+            self.assertEqual(loads.call_count, 0)
+            self.assertEqual(municipality.geometry, self.geometry)
+            self.assertEqual(municipality.geometry, self.geometry)
+            self.assertEqual(loads.call_count, 1)
+
+    def test_stored_as_wkb(self):
+        stored, = Municipality.objects.filter(pk=self.municipality.pk).values_list('geometry', flat=True)
+        self.assertEqual(bytes(stored), wkb.dumps(self.geometry))
+
+    def test_save_without_decoding(self):
+        with mock.patch.object(wkb, 'loads', wraps=wkb.loads) as loads:
+            municipality = Municipality.objects.get(pk=self.municipality.pk)
+            municipality.name = 'Brandon West'
+            municipality.save()
+            self.assertEqual(loads.call_count, 0)
+        self.assertEqual(Municipality.objects.get(pk=self.municipality.pk).geometry, self.geometry)
+
+    def test_changed_geometry_saved(self):
+        municipality = Municipality.objects.get(pk=self.municipality.pk)
+        municipality.geometry = POINT
+        municipality.save()
+        self.assertEqual(Municipality.objects.get(pk=self.municipality.pk).geometry, POINT)
+
+    def test_deferred(self):
+        municipality = Municipality.objects.defer('geometry').get(pk=self.municipality.pk)
+        self.assertNotIn('geometry', municipality.__dict__)
+        with self.assertNumQueries(1):
+            self.assertEqual(municipality.geometry, self.geometry)
+            self.assertEqual(municipality.geometry, self.geometry)
+
+    def test_empty_geometry(self):
+        park = Park.objects.create(name='Nowhere', geometry={})
+        self.assertIsNone(Park.objects.get(pk=park.pk).geometry)
+
+
+class GeometryMigrationTests(TransactionTestCase):
+    """0003_geometry_wkb copies the JSON geometries into the WKB column and back"""
+
+    before = [('water_issues_dashboard', '0002_delta_sync')]
+    after = [('water_issues_dashboard', '0003_geometry_wkb')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_copy(self):
+        polygon = {'type': 'Polygon', 'coordinates': [square(-98, 49, 2)]}
+        apps = self.migrate(self.before)
+        HistoricalMunicipality = apps.get_model('water_issues_dashboard', 'Municipality')
+        HistoricalIncident = apps.get_model('water_issues_dashboard', 'Incident')
+        municipality = HistoricalMunicipality.objects.create(name='Brandon', status='city', geometry=polygon)
+        incident = HistoricalIncident.objects.create(
+            name='Flood', incident_type='flood', status='confirmed', geometry=POINT
+        )
+
+        apps = self.migrate(self.after)
+        stored = apps.get_model('water_issues_dashboard', 'Municipality').objects.values_list('geometry', flat=True)
+        self.assertEqual([bytes(value) for value in stored], [wkb.dumps(polygon)])
+        self.assertEqual(apps.get_model('water_issues_dashboard', 'Incident').objects.get().geometry, POINT)
+
+        apps = self.migrate(self.before)
+        self.assertEqual(
+            apps.get_model('water_issues_dashboard', 'Municipality').objects.get(pk=municipality.pk).geometry, polygon
+        )
+        self.assertEqual(apps.get_model('water_issues_dashboard', 'Incident').objects.get(pk=incident.pk).geometry, POINT)
+
+
+def decode_arcs(topology):
+    """The arcs of a topology as lists of quantized positions"""
+    arcs = []
+    for arc in topology['arcs']:
+        x = y = 0
+        points = []
+        for dx, dy in arc:
+            x, y = x + dx, y + dy
+            points.append((x, y))
+        arcs.append(points)
+    return arcs
+
+
+def decode_ring(arcs, indexes):
+    ring = []
+    for index in indexes:
+        points = arcs[index] if index >= 0 else arcs[~index][::-1]
+        ring.extend(points[1:] if ring else points)
+    return ring
+
+
+def canonical_ring(points):
+    """A ring's distinct positions, starting from the smallest, for comparing rings up to rotation"""
+    points = [tuple(point) for point in points]
+    deduped = [point for i, point in enumerate(points) if i == 0 or point != points[i - 1]]
+    if len(deduped) > 1 and deduped[0] == deduped[-1]:
+        deduped.pop()
+    start = deduped.index(min(deduped))
+    return deduped[start:] + deduped[:start]
+
+
+def collection(*geometries):
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': i, 'geometry': geometry, 'properties': {'n': i}}
+        for i, geometry in enumerate(geometries)
+    ]}
+
+
+class TopologyTests(SimpleTestCase):
+    """TopoJSON decodes back to the GeoJSON it was encoded from, to within its quantization"""
+
+    def assertRoundTrip(self, collections, quantization=10000):
+        topology = encode_topology(collections, quantization)
+        arcs = decode_arcs(topology)
+        (sx, sy), (tx, ty) = topology['transform']['scale'], topology['transform']['translate']
+
+        def quantize(position):
+            return (round((position[0] - tx) / sx), round((position[1] - ty) / sy))
+
+        for name, features in collections.items():
+            geometries = topology['objects'][name]['geometries']
+            self.assertEqual(len(geometries), len(features['features']))
+            for feature, geometry in zip(features['features'], geometries):
+                self.assertEqual((geometry['id'], geometry['properties']), (feature['id'], feature['properties']))
+                original = feature['geometry']
+                self.assertEqual(geometry['type'], original['type'])
+                if original['type'] == 'Point':
+                    self.assertEqual(tuple(geometry['coordinates']), quantize(original['coordinates']))
+                    continue
+                polygons = [original['coordinates']] if original['type'] == 'Polygon' else original['coordinates']
+                encoded = [geometry['arcs']] if original['type'] == 'Polygon' else geometry['arcs']
+                self.assertEqual(len(encoded), len(polygons))
+                for rings, ring_arcs in zip(polygons, encoded):
+                    self.assertEqual(len(ring_arcs), len(rings))
+                    for ring, indexes in zip(rings, ring_arcs):
+                        decoded = decode_ring(arcs, indexes)
+                        self.assertEqual(decoded[0], decoded[-1])
+                        self.assertEqual(canonical_ring(decoded), canonical_ring(map(quantize, ring)))
+                        # Each position is within half a grid step of where it was
+                        for position in ring:
+                            qx, qy = quantize(position)
+                            self.assertLessEqual(abs(qx * sx + tx - position[0]), sx / 2 + 1e-9)
+                            self.assertLessEqual(abs(qy * sy + ty - position[1]), sy / 2 + 1e-9)
+        return topology
+
+    def test_shared_border_is_one_arc(self):
+        topology = self.assertRoundTrip({'municipalities': collection(
+            {'type': 'Polygon', 'coordinates': [square(0, 0)]},
+            {'type': 'Polygon', 'coordinates': [square(1, 0)]},
+        )})
+        first, second = (geometry['arcs'][0] for geometry in topology['objects']['municipalities']['geometries'])
+        # Each square is cut where the border starts and ends, and the
+        # second runs along the border the other way
+        self.assertEqual(len(topology['arcs']), 3)
+        self.assertEqual(len(set(first) | {~index for index in second if index < 0}), 2)
+
+    def test_ring_shared_whole(self):
+        topology = self.assertRoundTrip({
+            'parks': collection({'type': 'Polygon', 'coordinates': [square(0, 0, 2)]}),
+            'incidents': collection({'type': 'Polygon', 'coordinates': [square(0, 0, 2)[2:] + square(0, 0, 2)[1:3]]}),
+        })
+        self.assertEqual(len(topology['arcs']), 1)
+
+    def test_geometry_types(self):
+        self.assertRoundTrip({
+            'incidents': collection(
+                {'type': 'Point', 'coordinates': [0.5, 0.5]},
+                {'type': 'Polygon', 'coordinates': [square(0, 0, 4), square(1, 1)[::-1]]},
+                {'type': 'MultiPolygon', 'coordinates': [[square(5, 5)], [square(7, 7), square(7.25, 7.25, 0.5)[::-1]]]},
+            ),
+        })
+
+    def test_quantization_bounds(self):
+        # Nearby positions collapse into one at a coarse quantization
+        for quantization in [1000, 10 ** 6]:
+            with self.subTest(quantization=quantization):
+                topology = self.assertRoundTrip({'parks': collection(
+                    {'type': 'Polygon', 'coordinates': [[[0, 0], [10, 0], [10, 0.0001], [10, 10], [0, 10], [0, 0]]]},
+                )}, quantization)
+                for arc in decode_arcs(topology):
+                    for x, y in arc:
+                        self.assertTrue(0 <= x < quantization and 0 <= y < quantization)
+
+    def test_bundled_municipalities(self):
+        with open(os.path.join(settings.BASE_DIR, 'data', 'mb_with_winnipeg.geojson')) as f:
+            municipalities = json.load(f)
+        for i, feature in enumerate(municipalities['features']):
+            feature['id'] = i
+        self.assertRoundTrip({'municipalities': municipalities}, quantization=100000)
+
+
+def drain(subscription):
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+
+class EventBusTests(SimpleTestCase):
+    def test_publish_to_subscribers(self):
+        bus = EventBus()
+
+        async def scenario():
+            first, second = bus.subscribe(), bus.subscribe()
+            bus.publish('incidents', [1])
+            bus.unsubscribe(second)
+            bus.publish('incidents', [2])
+            # Deliveries are scheduled on the loop
+            await asyncio.sleep(0)
+            return drain(first), drain(second)
+
+        first, second = asyncio.run(scenario())
+        self.assertEqual(first, [('incidents', [1]), ('incidents', [2])])
+        self.assertEqual(second, [('incidents', [1])])
+
+    def test_overflow_and_reset(self):
+        async def scenario():
+            subscription = Subscription(asyncio.get_running_loop(), maxsize=2)
+            for i in range(3):
+                subscription.deliver(('incidents', [i]))
+            await asyncio.sleep(0)
+            overflowed, queued = subscription.overflowed, subscription.queue.qsize()
+            subscription.reset()
+            return overflowed, queued, subscription
+
+        overflowed, queued, subscription = asyncio.run(scenario())
+        self.assertTrue(overflowed)
+        self.assertEqual(queued, 2)
+        self.assertFalse(subscription.overflowed)
+        self.assertTrue(subscription.queue.empty())
+
+    def test_closed_loop_is_unsubscribed(self):
+        bus = EventBus()
+
+        async def subscribe():
+            return bus.subscribe()
+
+        self.assertFalse(bus.has_subscribers())
+        subscription = asyncio.run(subscribe())
+        self.assertTrue(bus.has_subscribers())
+        bus.publish('incidents', [1])
+        self.assertNotIn(subscription, bus._subscribers)
+        self.assertFalse(bus.has_subscribers())
+
+    def test_format_event(self):
+        created = datetime(2020, 5, 1, 12, 30, tzinfo=timezone.utc)
+        chunk = stream.format_event('incidents', [{'created_at': created}])
+        event_type, data = chunk.decode().split('\n')[:2]
+        self.assertEqual(event_type, 'event: incidents')
+        self.assertEqual(json.loads(data[len('data: '):]), [{'created_at': '2020-05-01T12:30:00Z'}])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class IncidentEventTests(TransactionTestCase):
+    """Incidents are published on the bus once saved, in one event per transaction"""
+
+    def setUp(self):
+        patcher = mock.patch.object(events.bus, 'publish')
+        self.publish = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(events.bus, 'has_subscribers', return_value=True)
+        self.has_subscribers = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def published(self):
+        return [
+            [(feature['id'], feature['properties']['status']) for feature in call[0][1]]
+            for call in self.publish.call_args_list if call[0][0] == 'incidents'
+        ]
+
+    def incident(self, name, status='suspected'):
+        return Incident.objects.create(name=name, incident_type='flood', status=status, geometry=POINT)
+
+    def test_new_and_updated(self):
+        incident = self.incident('Flood')
+        incident.status = 'confirmed'
+        incident.save()
+        self.assertEqual(self.published(), [[(incident.id, 'suspected')], [(incident.id, 'confirmed')]])
+
+    def test_one_event_per_transaction(self):
+        with transaction.atomic():
+            first = self.incident('First flood')
+            # Without a savepoint, so it can't be rolled back on its own
+            with transaction.atomic(savepoint=False):
+                second = self.incident('Second flood')
+            third = self.incident('Third flood')
+            self.assertEqual(self.published(), [])
+        self.assertEqual(
+            self.published(), [[(first.id, 'suspected'), (second.id, 'suspected'), (third.id, 'suspected')]],
+        )
+
+    def test_rolled_back(self):
+        with transaction.atomic():
+            kept = self.incident('Kept flood')
+            try:
+                with transaction.atomic():
+                    self.incident('Dropped flood')
+                    raise ValueError
+            except ValueError:
+                pass
+            after = self.incident('Later flood')
+        try:
+            with transaction.atomic():
+                self.incident('Failed flood')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(self.published(), [[(kept.id, 'suspected')], [(after.id, 'suspected')]])
+
+    def test_no_subscribers(self):
+        self.has_subscribers.return_value = False
+        with mock.patch.object(views, 'incident_feature') as incident_feature:
+            self.incident('Unwatched flood')
+        incident_feature.assert_not_called()
+        self.assertEqual(self.published(), [])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class EventStreamTests(TransactionTestCase):
+    """The event stream sends the bus's events to logged in users"""
+
+    def setUp(self):
+        from recap.asgi import application
+        self.application = application
+        self.client.force_login(User.objects.create_user('watcher', 'watcher@example.com', 'watcher-password'))
+        self.cookies = {settings.SESSION_COOKIE_NAME: self.client.cookies[settings.SESSION_COOKIE_NAME].value}
+        self.url = reverse('water_issues_dashboard:api_stream')
+
+    def test_requires_login(self):
+        request, = run_asgi(self.application, AsgiRequest(self.url))
+        self.assertEqual(request.status, 403)
+
+    def test_streams_events(self):
+        request = AsgiRequest(self.url, cookies=self.cookies)
+
+        async def scenario():
+            task = asyncio.ensure_future(request(self.application))
+            await request.wait_for(b'retry: ')
+            events.bus.publish('incidents', [{'id': 1}])
+            await request.wait_for(b'event: incidents\ndata: [{"id": 1}]\n\n')
+            await request.wait_for(b': heartbeat')
+            request.disconnect()
+            await asyncio.wait_for(task, 5)
+
+        with mock.patch.object(stream, 'HEARTBEAT_INTERVAL', 0.01):
+            asyncio.run(scenario())
+        self.assertEqual(request.status, 200)
+        self.assertEqual(request.response_headers['content-type'], 'text/event-stream')
+        self.assertFalse(events.bus._subscribers)
+
+    def test_resync_after_overflow(self):
+        request = AsgiRequest(self.url, cookies=self.cookies)
+
+        async def scenario():
+            task = asyncio.ensure_future(request(self.application))
+            await request.wait_for(b'retry: ')
+            for i in range(events.SUBSCRIBER_QUEUE_SIZE + 10):
+                events.bus.publish('incidents', [{'id': i}])
+            await request.wait_for(b'event: resync')
+            request.disconnect()
+            await asyncio.wait_for(task, 5)
+
+        asyncio.run(scenario())
+        # Events queued before the overflow was noticed are dropped with it
+        self.assertLess(request.content.count(b'event: incidents'), events.SUBSCRIBER_QUEUE_SIZE)
+
+
+@override_settings(CACHES=NO_CACHES)
+class HotQueryPlanTests(QueryPlanMixin, TestCase):
+    """The dashboard's filters and lookups are served by indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', 'planner@example.com', 'planner-password')
+        Municipality.objects.create(name='Brandon', status='city', population_2021=51313, geometry=POINT)
+        Park.objects.create(name='Spruce Woods', geometry=POINT)
+        Incident.objects.create(name='Red River flood', incident_type='flood', status='confirmed', geometry=POINT)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_dashboard_filters(self):
+        # Counting every park is the one query that reads a whole table
+        with self.assertUsesIndexes(allowed_scans={'water_issues_dashboard_park'}):
+            self.client.get(reverse('water_issues_dashboard:home'))
+            self.client.get(reverse('water_issues_dashboard:home'), {
+                'statusCity': 'false', 'popMin': 1000, 'popMax': 50000,
+                'showFloods': 'false', 'statusSuspected': 'false',
+            })
+
+    def test_changes_since_sync_token(self):
+        with self.assertUsesIndexes():
+            self.client.get(reverse('water_issues_dashboard:api_geojson_changes'), {'since': '2020-01-01T00:00:00+00:00'})
+
+    def test_upload_duplicate_check(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.geojson') as f:
+            json.dump({'type': 'FeatureCollection', 'features': [
+                {'type': 'Feature', 'geometry': POINT, 'properties': {'name': 'Red River flood', 'type': 'flood'}},
+            ]}, f)
+            f.flush()
+            upload = SimpleNamespace(file=SimpleNamespace(path=f.name), uploaded_by=self.user)
+            with self.assertUsesIndexes():
+                process_geojson_file(upload)
+
+
+@override_settings(CACHES=NO_CACHES)
+class DashboardSummaryTests(TestCase):
+    def test_counts_by_type_and_status(self):
+        for name, incident_type, status in [
+            ('Red River flood', 'flood', 'confirmed'),
+            ('Assiniboine flood', 'flood', 'suspected'),
+            ('Lake Winnipeg bloom', 'algal bloom', 'confirmed'),
+        ]:
+            Incident.objects.create(name=name, incident_type=incident_type, status=status, geometry=POINT)
+        self.client.force_login(User.objects.create_user('viewer', 'viewer@example.com', 'viewer-password'))
+
+        response = self.client.get(reverse('water_issues_dashboard:home'))
+        self.assertEqual(response.context['incident_count'], 3)
+        for line in [
+            '💧 Flood: 2', '🌵 Drought: 0', '🦠 Algal Bloom: 1', '✅ Confirmed: 2', '⚠️ Suspected: 1',
+        ]:
+            self.assertContains(response, f'<li>{line}</li>', html=True)
+
+
+@override_settings(CACHES=NO_CACHES)
+class ViewQueryCountTests(QueryCountMixin, TestCase):
+    """Each dashboard page and API runs the same number of queries however many features there are"""
+
+    def setUp(self):
+        self.seed = ContentSeeder()
+        self.client.force_login(self.seed.user)
+
+    def assertConstantGet(self, name, params=None):
+        url = reverse(f'water_issues_dashboard:{name}')
+        self.assertConstantQueries(lambda: self.client.get(url, params or {}), self.seed)
+
+    def test_dashboard_home(self):
+        self.assertConstantGet('home')
+
+    def test_geojson(self):
+        self.assertConstantGet('api_geojson')
+
+    def test_topojson(self):
+        self.assertConstantGet('api_geojson', {'format': 'topojson'})
+
+    def test_changes(self):
+        self.assertConstantGet('api_geojson_changes', {'since': '2020-01-01T00:00:00+00:00'})
+
+    def test_search(self):
+        self.assertConstantGet('api_search', {'q': 'Red River'})
+
+    def test_stream_fallback(self):
+        self.assertConstantGet('api_stream')
+
+    def test_upload(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        uploads = iter(range(1, 100))
+
+        def upload():
+            batch = next(uploads)
+            content = json.dumps({'type': 'FeatureCollection', 'features': [
+                {'type': 'Feature', 'geometry': POINT, 'properties': {'name': f'Upload {batch}-{i}', 'type': 'flood'}}
+                for i in range(3)
+            ]})
+            self.client.post(reverse('water_issues_dashboard:upload'), {
+                'file': SimpleUploadedFile('incidents.geojson', content.encode()),
+            })
+
+        self.assertConstantQueries(upload, self.seed)
+
+    def test_report_form(self):
+        self.assertConstantGet('report_incident')
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class CompressedMapDataTests(TestCase):
+    def setUp(self):
+        # Map data cached by earlier tests
+        invalidate_now()
+        self.client.force_login(User.objects.create_user('mapper', 'mapper@example.com', 'mapper-password'))
+        for i in range(20):
+            Municipality.objects.create(name=f'Municipality {i}', status='town', geometry=POINT)
+
+    def get(self, accept_encoding):
+        return self.client.get(reverse('water_issues_dashboard:api_geojson'), HTTP_ACCEPT_ENCODING=accept_encoding)
+
+    def test_compressed_once_per_data_version(self):
+        plain = self.get('identity')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        with mock.patch.object(compression, 'compress', wraps=compression.compress) as compress:
+            first = self.get('gzip, deflate')
+            second = self.get('gzip;q=1.0, br;q=0')
+            self.assertEqual(compress.call_count, 1)
+
+            Municipality.objects.create(name='Brandon', status='city', geometry=POINT)
+            invalidate_now()
+            self.get('gzip')
+            self.assertEqual(compress.call_count, 2)
+
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(first.content), plain.content)
+        self.assertEqual(second.content, first.content)
+
+    def test_invalidated_between_content_and_compression(self):
+        stale = self.get('identity').content
+        self.assertNotIn(b'Brandon', stale)
+        Municipality.objects.create(name='Brandon', status='city', geometry=POINT)
+        observe_payload = views.GEOJSON_PAYLOAD_BYTES.labels
+
+        def invalidated_meanwhile(**labels):
+            # The data changes after the content was looked up
+            invalidate_now()
+            return observe_payload(**labels)
+
+        with mock.patch.object(views.GEOJSON_PAYLOAD_BYTES, 'labels', side_effect=invalidated_meanwhile):
+            response = self.get('gzip')
+        self.assertEqual(gzip.decompress(response.content), stale)
+        # The copy compressed from the old content wasn't filed under the new version
+        fresh = self.get('gzip')
+        self.assertNotEqual(gzip.decompress(fresh.content), stale)
+        self.assertEqual(gzip.decompress(fresh.content), self.get('identity').content)
@@ -0,0 +1,217 @@
+"""
+TopoJSON encoding for the map API.
+
+Coordinates are quantized to an integer grid and every polygon ring or
+line is cut into arcs at the points where neighbouring geometries meet.
+Each arc is stored once, even when two municipalities share the border,
+and its positions are delta-encoded, which keeps the numbers short.
+See https://github.com/topojson/topojson-specification.
+"""
+
+DEFAULT_QUANTIZATION = 100000
+
+
+def encode_topology(collections, quantization=DEFAULT_QUANTIZATION):
+    """Encode a dict of named GeoJSON FeatureCollections as one Topology"""
+    bbox = _bounding_box(collections)
+    x0, y0, x1, y1 = bbox
+    kx = (quantization - 1) / (x1 - x0) if x1 > x0 else 1
+    ky = (quantization - 1) / (y1 - y0) if y1 > y0 else 1
+
+    def quantize(position):
+        return (round((position[0] - x0) * kx), round((position[1] - y0) * ky))
+
+    builder = _ArcBuilder()
+    encoded = {}
+    for name, collection in collections.items():
+        encoded[name] = [
+            (feature, _quantize_geometry(feature.get('geometry') or {}, quantize, builder))
+            for feature in collection['features']
+        ]
+
+    objects = {}
+    for name, features in encoded.items():
+        geometries = []
+        for feature, geometry in features:
+            geometry = builder.encode(geometry)
+            if feature.get('id') is not None:
+                geometry['id'] = feature['id']
+            geometry['properties'] = feature.get('properties') or {}
+            geometries.append(geometry)
+        objects[name] = {'type': 'GeometryCollection', 'geometries': geometries}
+
+    return {
+        'type': 'Topology',
+        'bbox': list(bbox),
+        'transform': {
+            'scale': [1 / kx, 1 / ky],
+            'translate': [x0, y0],
+        },
+        'objects': objects,
+        'arcs': [_delta_encode(arc) for arc in builder.arcs],
+    }
+
+
+def _positions(geometry):
+    coordinates = geometry.get('coordinates')
+    depth = {
+        'Point': 0, 'MultiPoint': 1, 'LineString': 1,
+        'MultiLineString': 2, 'Polygon': 2, 'MultiPolygon': 3,
+    }.get(geometry.get('type'))
+    if depth is None or coordinates is None:
+        return
+    stack = [(coordinates, depth)]
+    while stack:
+        value, level = stack.pop()
+        if level == 0:
+            yield value
+        else:
+            stack.extend((item, level - 1) for item in value)
+
+
+def _bounding_box(collections):
+    xs, ys = [], []
+    for collection in collections.values():
+        for feature in collection['features']:
+            for position in _positions(feature.get('geometry') or {}):
+                xs.append(position[0])
+                ys.append(position[1])
+    if not xs:
+        return (0, 0, 0, 0)
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def _quantize_geometry(geometry, quantize, builder):
+    """Quantize a geometry, registering its rings and lines with the builder"""
+    geometry_type = geometry.get('type')
+    coordinates = geometry.get('coordinates')
+    if coordinates is None:
+        return {'type': None}
+
+    def ring(positions):
+        return builder.add_ring([quantize(p) for p in positions])
+
+    def line(positions):
+        return builder.add_line([quantize(p) for p in positions])
+
+    if geometry_type == 'Point':
+        return {'type': 'Point', 'coordinates': list(quantize(coordinates))}
+    if geometry_type == 'MultiPoint':
+        return {'type': 'MultiPoint', 'coordinates': [list(quantize(p)) for p in coordinates]}
+    if geometry_type == 'LineString':
+        return {'type': 'LineString', 'arcs': line(coordinates)}
+    if geometry_type == 'MultiLineString':
+        return {'type': 'MultiLineString', 'arcs': [line(l) for l in coordinates]}
+    if geometry_type == 'Polygon':
+        return {'type': 'Polygon', 'arcs': [ring(r) for r in coordinates]}
+    if geometry_type == 'MultiPolygon':
+        return {'type': 'MultiPolygon', 'arcs': [[ring(r) for r in polygon] for polygon in coordinates]}
+    return {'type': None}
+
+
+class _ArcBuilder:
+    """Collects quantized rings and lines and cuts them into shared arcs"""
+
+    def __init__(self):
+        self.parts = []  # (points, is_ring)
+        self.neighbours = {}
+        self.junctions = set()
+        self.arcs = []
+        self.arc_index = {}
+
+    def add_ring(self, points):
+        points = _dedupe(points)
+        if len(points) > 1 and points[0] == points[-1]:
+            points.pop()
+        self._visit(points, is_ring=True)
+        self.parts.append((points, True))
+        return len(self.parts) - 1
+
+    def add_line(self, points):
+        points = _dedupe(points)
+        self._visit(points, is_ring=False)
+        if points:
+            self.junctions.add(points[0])
+            self.junctions.add(points[-1])
+        self.parts.append((points, False))
+        return len(self.parts) - 1
+
+    def _visit(self, points, is_ring):
+        # A point is a junction if it is seen with two different pairs of
+        # neighbours, i.e. where shared and unshared boundaries meet.
+        n = len(points)
+        for i, point in enumerate(points):
+            if is_ring:
+                before, after = points[i - 1], points[(i + 1) % n]
+            else:
+                before = points[i - 1] if i > 0 else None
+                after = points[i + 1] if i < n - 1 else None
+            pair = frozenset((before, after))
+            seen = self.neighbours.setdefault(point, pair)
+            if seen != pair:
+                self.junctions.add(point)
+
+    def encode(self, geometry):
+        """Replace part indexes in a quantized geometry with arc indexes"""
+        if geometry['type'] in ('LineString', 'Polygon', 'MultiLineString', 'MultiPolygon'):
+            geometry['arcs'] = self._encode_arcs(geometry['arcs'])
+        return geometry
+
+    def _encode_arcs(self, value):
+        if isinstance(value, list):
+            return [self._encode_arcs(item) for item in value]
+        points, is_ring = self.parts[value]
+        return self._cut_ring(points) if is_ring else self._cut_line(points)
+
+    def _cut_ring(self, points):
+        if not points:
+            return []
+        cuts = [i for i, point in enumerate(points) if point in self.junctions]
+        if not cuts:
+            # Rotate to a canonical start so a ring shared whole is matched
+            start = points.index(min(points))
+            ring = points[start:] + points[:start]
+            return [self._arc(ring + [ring[0]])]
+        start = cuts[0]
+        ring = points[start:] + points[:start] + [points[start]]
+        return self._cut(ring, [i - start for i in cuts] + [len(points)])
+
+    def _cut_line(self, points):
+        cuts = [i for i, point in enumerate(points) if point in self.junctions]
+        return self._cut(points, cuts)
+
+    def _cut(self, points, cuts):
+        indexes = []
+        for begin, end in zip(cuts, cuts[1:]):
+            indexes.append(self._arc(points[begin:end + 1]))
+        if not indexes and points:
+            indexes.append(self._arc(points))
+        return indexes
+
+    def _arc(self, points):
+        key = tuple(points)
+        if key in self.arc_index:
+            return self.arc_index[key]
+        reverse = key[::-1]
+        if reverse in self.arc_index:
+            return ~self.arc_index[reverse]
+        self.arc_index[key] = len(self.arcs)
+        self.arcs.append(points)
+        return self.arc_index[key]
+
+
+def _dedupe(points):
+    deduped = []
+    for point in points:
+        if not deduped or deduped[-1] != point:
+            deduped.append(point)
+    return deduped
+
+
+def _delta_encode(points):
+    encoded = []
+    x = y = 0
+    for px, py in points:
+        encoded.append([px - x, py - y])
+        x, y = px, py
+    return encoded
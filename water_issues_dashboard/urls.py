@@ -6,7 +6,9 @@ app_name = 'water_issues_dashboard'
 urlpatterns = [
     path('', views.dashboard_home, name='home'),
     path('api/geojson/', views.api_geojson_data, name='api_geojson'),
+    path('api/geojson/changes/', views.api_geojson_changes, name='api_geojson_changes'),
     path('api/search/', views.api_search, name='api_search'),
+    path('api/stream/', views.api_stream, name='api_stream'),
     path('upload/', views.upload_incidents, name='upload'),
     path('report/', views.report_incident_view, name='report_incident'),
 ]
\ No newline at end of file
@@ -1,13 +1,27 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Sum
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from .models import Municipality, Park, Incident, UploadedFile
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Municipality, Park, Incident, UploadedFile, DeletedFeature
 from .forms import IncidentUploadForm, IncidentReportForm
+from .cache import geojson_cache, search_cache, metrics_cache
+from .topojson import encode_topology, DEFAULT_QUANTIZATION
+from monitoring.http import JsonResponse
+from monitoring.metrics import timed
+from monitoring.prometheus import Counter, Histogram, SIZE_BUCKETS
+from recap import compression
+from recap.transactions import atomic
 import json
 import os
-from datetime import datetime
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
 
 @login_required
 def dashboard_home(request):
@@ -82,20 +96,40 @@ def dashboard_home(request):
     # Get parks if needed
     parks = Park.objects.all() if show_parks else Park.objects.none()
 
+    def compute_metrics():
+        # One query, grouped the way the (incident_type, status) index is ordered
+        type_counts, status_counts = defaultdict(int), defaultdict(int)
+        for incident_type, status, count in (
+            incidents.values_list('incident_type', 'status').annotate(count=Count('id')).order_by()
+        ):
+            type_counts[incident_type] += count
+            status_counts[status] += count
+        return {
+            'municipality_count': municipalities.count(),
+            'total_population': municipalities.aggregate(total=Sum('population_2021'))['total'] or 0,
+            'incident_count': sum(type_counts.values()),
+            'flood_count': type_counts.get('flood', 0),
+            'drought_count': type_counts.get('drought', 0),
+            'algal_bloom_count': type_counts.get('algal bloom', 0),
+            'contaminated_water_count': type_counts.get('contaminated water', 0),
+            'hydroelectric_disruption_count': type_counts.get('hydroelectric disruption', 0),
+            'invasive_species_count': type_counts.get('invasive species', 0),
+            'declining_fish_population_count': type_counts.get('declining fish population', 0),
+            'confirmed_count': status_counts.get('confirmed', 0),
+            'suspected_count': status_counts.get('suspected', 0),
+            'park_count': parks.count(),
+        }
+
+    metrics = metrics_cache.get_or_compute(
+        [status_filters, pop_min, pop_max, incident_types, incident_statuses, show_parks],
+        compute_metrics
+    )
+
     context = {
         'municipalities': municipalities,
         'incidents': incidents,
         'parks': parks,
-        'municipality_count': municipalities.count(),
-        'total_population': sum(m.population_2021 for m in municipalities),
-        'flood_count': incidents.filter(incident_type='flood').count(),
-        'drought_count': incidents.filter(incident_type='drought').count(),
-        'algal_bloom_count': incidents.filter(incident_type='algal bloom').count(),
-        'contaminated_water_count': incidents.filter(incident_type='contaminated water').count(),
-        'hydroelectric_disruption_count': incidents.filter(incident_type='hydroelectric disruption').count(),
-        'invasive_species_count': incidents.filter(incident_type='invasive species').count(),
-        'declining_fish_population_count': incidents.filter(incident_type='declining fish population').count(),
-        'park_count': parks.count(),
+        **metrics,
         'filters': {
             'status': status_filters,
             'pop_min': pop_min,
@@ -107,76 +141,207 @@ def dashboard_home(request):
 
     return render(request, 'water_issues_dashboard/dashboard.html', context)
 
-@login_required
-def api_geojson_data(request):
-    """API endpoint to return GeoJSON data for the map"""
-    data_type = request.GET.get('type', 'all')
+def municipality_feature(muni):
+    """Serialize a Municipality as a GeoJSON feature"""
+    return {
+        'type': 'Feature',
+        'id': muni.id,
+        'geometry': muni.geometry,
+        'properties': {
+            'name': muni.name,
+            'status': muni.status,
+            'population_2021': muni.population_2021,
+            **muni.properties
+        }
+    }
 
-    response_data = {
-        'municipalities': {
-            'type': 'FeatureCollection',
-            'features': []
-        },
-        'incidents': {
-            'type': 'FeatureCollection',
-            'features': []
-        },
-        'parks': {
-            'type': 'FeatureCollection',
-            'features': []
+def incident_feature(incident):
+    """Serialize an Incident as a GeoJSON feature"""
+    return {
+        'type': 'Feature',
+        'id': incident.id,
+        'geometry': incident.geometry,
+        'properties': {
+            'id': incident.id,
+            'name': incident.name,
+            'type': incident.incident_type,
+            'status': incident.status,
+            'started_at': incident.started_at.isoformat() if incident.started_at else None,
+            'description': incident.description,
+            'discussion': discussion_summary(incident),
+            **incident.properties
         }
     }
 
-    if data_type in ['all', 'municipalities']:
-        for muni in Municipality.objects.all():
-            feature = {
-                'type': 'Feature',
-                'geometry': muni.geometry,
-                'properties': {
-                    'name': muni.name,
-                    'status': muni.status,
-                    'population_2021': muni.population_2021,
-                    **muni.properties
-                }
-            }
-            response_data['municipalities']['features'].append(feature)
-
-    if data_type in ['all', 'incidents']:
-        for incident in Incident.objects.all():
-            feature = {
-                'type': 'Feature',
-                'geometry': incident.geometry,
-                'properties': {
-                    'id': incident.id,
-                    'name': incident.name,
-                    'type': incident.incident_type,
-                    'status': incident.status,
-                    'started_at': incident.started_at.isoformat() if incident.started_at else None,
-                    'description': incident.description,
-                    **incident.properties
-                }
-            }
-            response_data['incidents']['features'].append(feature)
-
-    if data_type in ['all', 'parks']:
-        for park in Park.objects.all():
-            feature = {
-                'type': 'Feature',
-                'geometry': park.geometry,
-                'properties': {
-                    'NAME_E': park.name,
-                    'LOC_E': park.location,
-                    'MGMT_E': park.management,
-                    'OWNER_E': park.owner,
-                    'PRK_CLSS': park.park_class,
-                    'URL': park.url,
-                    **park.properties
-                }
-            }
-            response_data['parks']['features'].append(feature)
+def discussion_summary(incident):
+    """Post, comment and like counts of an incident's discussion, if they were loaded with it
+
+    Querysets of features select_related('activity'). The counts can be up
+    to a cache timeout older than the discussion, as the cached map data
+    isn't dropped for every post, comment and like.
+    """
+    if not Incident.activity.is_cached(incident):
+        return None
+    try:
+        return incident.activity.as_dict()
+    except ObjectDoesNotExist:
+        return None
+
+def park_feature(park):
+    """Serialize a Park as a GeoJSON feature"""
+    return {
+        'type': 'Feature',
+        'id': park.id,
+        'geometry': park.geometry,
+        'properties': {
+            'NAME_E': park.name,
+            'LOC_E': park.location,
+            'MGMT_E': park.management,
+            'OWNER_E': park.owner,
+            'PRK_CLSS': park.park_class,
+            'URL': park.url,
+            **park.properties
+        }
+    }
+
+# Map layers served by the GeoJSON APIs, with their model and serializer
+MAP_LAYERS = [
+    ('municipalities', Municipality, municipality_feature),
+    ('incidents', Incident, incident_feature),
+    ('parks', Park, park_feature),
+]
+# Relations each layer's serializer reads
+LAYER_RELATIONS = {'incidents': ['activity']}
+
+# Rows saved just before a sync token was issued may commit after it was
+# read, so each delta sync re-checks a short window before its token.
+SYNC_TOKEN_OVERLAP = timedelta(seconds=5)
+
+def parse_sync_token(token):
+    """Return the datetime encoded in a sync token, or None if it is invalid"""
+    try:
+        since = parse_datetime(token)
+    except ValueError:
+        return None
+    if since is None or timezone.is_naive(since):
+        return None
+    return since
+
+# Compact separators keep large coordinate payloads smaller on the wire
+COMPACT_JSON = {'separators': (',', ':')}
+
+# Exported at /metrics
+GEOJSON_PAYLOAD_BYTES = Histogram(
+    'geojson_payload_bytes', 'Size of map data responses', ['type', 'format'], buckets=SIZE_BUCKETS
+)
+UPLOAD_BYTES = Histogram('geojson_upload_bytes', 'Size of uploaded GeoJSON files', buckets=SIZE_BUCKETS)
+UPLOAD_DURATION = Histogram('geojson_upload_duration_seconds', 'Time to import an uploaded GeoJSON file')
+UPLOADED_FEATURES = Counter('geojson_uploaded_features', 'Features in imported GeoJSON files', ['result'])
+SEARCH_DURATION = Histogram('search_duration_seconds', 'Time to answer a search, cached or not')
+
+def geojson_data(params):
+    """Build the map layers requested by the GeoJSON API's query parameters
+
+    With format=topojson the layers are returned as a single TopoJSON
+    topology, quantized to the optional quantization parameter.
+    """
+    data_type = params.get('type', 'all')
+
+    response_data = {'sync_token': timezone.now().isoformat()}
+    for layer, model, serialize in MAP_LAYERS:
+        features = []
+        if data_type in ['all', layer]:
+            features = [serialize(obj) for obj in model.objects.select_related(*LAYER_RELATIONS.get(layer, []))]
+        response_data[layer] = {
+            'type': 'FeatureCollection',
+            'features': features
+        }
+
+    if params.get('format') == 'topojson':
+        try:
+            quantization = min(max(int(params.get('quantization', DEFAULT_QUANTIZATION)), 1000), 10 ** 8)
+        except ValueError:
+            quantization = DEFAULT_QUANTIZATION
+        sync_token = response_data.pop('sync_token')
+        response_data = encode_topology(response_data, quantization)
+        response_data['sync_token'] = sync_token
+
+    return response_data
+
+def geojson_content(params, encoding=None):
+    """The serialized geojson_data response, cached until the map data changes
+
+    Given an encoding from recap.compression, the content is compressed
+    with it, once per data version, and cached too. Returns the content
+    and the encoding used, which is None for content too small to compress.
+    """
+    key = [params.get('type', 'all'), params.get('format'), params.get('quantization')]
+
+    def serialize():
+        data = geojson_data(params)
+        with timed('json'):
+            return json.dumps(data, cls=DjangoJSONEncoder, **COMPACT_JSON).encode()
+
+    # The compressed copy is cached under the version the content was read
+    # at, not one an invalidation in between may have bumped
+    version = geojson_cache.version()
+    content = geojson_cache.get_or_compute(key, serialize, version=version)
+    # Labelled only with values geojson_data understands, so clients can't
+    # create new series at will
+    data_type = key[0] if key[0] in ['all'] + [layer for layer, _, _ in MAP_LAYERS] else 'other'
+    data_format = 'topojson' if key[1] == 'topojson' else 'geojson'
+    GEOJSON_PAYLOAD_BYTES.labels(type=data_type, format=data_format).observe(len(content))
+
+    if encoding is None or len(content) < compression.MIN_SIZE:
+        return content, None
+    compressed = geojson_cache.get_or_compute(
+        key + [encoding], lambda: compression.compress(content, encoding), version=version,
+    )
+    return compressed, encoding
+
+@login_required
+def api_geojson_data(request):
+    """API endpoint to return GeoJSON or TopoJSON data for the map"""
+    encoding = compression.preferred_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    content, encoding = geojson_content(request.GET, encoding)
+    return compression.encoded_response(content, 'application/json', encoding)
+
+@login_required
+def api_geojson_changes(request):
+    """API endpoint to return map features added, changed or removed since a sync token"""
+    since = parse_sync_token(request.GET.get('since', ''))
+    if since is None:
+        return JsonResponse({'error': 'Invalid or missing sync token'}, status=400)
+
+    data_type = request.GET.get('type', 'all')
+    since -= SYNC_TOKEN_OVERLAP
+
+    response_data = {'sync_token': timezone.now().isoformat()}
+    for layer, model, serialize in MAP_LAYERS:
+        changed = []
+        deleted = []
+        if data_type in ['all', layer]:
+            changed = [
+                serialize(obj)
+                for obj in model.objects.select_related(*LAYER_RELATIONS.get(layer, [])).filter(updated_at__gte=since)
+            ]
+            deleted = list(DeletedFeature.objects.filter(
+                layer=layer,
+                deleted_at__gte=since
+            ).values_list('object_id', flat=True))
+        response_data[layer] = {
+            'changed': changed,
+            'deleted': deleted
+        }
 
     return JsonResponse(response_data)
 
+@login_required
+def api_stream(request):
+    """Fallback for the live update stream, which is served by recap/asgi.py"""
+    # Under WSGI a 204 tells the browser's EventSource not to reconnect
+    return HttpResponse(status=204)
+
 
 @login_required
 def upload_incidents(request):
@@ -213,7 +378,9 @@ def upload_incidents(request):
 
 def process_geojson_file(uploaded_file):
     """Process uploaded GeoJSON file and create incidents"""
+    start = time.perf_counter()
     with open(uploaded_file.file.path, 'r') as f:
+        UPLOAD_BYTES.observe(os.fstat(f.fileno()).st_size)
         data = json.load(f)
 
     if data.get('type') != 'FeatureCollection' or 'features' not in data:
@@ -222,49 +389,50 @@ def process_geojson_file(uploaded_file):
     added = 0
     duplicates = 0
 
-    for feature in data['features']:
-        props = feature.get('properties', {})
-        name = props.get('name', '').strip()
-        incident_type = props.get('type', '').strip().lower()
-
-        # Simple duplicate check
-        if Incident.objects.filter(name=name, incident_type=incident_type).exists():
-            duplicates += 1
-            continue
-
-        # Create new incident
-        incident = Incident(
-            name=name,
-            incident_type=incident_type,
-            status=props.get('status', 'suspected'),
-            description=props.get('description', ''),
-            geometry=feature.get('geometry', {}),
-            properties=props,
-            uploaded_by=uploaded_file.uploaded_by
-        )
-
-        # Parse date if provided, handling full ISO 8601 timestamps
-        if props.get('started_at'):
-            try:
-                # Extract just the date part (e.g., '2025-08-21') from the timestamp
-                date_string = props['started_at'].split('T')[0]
-                incident.started_at = datetime.strptime(date_string, '%Y-%m-%d').date()
-            except (ValueError, TypeError, IndexError):
-                # Silently pass if the date format is invalid or can't be split
-                pass
+    # One transaction per file: a single commit to sync, and no half-imported
+    # files if a feature fails
+    with atomic(immediate=True):
+        for feature in data['features']:
+            props = feature.get('properties', {})
+            name = props.get('name', '').strip()
+            incident_type = props.get('type', '').strip().lower()
+
+            # Simple duplicate check
+            if Incident.objects.filter(name=name, incident_type=incident_type).exists():
+                duplicates += 1
+                continue
+
+            # Create new incident
+            incident = Incident(
+                name=name,
+                incident_type=incident_type,
+                status=props.get('status', 'suspected'),
+                description=props.get('description', ''),
+                geometry=feature.get('geometry', {}),
+                properties=props,
+                uploaded_by=uploaded_file.uploaded_by
+            )
+
+            # Parse date if provided, handling full ISO 8601 timestamps
+            if props.get('started_at'):
+                try:
+                    # Extract just the date part (e.g., '2025-08-21') from the timestamp
+                    date_string = props['started_at'].split('T')[0]
+                    incident.started_at = datetime.strptime(date_string, '%Y-%m-%d').date()
+                except (ValueError, TypeError, IndexError):
+                    # Silently pass if the date format is invalid or can't be split
+                    pass
 
-        incident.save()
-        added += 1
+            incident.save()
+            added += 1
 
+    UPLOADED_FEATURES.labels(result='added').inc(added)
+    UPLOADED_FEATURES.labels(result='duplicate').inc(duplicates)
+    UPLOAD_DURATION.observe(time.perf_counter() - start)
     return {'added': added, 'duplicates': duplicates}
 
-@login_required
-def api_search(request):
-    """API endpoint for search functionality"""
-    query = request.GET.get('q', '').lower().strip()
-    if not query:
-        return JsonResponse({'results': []})
-
+def search_results(query):
+    """Find municipalities, parks and incidents whose name contains the query"""
     results = []
 
     # Search municipalities
@@ -294,7 +462,21 @@ def api_search(request):
             'geometry': incident.geometry
         })
 
-    return JsonResponse({'results': results})
+    return results
+
+def cached_search_results(query):
+    """search_results, cached until the map data changes"""
+    with SEARCH_DURATION.time():
+        return search_cache.get_or_compute([query], lambda: search_results(query))
+
+@login_required
+def api_search(request):
+    """API endpoint for search functionality"""
+    query = request.GET.get('q', '').lower().strip()
+    if not query:
+        return JsonResponse({'results': []})
+
+    return JsonResponse({'results': cached_search_results(query)})
 
 
 @login_required
@@ -304,12 +486,6 @@ def report_incident_view(request):
         if form.is_valid():
             incident = form.save(commit=False)
             incident.uploaded_by = request.user
-            
-            # The geometry is received as a string, so we need to parse it
-            geometry_str = request.POST.get('geometry')
-            if geometry_str:
-                incident.geometry = json.loads(geometry_str)
-
             incident.save()
             messages.success(request, 'Incident reported successfully!')
             return redirect('water_issues_dashboard:home')
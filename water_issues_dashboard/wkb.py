@@ -0,0 +1,163 @@
+"""
+Well-known binary (WKB) encoding for GeoJSON geometries.
+
+Geometries are written little-endian in the ISO flavour of WKB, with the
+Z variants (type + 1000) used when positions carry an altitude. Runs of
+coordinates are packed and unpacked in bulk through array('d'), so
+decoding a polygon costs one copy per ring rather than parsing every
+number as text.
+"""
+import struct
+import sys
+from array import array
+
+GEOMETRY_TYPES = {
+    'Point': 1,
+    'LineString': 2,
+    'Polygon': 3,
+    'MultiPoint': 4,
+    'MultiLineString': 5,
+    'MultiPolygon': 6,
+    'GeometryCollection': 7,
+}
+GEOMETRY_NAMES = {code: name for name, code in GEOMETRY_TYPES.items()}
+Z_OFFSET = 1000
+
+LITTLE_ENDIAN = 1
+_UINT32 = {0: struct.Struct('>I'), 1: struct.Struct('<I')}
+_HEADER = struct.Struct('<BI')
+
+
+def dumps(geometry):
+    """Encode a GeoJSON geometry dict as WKB bytes"""
+    out = bytearray()
+    _write(out, geometry)
+    return bytes(out)
+
+
+def loads(data):
+    """Decode WKB bytes into a GeoJSON geometry dict"""
+    geometry, offset = _read(memoryview(data), 0)
+    if offset != len(data):
+        raise ValueError('Trailing bytes after WKB geometry')
+    return geometry
+
+
+def _dimensions(geometry):
+    coordinates = geometry.get('coordinates')
+    while isinstance(coordinates, list) and coordinates and isinstance(coordinates[0], list):
+        coordinates = coordinates[0]
+    return 3 if isinstance(coordinates, list) and len(coordinates) > 2 else 2
+
+
+def _write(out, geometry):
+    if not isinstance(geometry, dict):
+        raise ValueError('Geometry must be a GeoJSON object')
+    geometry_type = geometry.get('type')
+    if geometry_type not in GEOMETRY_TYPES:
+        raise ValueError(f'Unsupported geometry type: {geometry_type!r}')
+
+    if geometry_type == 'GeometryCollection':
+        members = geometry.get('geometries')
+        if not isinstance(members, list):
+            raise ValueError('GeometryCollection needs a list of geometries')
+        out += _HEADER.pack(LITTLE_ENDIAN, GEOMETRY_TYPES[geometry_type])
+        out += _UINT32[1].pack(len(members))
+        for member in members:
+            _write(out, member)
+        return
+
+    dims = _dimensions(geometry)
+    coordinates = geometry.get('coordinates')
+    if not isinstance(coordinates, list):
+        raise ValueError(f'{geometry_type} needs a coordinates array')
+    code = GEOMETRY_TYPES[geometry_type] + (Z_OFFSET if dims == 3 else 0)
+    out += _HEADER.pack(LITTLE_ENDIAN, code)
+
+    if geometry_type == 'Point':
+        _write_positions(out, [coordinates], dims, counted=False)
+    elif geometry_type == 'LineString':
+        _write_positions(out, coordinates, dims)
+    elif geometry_type == 'Polygon':
+        _write_rings(out, coordinates, dims)
+    else:
+        # Multi* geometries hold a full WKB geometry per member
+        member_type = geometry_type[len('Multi'):]
+        out += _UINT32[1].pack(len(coordinates))
+        for member in coordinates:
+            _write(out, {'type': member_type, 'coordinates': member})
+
+
+def _write_rings(out, rings, dims):
+    if not isinstance(rings, list):
+        raise ValueError('Polygon coordinates must be a list of rings')
+    out += _UINT32[1].pack(len(rings))
+    for ring in rings:
+        _write_positions(out, ring, dims)
+
+
+def _write_positions(out, positions, dims, counted=True):
+    try:
+        values = array('d', [value for position in positions for value in position[:dims]])
+    except TypeError:
+        raise ValueError('Positions must be arrays of numbers')
+    if len(values) != len(positions) * dims:
+        raise ValueError(f'Every position needs {dims} coordinates')
+    if sys.byteorder != 'little':
+        values.byteswap()
+    if counted:
+        out += _UINT32[1].pack(len(positions))
+    out += values.tobytes()
+
+
+def _read(data, offset):
+    if offset + _HEADER.size > len(data):
+        raise ValueError('Truncated WKB geometry')
+    byte_order = data[offset]
+    if byte_order not in _UINT32:
+        raise ValueError('Invalid WKB byte order')
+    uint32 = _UINT32[byte_order]
+    code = uint32.unpack_from(data, offset + 1)[0]
+    offset += _HEADER.size
+
+    dims = 3 if code > Z_OFFSET else 2
+    geometry_type = GEOMETRY_NAMES.get(code % Z_OFFSET if code > Z_OFFSET else code)
+    if geometry_type is None:
+        raise ValueError(f'Unsupported WKB geometry type: {code}')
+
+    def read_count():
+        nonlocal offset
+        if offset + uint32.size > len(data):
+            raise ValueError('Truncated WKB geometry')
+        count = uint32.unpack_from(data, offset)[0]
+        offset += uint32.size
+        return count
+
+    def read_positions(count):
+        nonlocal offset
+        end = offset + count * dims * 8
+        if end > len(data):
+            raise ValueError('Truncated WKB geometry')
+        values = array('d')
+        values.frombytes(data[offset:end])
+        if (byte_order == LITTLE_ENDIAN) != (sys.byteorder == 'little'):
+            values.byteswap()
+        offset = end
+        values = values.tolist()
+        return list(map(list, zip(*(values[i::dims] for i in range(dims)))))
+
+    if geometry_type == 'Point':
+        return {'type': 'Point', 'coordinates': read_positions(1)[0]}, offset
+    if geometry_type == 'LineString':
+        return {'type': 'LineString', 'coordinates': read_positions(read_count())}, offset
+    if geometry_type == 'Polygon':
+        rings = [read_positions(read_count()) for _ in range(read_count())]
+        return {'type': 'Polygon', 'coordinates': rings}, offset
+
+    members = []
+    for _ in range(read_count()):
+        member, offset = _read(data, offset)
+        members.append(member)
+    if geometry_type == 'GeometryCollection':
+        return {'type': 'GeometryCollection', 'geometries': members}, offset
+    return {'type': geometry_type, 'coordinates': [m['coordinates'] for m in members]}, offset